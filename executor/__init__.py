@@ -2,6 +2,8 @@ from .local_load_generator import LocalLoadGenerator
 from .web_load_generator import WebLoadGenerator
 from .service_load_generator import ServiceLoadGenerator, StressLoadGenerator
 from .workers_pool import WorkersPool, WarmupWorkersPool
+from .async_workers_pool import AsyncWorkersPool
+from .sharded_workers_pool import ShardedWorkersPool
 from .main_loop import MainLoop
 from .test import Test
 from .result import Result, StressResult, ServiceResult
@@ -0,0 +1,174 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from bl.log import getLogger
+from bl.settings import Settings
+
+from .result import ReportType
+
+log = getLogger(__name__)
+
+
+class ActionSummary:
+    """
+    Compact state of finished action which is kept instead of Test with its Result and logs
+    """
+    def __init__(self, test):
+        result = test.result
+        self.run_id = test.run_id
+        self.testcase_id = test.testcase_id
+        self.status = result.get_result().console_format if result else None
+        self.result = result.get_result().report_format if result else None
+        # cancelled tests have ResultSummary without reports
+        has_reports = hasattr(result, '_report_file_name')
+        self.report_path = result._report_file_name(report_type=ReportType.XML) if has_reports else None
+        self.html_report_path = result._report_file_name(report_type=ReportType.HTML) if has_reports else None
+        self.report_saved = getattr(result, 'report_saved', None)  # reports could be written by ReportPipeline later
+        start_time = getattr(result, 'start_time', None)
+        self.start_time = start_time.isoformat() if start_time else None
+        self.duration = test.duration
+        self.finished = time.monotonic()
+
+    def footprint(self):
+        """
+        Approximate size of summary in bytes
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.__dict__) + sum(sys.getsizeof(value) for value in self.__dict__.values())
+
+
+class ActionRegistry:
+    """
+    Registry of service mode actions bounded by size and TTL.
+    Finished actions are compacted to ActionSummary and evicted after ttl seconds or when registry
+    holds more than max_size actions (oldest finished first). Ids of evicted actions are remembered
+    (only ids, up to evicted_size), so clients could tell evicted action from unknown one
+    """
+    def __init__(self, max_size=None, ttl=None, evicted_size=None):
+        self.max_size = max_size or Settings.get('action_registry_size', with_type=int, default=10000)
+        self.ttl = ttl or Settings.get('action_registry_ttl', with_type=float, default=3600)
+        self.evicted_size = evicted_size or 10 * self.max_size
+        self._lock = threading.Lock()
+        self._watchers = {}  # run_id -> [Condition, count of waiting threads]
+        self._waiters_count = 0
+        self._actions = OrderedDict()  # run_id -> Test or ActionSummary
+        self._finished = OrderedDict()  # run_ids of finished actions in finish order
+        self._evicted = OrderedDict()
+        self._evicted_count = 0
+
+    def add(self, test):
+        with self._lock:
+            self._actions[test.run_id] = test
+            self._evict()
+
+    def on_finished(self, test):
+        """
+        Compact finished test to summary. Should be set as on_finished callback of test
+        """
+        summary = ActionSummary(test)
+        with self._lock:
+            if test.run_id not in self._actions:
+                return
+            self._actions[test.run_id] = summary
+            self._finished[test.run_id] = None
+            self._notify(test.run_id)
+            self._evict()
+
+    def notify(self, test):
+        """
+        Wake up threads waiting for changes of test. Should be set as on_started and on_step callback of test
+        """
+        with self._lock:
+            self._notify(test.run_id)
+
+    def _notify(self, run_id):
+        watcher = self._watchers.get(run_id)
+        if watcher:
+            watcher[0].notify_all()
+
+    def wait(self, run_id, predicate, timeout, counted=True):
+        """
+        Wait until predicate(action) is true, action is unknown(evicted) or timeout expires.
+        Return action(Test or ActionSummary) or None
+        :param counted: count caller in waiters_count, False for clients counted by add_waiter
+        """
+        deadline = time.monotonic() + timeout
+        counted = 1 if counted else 0
+        with self._lock:
+            watcher = self._watchers.setdefault(run_id, [threading.Condition(self._lock), 0])
+            watcher[1] += 1
+            self._waiters_count += counted
+            try:
+                while True:
+                    action = self._actions.get(run_id)
+                    remaining = deadline - time.monotonic()
+                    if action is None or predicate(action) or remaining <= 0:
+                        return action
+                    watcher[0].wait(remaining)
+            finally:
+                self._waiters_count -= counted
+                watcher[1] -= 1
+                if not watcher[1]:
+                    del self._watchers[run_id]
+
+    def add_waiter(self):
+        """
+        Count client which waits for actions between calls of wait, e.g. open event stream
+        """
+        with self._lock:
+            self._waiters_count += 1
+
+    def remove_waiter(self):
+        with self._lock:
+            self._waiters_count -= 1
+
+    @property
+    def waiters_count(self):
+        return self._waiters_count
+
+    def get(self, run_id):
+        """
+        Return Test of active action, ActionSummary of finished one or None
+        """
+        with self._lock:
+            self._evict()
+            return self._actions.get(run_id)
+
+    def is_evicted(self, run_id):
+        with self._lock:
+            return run_id in self._evicted
+
+    def _evict(self):
+        expired = time.monotonic() - self.ttl
+        while self._finished:
+            run_id = next(iter(self._finished))
+            if len(self._actions) <= self.max_size and self._actions[run_id].finished > expired:
+                break
+            del self._finished[run_id]
+            del self._actions[run_id]
+            self._evicted[run_id] = None
+            self._evicted_count += 1
+        while len(self._evicted) > self.evicted_size:
+            self._evicted.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._actions)
+
+    def get_metrics(self):
+        with self._lock:
+            self._evict()
+            summaries_bytes = sum(self._actions[run_id].footprint() for run_id in self._finished)
+            index_bytes = sys.getsizeof(self._actions) + sys.getsizeof(self._finished) + sys.getsizeof(self._evicted) + \
+                sum(sys.getsizeof(run_id) for run_id in self._evicted)
+            return dict(size=len(self._actions),
+                        max_size=self.max_size,
+                        ttl=self.ttl,
+                        active=len(self._actions) - len(self._finished),
+                        finished=len(self._finished),
+                        evicted=self._evicted_count,
+                        evicted_ids=len(self._evicted),
+                        waiters=self._waiters_count,
+                        summaries_bytes=summaries_bytes,
+                        index_bytes=index_bytes)
@@ -0,0 +1,239 @@
+import asyncio
+import collections
+import concurrent.futures
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bl.log import getLogger
+from bl.settings import Settings
+
+from .cpu_monitor import CPUMonitor
+
+log = getLogger(__name__)
+
+
+class _EventLoop:
+    """
+    Event loop running in its own thread together with event which wakes its slots up when tasks are pushed
+    """
+    def __init__(self, index):
+        self.index = index
+        self.loop = asyncio.new_event_loop()
+        self.wakeup = None
+        self.slots_count = 0
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._thread_func, args=(started,), name='AsyncWorkersLoop:%d' % index)
+        self.thread.daemon = True
+        self.thread.start()
+        started.wait()
+
+    def __str__(self):
+        return 'EventLoop[%s]' % self.index
+
+    def _thread_func(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def call(self, func, *args):
+        """
+        Schedule func call in loop thread. Could be called from any thread
+        """
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self):
+        self.call(self.loop.stop)
+        self.thread.join()
+
+
+class _Slot:
+    """
+    Slot is asyncio counterpart of Worker: coroutine which pops and runs tests one by one
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self.stopped = False
+        self.busy = False
+        self.task = None
+
+    def __str__(self):
+        return 'Slot[%s:%s]' % (self.loop.index, id(self))
+
+
+class AsyncWorkersPool:
+    """
+    Pool of asyncio slots which run tests.
+    Each slot is a task on one of event loops. Coroutine testcases are awaited directly in loop,
+    blocking testcases are run in bounded thread executor, so number of concurrent sessions
+    is not limited by number of OS threads.
+    All loops pop tasks from one queue, so task is run by any free slot whatever loop it is on.
+    Reports of coroutine tests are saved in blocking executor, so report I/O does not stall loop
+    """
+    def __init__(self, count=0, loops=None, blocking_threads=None, stop_timeout=60, report_pipeline=None):
+        loops = loops or Settings.get('async_loops', with_type=int, default=1)
+        blocking_threads = blocking_threads or Settings.get('async_blocking_threads', with_type=int, default=10)
+        self.stop_timeout = stop_timeout
+        self.report_pipeline = report_pipeline
+        self.executor = ThreadPoolExecutor(max_workers=blocking_threads, thread_name_prefix='AsyncWorkersPoolBlocking')
+        self.loops = [_EventLoop(index) for index in range(loops)]
+        self.slots = set()
+        self.slots_lock = threading.Lock()
+        self._slots_changed = threading.Condition(self.slots_lock)
+        self.tasks = collections.deque()
+        self.tasks_lock = threading.Lock()
+        self._reports = set()  # futures of reports which are being saved
+        self.cpu_monitor = CPUMonitor()
+        self.set_threads(count)
+
+    def push(self, task, priority=None, tenant=None):
+        # priority and tenant are not used for scheduling
+        with self.tasks_lock:
+            self.tasks.append(task)
+        for loop in self.loops:
+            loop.call(loop.wakeup.set)
+
+    async def pop(self, loop):
+        while True:
+            with self.tasks_lock:
+                if self.tasks:
+                    return self.tasks.popleft()
+                # cleared under lock, so task pushed after check sets it again
+                loop.wakeup.clear()
+            await loop.wakeup.wait()
+
+    def set_threads(self, thread_count):
+        with self.slots_lock:
+            total_count = len(self.slots)
+            create_count = thread_count - total_count
+            new_slots = []
+            for _ in range(create_count):
+                loop = min(self.loops, key=lambda loop: loop.slots_count)
+                loop.slots_count += 1
+                new_slots.append(_Slot(loop))
+            self.slots.update(new_slots)
+
+        if create_count > 0:
+            log.info('AsyncWorkersPool.set_threads Starting new slots count %d(current_count=%d)' % (create_count, total_count))
+            for slot in new_slots:
+                slot.loop.call(self._start_slot, slot)
+        if create_count < 0:
+            self.stop(bottom_count=thread_count)
+
+    def _start_slot(self, slot):
+        slot.task = slot.loop.loop.create_task(self._slot_func(slot))
+        # done callback is used instead of finally, because task cancelled before start never runs its body
+        slot.task.add_done_callback(lambda task: self.on_worker_finished(slot))
+
+    async def _slot_func(self, slot):
+        try:
+            while not slot.stopped:
+                if self.cpu_monitor.overloaded():
+                    await asyncio.sleep(1)
+                    continue
+                test = await self.pop(slot.loop)
+                slot.busy = True
+                try:
+                    log.info('AsyncWorkersPool._slot_func: %s got test %s' % (slot, test))
+                    if test.is_coroutine():
+                        await test.run_async(report_writer=self._save_report)
+                    else:
+                        await slot.loop.loop.run_in_executor(self.executor, test.run)
+                except Exception:
+                    log.exception('AsyncWorkersPool._slot_func: exception', extra={'to_console': True})
+                finally:
+                    slot.busy = False
+        except asyncio.CancelledError:
+            log.info('AsyncWorkersPool._slot_func: %s cancelled' % slot)
+
+    @staticmethod
+    def _cancel(slot, idle_only=True):
+        if slot.task and not (idle_only and slot.busy):
+            slot.task.cancel()
+
+    def stop(self, bottom_count=0):
+        self._stop_slots(bottom_count)
+        if not bottom_count:
+            self.flush_reports()
+
+    def _save_report(self, result):
+        future = self.executor.submit(result.save_report)
+        with self.tasks_lock:
+            self._reports.add(future)
+        future.add_done_callback(self._on_report_saved)
+
+    def _on_report_saved(self, future):
+        with self.tasks_lock:
+            self._reports.discard(future)
+        if future.exception():
+            log.error('AsyncWorkersPool: cant save report', exc_info=future.exception())
+
+    def flush_reports(self):
+        """
+        Wait until reports of finished tests are written
+        """
+        with self.tasks_lock:
+            reports = list(self._reports)
+        concurrent.futures.wait(reports)
+        if self.report_pipeline:
+            self.report_pipeline.flush()
+
+    def _stop_slots(self, bottom_count):
+        with self.slots_lock:
+            running = sorted((slot for slot in self.slots if not slot.stopped), key=lambda slot: slot.busy)
+            slots_to_stop = running[:max(len(running) - bottom_count, 0)]
+            for slot in slots_to_stop:
+                slot.stopped = True
+        if not slots_to_stop:
+            return
+
+        log.info('AsyncWorkersPool.stop stopping %s(current_count=%s) slots' % (len(slots_to_stop), len(running)))
+        for slot in slots_to_stop:
+            slot.loop.call(self._cancel, slot)  # idle slots are cancelled, busy ones exit after current test
+
+        with self._slots_changed:
+            if self._slots_changed.wait_for(lambda: len(self.slots) <= bottom_count, timeout=self.stop_timeout):
+                return
+        log.warn('AsyncWorkersPool.stop %s slots are still busy after %ss, cancelling' % (len(self.slots) - bottom_count,
+                                                                                          self.stop_timeout))
+        for slot in slots_to_stop:
+            slot.loop.call(self._cancel, slot, False)
+
+    def close(self):
+        """
+        Stop event loops, blocking executor and CPU monitoring. Pool could not be used after it
+        """
+        self.stop()
+        for loop in self.loops:
+            loop.stop()
+        self.executor.shutdown(wait=True)
+        self.cpu_monitor.stop()
+
+    def qsize(self):
+        with self.tasks_lock:
+            return len(self.tasks)
+
+    def reset(self):
+        log.info('AsyncWorkersPool.reset Test queue size is %d clearing' % self.qsize())
+        with self.tasks_lock:
+            self.tasks.clear()
+        self.stop()
+
+    def on_worker_finished(self, slot):
+        with self._slots_changed:
+            self.slots.discard(slot)
+            slot.loop.slots_count -= 1
+            slots_left = len(self.slots)
+            self._slots_changed.notify_all()
+        log.info('AsyncWorkersPool.on_worker_finished: %s finished left %s' % (slot, slots_left))
+
+    def workers_count(self):
+        with self.slots_lock:
+            return len(self.slots)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
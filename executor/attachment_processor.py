@@ -0,0 +1,264 @@
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bl.log import getLogger
+from bl.settings import Settings
+
+from .histogram import Histogram
+
+log = getLogger(__name__)
+
+_STOP = object()
+
+
+def encode_wav(path):
+    """
+    Encode wav file to mp3, return path of encoded file
+    """
+    from bl.telco.voice_file import Lame
+    return Lame.encode(input_file_name=path)
+
+
+def compress_pcapng(path):
+    """
+    Gzip packet capture, return path of compressed file
+    """
+    compressed_path = path + '.gzip'
+    with open(path, 'rb') as source, gzip.open(compressed_path, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    return compressed_path
+
+
+def minify_har(path):
+    """
+    Rewrite HTTP archive without indentation, return path of minified file
+    """
+    minified_path = os.path.splitext(path)[0] + '.min.har'
+    with open(path, encoding='utf-8') as source:
+        har = json.load(source)
+    with open(minified_path, 'w', encoding='utf-8') as target:
+        json.dump(har, target, separators=(',', ':'))
+    return minified_path
+
+
+HANDLERS = {'wav': encode_wav, 'pcapng': compress_pcapng, 'har': minify_har}
+
+
+def _run_handler(handler, path):
+    # runs in pool process
+    started = time.monotonic()
+    return handler(path), time.monotonic() - started
+
+
+class AttachmentProcessor:
+    """
+    Post-processes test attachments(encoding, compression) in process pool, so CPU bound work does not stall
+    workers and does not hold GIL. Handlers are chosen by file extension, they should be picklable functions
+    path -> new path. Count of jobs in flight is bounded: when pool can not keep up, process blocks callers.
+    Completion callbacks run in separate thread of processor
+    """
+    def __init__(self, processes=None, queue_size=None, handlers=None):
+        self.processes = processes or Settings.get('attachment_processes', with_type=int, default=2)
+        self.queue_size = queue_size or Settings.get('attachment_queue_size', with_type=int, default=100)
+        if handlers is None:
+            extensions = Settings.get('attachment_handlers', default='wav')
+            handlers = {extension.strip(): HANDLERS[extension.strip()]
+                        for extension in extensions.split(',') if extension.strip()}
+        self.handlers = handlers
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pid = None
+        self._executor = None
+
+    # process pool and threads do not survive fork and could not be pickled, so processor is restarted in another process
+    def __getstate__(self):
+        return dict(processes=self.processes, queue_size=self.queue_size, handlers=self.handlers)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _start(self):
+        # should be called with _lock. Pid is set last, so other threads do not use processor until it is built
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._callbacks = queue.Queue()
+        self._pending_count = 0  # jobs in flight and groups waiting for callback
+        self._submitted_count = 0
+        self._completed_count = 0
+        self._failed_count = 0
+        self._restarts_count = 0
+        self._blocked_count = 0
+        self._blocked_seconds = 0.0
+        self._max_depth = 0
+        self._depth = 0
+        self._process_time = {}
+        self._callbacks_thread = threading.Thread(target=self._callbacks_func, name='AttachmentCallbacks')
+        self._callbacks_thread.daemon = True
+        self._callbacks_thread.start()
+        self._pid = os.getpid()
+
+    def handler(self, path):
+        """
+        Return handler of file or None if file is not processed
+        """
+        return self.handlers.get(os.path.splitext(path)[1].lower().lstrip('.'))
+
+    def process(self, attachments, on_done):
+        """
+        Process attachments in pool. Path of every attachment is replaced with processed file when its job completes,
+        original file is removed. on_done() is called when all jobs complete
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        attachments = list(attachments)
+        left = [len(attachments)]
+        with self._lock:
+            self._pending_count += 1  # group is pending until on_done is called
+
+        def on_job_done(attachment, path):
+            attachment.processed(path)
+            with self._lock:
+                left[0] -= 1
+                if left[0]:
+                    return
+            self._callbacks.put(on_done)
+
+        if not attachments:
+            self._callbacks.put(on_done)
+        for attachment in attachments:
+            self._submit(attachment, on_job_done)
+
+    def _submit(self, attachment, on_job_done):
+        if not self._slots.acquire(blocking=False):
+            started = time.monotonic()
+            self._slots.acquire()
+            with self._lock:
+                self._blocked_count += 1
+                self._blocked_seconds += time.monotonic() - started
+        with self._lock:
+            self._pending_count += 1
+            self._submitted_count += 1
+            self._depth += 1
+            self._max_depth = max(self._max_depth, self._depth)
+        extension = os.path.splitext(attachment.path)[1].lower().lstrip('.')
+        path = attachment.path
+
+        def finish(processed_path, seconds=None):
+            # slot is released and job is counted once whatever way job ends, original file is kept on failure
+            with self._lock:
+                self._depth -= 1
+                if seconds is None:
+                    self._failed_count += 1
+                else:
+                    self._completed_count += 1
+                    self._process_time.setdefault(extension, Histogram()).record(seconds)
+            self._slots.release()
+            try:
+                on_job_done(attachment, processed_path)
+            finally:
+                self._job_finished()
+
+        def on_future_done(future):
+            try:
+                processed_path, seconds = future.result()
+            except Exception as e:
+                log.exception('AttachmentProcessor: cant process %s' % path)
+                if isinstance(e, BrokenProcessPool):
+                    self._restart_executor(executor)
+                finish(path)
+                return
+            finish(processed_path, seconds)
+
+        try:
+            executor = self._executor
+            try:
+                future = executor.submit(_run_handler, self.handler(path), path)
+            except BrokenProcessPool:  # pool process died while previous job was processed
+                executor = self._restart_executor(executor)
+                future = executor.submit(_run_handler, self.handler(path), path)
+        except Exception:
+            log.exception('AttachmentProcessor: cant submit %s' % path)
+            finish(path)
+            return
+        future.add_done_callback(on_future_done)
+
+    def _restart_executor(self, broken):
+        """
+        Replace broken pool with new one, return current pool
+        """
+        with self._lock:
+            if self._executor is broken:
+                log.warning('AttachmentProcessor: process pool is broken, starting new one')
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+                self._restarts_count += 1
+            executor = self._executor
+        broken.shutdown(wait=False)
+        return executor
+
+    def _job_finished(self):
+        with self._idle:
+            self._pending_count -= 1
+            if not self._pending_count:
+                self._idle.notify_all()
+
+    def _callbacks_func(self):
+        while True:
+            callback = self._callbacks.get()
+            if callback is _STOP:
+                return
+            try:
+                callback()
+            except Exception:
+                log.exception('AttachmentProcessor: exception in callback')
+            finally:
+                self._job_finished()
+
+    def flush(self):
+        """
+        Wait until all submitted attachments are processed and their callbacks are called
+        """
+        if self._pid != os.getpid():
+            return
+        log.info('AttachmentProcessor.flush %d jobs in flight' % self._depth)
+        with self._idle:
+            self._idle.wait_for(lambda: not self._pending_count)
+
+    def stop(self):
+        if self._pid != os.getpid():
+            return
+        self.flush()
+        self._callbacks.put(_STOP)
+        self._callbacks_thread.join()
+        self._executor.shutdown()
+        self._pid = None  # processor is started again on next process
+
+    def get_metrics(self):
+        if self._pid != os.getpid():
+            return None
+        with self._lock:
+            return dict(queue_depth=self._depth,
+                        max_queue_depth=self._max_depth,
+                        queue_size=self.queue_size,
+                        submitted=self._submitted_count,
+                        completed=self._completed_count,
+                        failed=self._failed_count,
+                        pool_restarts=self._restarts_count,
+                        blocked=self._blocked_count,
+                        blocked_seconds=self._blocked_seconds,
+                        process_time={extension: histogram.summary()
+                                      for extension, histogram in sorted(self._process_time.items())})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
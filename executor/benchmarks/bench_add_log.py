@@ -0,0 +1,77 @@
+"""
+Per log line cost of Result.add_log: formatting both XML text and HTML tree on every line
+versus keeping raw entries in LogStore and rendering them when report is written.
+Every variant runs in separate process, because peak RSS never goes down.
+
+Usage: python -m bl.executor.benchmarks.bench_add_log [lines] [message_size]
+"""
+import datetime
+import multiprocessing
+import resource
+import sys
+import time
+
+from bl.executor.html_report import HtmlReport
+from bl.executor.log_store import LogStore
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class _EagerLog:
+    """
+    Former Result.add_log: text line and HTML entry are formatted for every line
+    """
+    def __init__(self):
+        self.log = []
+        self.html_report = HtmlReport()
+
+    def write_log(self, module_name, level, message):
+        self.log.append('%s [%-25.25s] %s - %s\n' % (datetime.datetime.now().strftime('%H:%M:%S.%f')[:-3],
+                                                     module_name,
+                                                     level,
+                                                     message.replace('\n',
+                                                                     '\n                                                ')))
+        self.html_report.write_log(module_name=module_name, level=level, message=message)
+
+    def render(self):
+        return ''.join(self.log), self.html_report
+
+
+class _LazyLog(LogStore):
+
+    def render(self):
+        return self.text(), self.replay(HtmlReport())
+
+
+def _run(log_class, lines, message_size, results):
+    message = 'x' * message_size
+    baseline = _peak_rss_mb()
+    logs = log_class()
+    started = time.perf_counter()
+    for _ in range(lines):
+        logs.write_log(module_name='bench', level='INFO', message=message)
+    write_seconds = time.perf_counter() - started
+    rss = _peak_rss_mb() - baseline
+    started = time.perf_counter()
+    logs.render()
+    render_seconds = time.perf_counter() - started
+    results.put((log_class.__name__, write_seconds / lines * 1e6, rss, render_seconds))
+
+
+def main(lines=200000, message_size=100):
+    results = multiprocessing.Queue()
+    print('lines=%d message_size=%d' % (lines, message_size))
+    print('%-10s %12s %15s %12s' % ('log', 'us/line', 'peak RSS +MB', 'render, s'))
+    for log_class in (_EagerLog, _LazyLog):
+        process = multiprocessing.Process(target=_run, args=(log_class, lines, message_size, results))
+        process.start()
+        name, per_line, rss, render_seconds = results.get()
+        process.join()
+        print('%-10s %12.2f %15.1f %12.2f' % (name, per_line, rss, render_seconds))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
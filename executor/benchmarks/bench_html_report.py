@@ -0,0 +1,54 @@
+"""
+Peak RSS of HtmlReport and StreamingHtmlReport on a chatty test.
+Every variant runs in separate process, because peak RSS never goes down.
+
+Usage: python -m bl.executor.benchmarks.bench_html_report [entries] [message_size]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bl.executor.html_report import HtmlReport, StreamingHtmlReport
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _run(report_class, entries, message_size, results):
+    baseline = _peak_rss_mb()
+    message = 'x' * message_size
+    started = time.perf_counter()
+    report = report_class()
+    for i in range(entries):
+        report.write_log(module_name='bench', level='INFO', message=message)
+        if i % 10 == 0:
+            report.level_down()
+        elif i % 10 == 9:
+            report.level_up()
+    filename = os.path.join(tempfile.gettempdir(), 'bench_%s.html' % report_class.__name__)
+    report.save(filename=filename, testcase_id='BENCH-1', result='PASS')
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(filename) / 1024.0 / 1024.0
+    os.remove(filename)
+    results.put((report_class.__name__, _peak_rss_mb() - baseline, elapsed, size))
+
+
+def main(entries=200000, message_size=200):
+    results = multiprocessing.Queue()
+    print('entries=%d message_size=%d' % (entries, message_size))
+    print('%-20s %15s %10s %12s' % ('report', 'peak RSS +MB', 'seconds', 'report MB'))
+    for report_class in (HtmlReport, StreamingHtmlReport):
+        process = multiprocessing.Process(target=_run, args=(report_class, entries, message_size, results))
+        process.start()
+        name, rss, elapsed, size = results.get()
+        process.join()
+        print('%-20s %15.1f %10.2f %12.1f' % (name, rss, elapsed, size))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,77 @@
+"""
+Peak RSS and time of writing XML report with large log: building whole report as one string
+versus streaming it with JUnitXmlWriter.
+Every variant runs in separate process, because peak RSS never goes down.
+
+Usage: python -m bl.executor.benchmarks.bench_junit_xml [log_mb] [message_size]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bl.executor.junit_xml import JUnitXmlWriter, escape
+from bl.executor.log_store import LogStore
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _joined(logs, file):
+    # former Result._create_xml_report: log is joined and substituted into one template
+    xml_template = '''<?xml version="1.0" encoding="UTF-8"?>
+<testsuite errors="%(errors)d" failures="%(failures)d" skipped="%(skipped)d" name="bl.infra.testcase.common.PjacTestSuite" tests="1" time="%(time)d">
+  <testcase classname="%(classname)s" name="%(testcaseid)s" testcaseid="%(testcaseid)s">
+    <system-out><![CDATA[\n%(log)s]]></system-out>
+    <system-err><![CDATA[]]></system-err>
+  </testcase>
+</testsuite>
+'''
+    log = ''.join(logs.iter_text())
+    file.write(xml_template % dict(errors=0, failures=0, skipped=0, time=1, classname=escape('Bench'),
+                                   testcaseid=escape('BENCH-1'), log=log))
+
+
+def _streamed(logs, file):
+    writer = JUnitXmlWriter(file)
+    writer.start(errors=0, failures=0, skipped=0, time=1, classname='Bench', testcase_id='BENCH-1', testrun='test-1',
+                 timestamp='', groups='', run=1)
+    writer.system_out(logs.iter_text())
+    writer.files([])
+    writer.end()
+
+
+def _run(write, log_mb, message_size, results):
+    logs = LogStore()
+    message = 'x' * message_size
+    for _ in range(log_mb * 1024 * 1024 // message_size):
+        logs.write_log(module_name='bench', level='INFO', message=message)
+    baseline = _peak_rss_mb()
+    filename = os.path.join(tempfile.gettempdir(), 'bench_%s.xml' % write.__name__)
+    started = time.perf_counter()
+    with open(filename, 'w', encoding='utf-8') as file:
+        write(logs, file)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(filename) / 1024.0 / 1024.0
+    os.remove(filename)
+    results.put((write.__name__.strip('_'), _peak_rss_mb() - baseline, elapsed, size))
+
+
+def main(log_mb=100, message_size=100):
+    results = multiprocessing.Queue()
+    print('log_mb=%d message_size=%d' % (log_mb, message_size))
+    print('%-10s %15s %10s %12s' % ('report', 'peak RSS +MB', 'seconds', 'report MB'))
+    for write in (_joined, _streamed):
+        process = multiprocessing.Process(target=_run, args=(write, log_mb, message_size, results))
+        process.start()
+        name, rss, elapsed, size = results.get()
+        process.join()
+        print('%-10s %15.1f %10.2f %12.1f' % (name, rss, elapsed, size))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,64 @@
+"""
+Memory of tests queued in WorkersPool queue, as in local mode with large repeat count.
+Every variant runs in separate process, because peak RSS never goes down.
+
+Usage: python -m bl.executor.benchmarks.bench_queued_tests [tests] [distinct_testcases]
+"""
+import multiprocessing
+import resource
+import sys
+import time
+
+from bl.executor.scheduler import FairShareQueue
+from bl.executor.test import Test
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class _LoadGenerator:
+    finished_count = None
+    total_count = None
+
+    def __init__(self):
+        self.callbacks = (self._on_started, self._on_finished)
+
+    def _on_started(self, test):
+        pass
+
+    def _on_finished(self, test):
+        pass
+
+
+def _run(name, tests, distinct, with_arguments, results):
+    load_generator = _LoadGenerator()
+    factory = Test.Factory(storage={}, result_factory=None)
+    testcase_ids = ['TBB-%d(x=%d)' % (index, index) if with_arguments else 'TBB-%d' % index for index in range(distinct)]
+    queue = FairShareQueue()
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    for index in range(tests):
+        test = factory(testcase_id=testcase_ids[index % distinct], load_generator=load_generator, arguments=None)
+        test.on_started, test.on_finished = load_generator.callbacks
+        queue.push(test, tenant=test.testcase_id)
+    elapsed = time.perf_counter() - started
+    rss = _peak_rss_mb() - baseline
+    results.put((name, rss, rss * 1024 * 1024 / tests, elapsed))
+
+
+def main(tests=1000000, distinct=100):
+    results = multiprocessing.Queue()
+    print('tests=%d distinct testcases=%d' % (tests, distinct))
+    print('%-20s %15s %12s %10s' % ('testcase ids', 'peak RSS +MB', 'bytes/test', 'seconds'))
+    for name, with_arguments in (('plain', False), ('with arguments', True)):
+        process = multiprocessing.Process(target=_run, args=(name, tests, distinct, with_arguments, results))
+        process.start()
+        name, rss, per_test, elapsed = results.get()
+        process.join()
+        print('%-20s %15.1f %12.0f %10.2f' % (name, rss, per_test, elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
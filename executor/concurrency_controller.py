@@ -0,0 +1,176 @@
+import threading
+import time
+
+from bl.log import getLogger
+from bl.settings import Settings
+
+from .cpu_monitor import CPUMonitor
+
+log = getLogger(__name__)
+
+
+class ConcurrencyController:
+    """
+    AIMD controller of workers count driven by CPU load.
+    Every interval target thread count is increased by increase_step while load is below
+    threshold - margin and multiplied by decrease_factor when load is over threshold, so load stays
+    just under cpu_throtlng_percent. Replaces per-worker throttling of CPUMonitor while running
+    """
+    def __init__(self, workers, cpu_monitor=None, min_threads=None, max_threads=None, interval=None,
+                 increase_step=None, decrease_factor=None, margin=None, on_change=None):
+        """
+        :param on_change: callback(previous, target) called after controller changed thread count
+        """
+        self.workers = workers
+        self.cpu_monitor = cpu_monitor or getattr(workers, 'cpu_monitor', None) or CPUMonitor()
+        self.min_threads = min_threads or Settings.get('adaptive_min_threads', with_type=int, default=1)
+        self._max_threads = max_threads or Settings.get('adaptive_max_threads', with_type=int, default=None)
+        self.interval = interval or Settings.get('adaptive_interval', with_type=float, default=1.0)
+        self.increase_step = increase_step or Settings.get('adaptive_increase_step', with_type=int, default=1)
+        self.decrease_factor = decrease_factor or Settings.get('adaptive_decrease_factor', with_type=float, default=0.75)
+        self.margin = margin if margin is not None else Settings.get('adaptive_margin', with_type=float, default=5.0)
+        self.on_change = on_change
+        self.target = 0
+        self._requested_threads = 0
+        self._cond = threading.Condition()
+        # target is computed and applied to workers under it, so concurrent changes are applied in order
+        self._apply_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._load = None
+        self._throttled_seconds = 0.0
+        self._increases_count = 0
+        self._decreases_count = 0
+
+    @property
+    def max_threads(self):
+        """
+        Upper bound set by operator, thread count requested by run otherwise
+        """
+        return self._max_threads or self._requested_threads
+
+    def _clamp(self, threads):
+        return max(self.min_threads, min(threads, self.max_threads))
+
+    def start(self, threads):
+        """
+        Start controlling workers count beginning from threads
+        """
+        with self._apply_lock:
+            with self._cond:
+                self._requested_threads = threads
+                self.target = self._clamp(threads)
+                target = self.target
+                self.cpu_monitor.throttling = False
+                if not self._thread:
+                    self._running = True
+                    self._thread = threading.Thread(target=self._thread_func, name='ConcurrencyController')
+                    self._thread.daemon = True
+                    self._thread.start()
+            log.info('ConcurrencyController.start target[%d] min[%d] max[%d]' % (target, self.min_threads,
+                                                                                 self.max_threads))
+            self.workers.set_threads(target)
+
+    def set_threads(self, threads):
+        """
+        Operator override of thread count, controller continues from it
+        """
+        with self._apply_lock:
+            with self._cond:
+                previous = self.target
+                self._requested_threads = threads
+                self.target = self._clamp(threads)
+                target = self.target
+            self._apply(previous, target)
+
+    def set_bounds(self, min_threads=None, max_threads=None):
+        """
+        Set bounds of thread count. Raises ValueError for invalid bounds
+        """
+        with self._apply_lock:
+            with self._cond:
+                min_threads = self.min_threads if min_threads is None else int(min_threads)
+                max_threads = self._max_threads if max_threads is None else int(max_threads)
+                # controller could not increase thread count from zero
+                if min_threads < 1 or (max_threads is not None and max_threads < min_threads):
+                    raise ValueError('Invalid thread count bounds min[%s] max[%s]' % (min_threads, max_threads))
+                self.min_threads = min_threads
+                self._max_threads = max_threads
+                previous = self.target
+                if self._running:
+                    self.target = self._clamp(self.target)
+                target = self.target
+            log.info('ConcurrencyController.set_bounds min[%s] max[%s]' % (min_threads, max_threads))
+            self._apply(previous, target)
+
+    def adjust(self, load, elapsed):
+        """
+        Make one control step for sampled CPU load. Return new target thread count
+        """
+        with self._apply_lock:
+            with self._cond:
+                previous = self.target
+                self._load = load
+                if load > self.cpu_monitor.threshold:
+                    self._throttled_seconds += elapsed
+                    target = int(previous * self.decrease_factor)
+                elif load < self.cpu_monitor.threshold - self.margin:
+                    target = previous + self.increase_step
+                else:
+                    target = previous
+                self.target = self._clamp(target)
+                target = self.target
+                if target < previous:
+                    self._decreases_count += 1
+                elif target > previous:
+                    self._increases_count += 1
+            self._apply(previous, target)
+        return target
+
+    def _apply(self, previous, target):
+        # should be called with _apply_lock
+        if target == previous or not self._running:
+            return
+        log.info('ConcurrencyController: load[%s] threads %d -> %d' % (self._load, previous, target))
+        self.workers.set_threads(target)
+        if self.on_change:
+            self.on_change(previous, target)
+
+    def _thread_func(self):
+        last = time.monotonic()
+        while True:
+            with self._cond:
+                if self._running:  # stop could notify before thread started waiting
+                    self._cond.wait(self.interval)
+                if not self._running:
+                    return
+            now = time.monotonic()
+            try:
+                self.adjust(load=self.cpu_monitor.load, elapsed=now - last)
+            except Exception:
+                log.exception('ConcurrencyController: cant adjust thread count')
+            last = now
+
+    def stop(self):
+        """
+        Stop controlling, workers count is left as is and per-worker throttling is enabled again
+        """
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._running = False
+            self._cond.notify()
+        if thread:
+            thread.join()
+        self.cpu_monitor.throttling = True
+
+    def get_metrics(self):
+        with self._cond:
+            return dict(running=self._running,
+                        target=self.target,
+                        min_threads=self.min_threads,
+                        max_threads=self.max_threads,
+                        load=self._load,
+                        threshold=self.cpu_monitor.threshold,
+                        throttled_seconds=self._throttled_seconds,
+                        increases=self._increases_count,
+                        decreases=self._decreases_count)
@@ -15,10 +15,20 @@ class CPUMonitor:
     def __init__(self, threshold: int = None):
         self._threshold = threshold or Settings.get('cpu_throtlng_percent', with_type=int)
         self._load = 0.0
-        self.running = True
+        self.running = False
+        self.throttling = True  # ConcurrencyController disables per-worker throttling
+        self.thread = None
+        self.start()
 
+    def start(self):
+        """
+        Start CPU monitoring. Monitor could be started again after stop
+        """
+        if self.running:
+            return
         log.info(f'Starting CPU monitoring thread with {self._threshold}% threshold')
 
+        self.running = True
         self.thread = Thread(target=self.monitor)
         self.thread.start()
 
@@ -28,11 +38,28 @@ class CPUMonitor:
             if self._load > self._threshold:
                 log.debug(f'CPU overloaded ({self._load}%), waiting for an update ...')
 
+    @property
+    def load(self):
+        """
+        Last sampled CPU load, percents
+        """
+        return self._load
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    def overloaded(self):
+        """
+        Return True if current CPU load > treshhold value and throttling is enabled. Never blocks
+        """
+        return self.throttling and self._load > self._threshold
+
     def throttle(self):
         """
         Return True if current CPU load < treshhold value
         """
-        throttled = self._load > self._threshold
+        throttled = self.overloaded()
         if throttled:
             time.sleep(1)
         return throttled
@@ -0,0 +1,124 @@
+import os
+import re
+import zlib
+
+from wheezy.http import HTTPResponse
+from wheezy.http.response import HTTP_HEADER_CACHE_CONTROL_DEFAULT, HTTP_STATUS
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _quality(params):
+    for param in params.split(';'):
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0  # malformed quality is not acceptable
+    return 1.0
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Return True if Accept-Encoding header allows gzip. Explicit gzip entry overrides '*' entry
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        qualities[name.strip().lower()] = _quality(params)
+    quality = qualities.get('gzip', qualities.get('*', 0.0))
+    return quality > 0
+
+
+def parse_range(header, size):
+    """
+    Parse single range of Range header.
+    Return (start, end) inclusive, None if header should be ignored or raise ValueError if range is not satisfiable
+    """
+    match = _RANGE_RE.match(header.strip().replace(' ', ''))
+    if not match:
+        return None  # several ranges or other units are not supported, full content is returned
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: last N bytes
+        if int(last) == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range %s is not satisfiable for size %d' % (header, size))
+    return start, end
+
+
+class FileResponse(HTTPResponse):
+    """
+    Response which streams file from disk in chunks instead of buffering it.
+    Content is gzip compressed on the fly when client accepts it, single byte range of Range header
+    is served uncompressed with 206 status
+    """
+    def __init__(self, path, content_type, environ, chunk_size=CHUNK_SIZE):
+        """
+        Raises IOError if file does not exist. File is opened when body is iterated, so response
+        which is never sent does not leak it
+        """
+        super(FileResponse, self).__init__(content_type=content_type)
+        self.path = path
+        self.size = os.stat(path).st_size
+        self.chunk_size = chunk_size
+        self.range = None
+        self.gzip = False
+        self.headers.append(('Accept-Ranges', 'bytes'))
+        self.headers.append(('Vary', 'Accept-Encoding'))
+
+        range_header = environ.get('HTTP_RANGE')
+        try:
+            self.range = parse_range(range_header, self.size) if range_header else None
+        except ValueError:
+            self.status_code = 416
+            self.headers.append(('Content-Range', 'bytes */%d' % self.size))
+            return
+        if self.range:
+            self.status_code = 206
+            self.headers.append(('Content-Range', 'bytes %d-%d/%d' % (self.range[0], self.range[1], self.size)))
+        elif accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING', '')):
+            self.gzip = True
+            self.headers.append(('Content-Encoding', 'gzip'))
+
+    def _chunks(self, start, length):
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            while length > 0:
+                chunk = file.read(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    def _gzip_chunks(self):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        for chunk in self._chunks(0, self.size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def __call__(self, start_response):
+        headers = self.headers
+        headers.append(HTTP_HEADER_CACHE_CONTROL_DEFAULT)
+        if self.status_code == 416:
+            headers.append(('Content-Length', '0'))
+            start_response(HTTP_STATUS[self.status_code], headers)
+            return []
+        if self.gzip:
+            # length of compressed content is unknown until it is streamed
+            start_response(HTTP_STATUS[self.status_code], headers)
+            return self._gzip_chunks()
+        start, end = self.range or (0, self.size - 1)
+        headers.append(('Content-Length', str(end - start + 1)))
+        start_response(HTTP_STATUS[self.status_code], headers)
+        return self._chunks(start, end - start + 1)
@@ -0,0 +1,105 @@
+import threading
+
+
+class Histogram:
+    """
+    HDR style histogram of durations. Values are kept in log-linear buckets with fixed relative
+    precision (~1% for 2 significant digits), so recording is O(1) and memory does not depend on
+    number of recorded values. Durations are in seconds with microsecond resolution
+    """
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, significant_digits=2):
+        self._sub_bucket_bits = (2 * 10 ** significant_digits - 1).bit_length()
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket_shift(self, value):
+        return max(value.bit_length() - self._sub_bucket_bits, 0)
+
+    def record(self, seconds):
+        value = max(int(round(seconds * 1000000)), 0)
+        shift = self._bucket_shift(value)
+        key = value >> shift << shift  # lowest value of bucket
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        Return highest value equivalent to percent-th percentile(seconds) or None if histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = max(percent / 100.0 * self.count, 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                highest = key + (1 << self._bucket_shift(key)) - 1
+                return min(highest / 1000000.0, self.max)
+        return self.max
+
+    def summary(self):
+        result = dict(count=self.count,
+                      min=self.min,
+                      mean=self.total / self.count if self.count else None,
+                      max=self.max)
+        for percent in self.PERCENTILES:
+            result['p%s' % percent] = self.percentile(percent)
+        return result
+
+
+class LatencyRecorder:
+    """
+    Thread safe set of histograms grouped by testcase id and by group inside testcase
+    (result type for test durations, step for step durations)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, testcase_id, group, seconds):
+        if seconds is None:  # test was not run
+            return
+        with self._lock:
+            histogram = self._histograms.get((testcase_id, group))
+            if histogram is None:
+                histogram = self._histograms[(testcase_id, group)] = Histogram()
+            histogram.record(seconds)
+
+    def summary(self, reset=False):
+        """
+        Return {testcase_id: {group: {count, min, mean, max, p50, p90, p99, p99.9}}}.
+        With reset histograms start new window
+        """
+        with self._lock:
+            histograms = self._histograms
+            if not reset:
+                return self._summary(histograms)
+            self._histograms = {}
+        return self._summary(histograms)
+
+    @staticmethod
+    def _summary(histograms):
+        result = {}
+        for (testcase_id, group), histogram in sorted(histograms.items()):
+            result.setdefault(testcase_id, {})[group] = histogram.summary()
+        return result
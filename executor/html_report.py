@@ -1,5 +1,7 @@
 import datetime
 import json
+import shutil
+import tempfile
 from os import remove, path
 
 from .html_parts import *
@@ -37,24 +39,25 @@ class HtmlReport:
         self.cursor = self.log
         self.levels.append(self.cursor)
 
-    def write_log(self, module_name, level, message):
+    def write_log(self, module_name, level, message, time=None):
         """
         Write line to html file
         :param module_name: name related to class or file
         :param level: logging level
         :param message: log_message
+        :param time: formatted time of line, current time by default
         """
         messages = message.split('\n')
         if len(messages) > 1:
-            self._write(module_name, level, messages[0])
+            self._write(module_name, level, messages[0], time)
             self.level_down()
-            self._write(module_name, level, '\n'.join(messages[1:]))
+            self._write(module_name, level, '\n'.join(messages[1:]), time)
             self.level_up()
         else:
-            self._write(module_name, level, message)
+            self._write(module_name, level, message, time)
 
-    def _write(self, module_name, level, message):
-        self.cursor.append(dict(time=HtmlReport.current_time(),
+    def _write(self, module_name, level, message, time):
+        self.cursor.append(dict(time=time or HtmlReport.current_time(),
                                 msg=message,
                                 lvl=level,
                                 module=module_name))
@@ -98,3 +101,94 @@ class HtmlReport:
             file.write(json.dumps(kwargs))
             file.write(AFTER_JSON_LOG)
         return SavedReport(filename)
+
+
+class _Level:
+    """
+    Nesting level of streamed log: the last entry of level and its children level
+    """
+    def __init__(self):
+        self.count = 0
+        self.entry = None
+        self.entry_open = False
+        self.child = None
+
+
+class StreamingHtmlReport(HtmlReport):
+    """
+    HtmlReport which spools log entries to temporary file as they arrive.
+    Only the last entry of every open nesting level is kept in memory, the produced report is the same
+    """
+
+    def __init__(self):
+        self._spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self._root = _Level()
+        self.levels = [self._root]
+
+    def _write(self, module_name, level, message, time):
+        current = self.levels[-1]
+        self._finish_entry(current)
+        current.entry = dict(time=time or HtmlReport.current_time(),
+                             msg=message,
+                             lvl=level,
+                             module=module_name)
+
+    def _start_entry(self, level):
+        if level.count:
+            self._spool.write(', ')
+        level.count += 1
+
+    def _finish_entry(self, level):
+        if level.entry is None:
+            return
+        if level.entry_open:
+            self._finish_entry(level.child)
+            self._spool.write(']}')
+        else:
+            self._start_entry(level)
+            self._spool.write(json.dumps(level.entry))
+        level.entry = None
+        level.entry_open = False
+        level.child = None
+
+    def level_up(self):
+        """
+        Close current level and up
+        """
+        if len(self.levels) > 1:
+            self.levels.pop()
+
+    def level_down(self):
+        """
+        Create new log level
+        """
+        current = self.levels[-1]
+        if current.entry is None:
+            raise IndexError('No log entry to create level for')
+        if not current.entry_open:
+            self._start_entry(current)
+            self._spool.write(json.dumps(current.entry)[:-1] + ', "log": [')
+            current.entry_open = True
+            current.child = _Level()
+        self.levels.append(current.child)
+
+    def save(self, filename, **kwargs):
+        """
+        Append required testcase params and copy spooled log to file
+        :param filename: path to store HTML report
+        """
+        self._finish_entry(self._root)
+        self.levels = [self._root]
+        header = json.dumps(kwargs)
+        with open(filename, 'w') as file:
+            file.write(BEFORE_JSON_LOG)
+            file.write(header[:-1] + ', "log": [' if kwargs else '{"log": [')
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, file)
+            self._spool.seek(0, 2)
+            file.write(']}')
+            file.write(AFTER_JSON_LOG)
+        return SavedReport(filename)
+
+    def close(self):
+        self._spool.close()
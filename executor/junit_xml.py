@@ -0,0 +1,95 @@
+import re
+from xml.sax.saxutils import escape as sax_escape
+
+# characters which are not allowed in XML 1.0 even inside CDATA
+_INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def escape(text):
+    return sax_escape(_INVALID_XML_CHARS.sub('', str(text)), entities={"'": '&#39;', '"': '&#34;', '\n': '&#10;'})
+
+
+def cdata(text):
+    """
+    Make text safe inside CDATA section: ]]> is split between two sections
+    """
+    return _INVALID_XML_CHARS.sub('', text).replace(']]>', ']]]]><![CDATA[>')
+
+
+class JUnitXmlWriter:
+    """
+    Writer of JUnit XML report of one testcase. Parts are written to file as they are passed,
+    so report is never built in memory. Methods should be called in order: start, properties, steps,
+    failure, system_out, files, end
+    """
+    def __init__(self, file):
+        self.file = file
+
+    def start(self, errors, failures, skipped, time, classname, testcase_id, testrun, timestamp, groups, run):
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<testsuite errors="%d" failures="%d" skipped="%d" name="bl.infra.testcase.common.PjacTestSuite" '
+                        'tests="1" time="%d">\n' % (errors, failures, skipped, time))
+        self.file.write('  <testcase classname="%s" name="%s" testcaseid="%s" testrun="%s" timestamp="%s" time="%s" '
+                        'groups="%s" run="%s">\n' % (escape(classname), escape(testcase_id), escape(testcase_id),
+                                                     escape(testrun), escape(timestamp), time, escape(groups),
+                                                     escape(run)))
+
+    def properties(self, properties):
+        if not properties:
+            return
+        self.file.write('    <properties>')
+        for name, value in properties.items():
+            self.file.write('<property name="%s" value="%s"/>' % (escape(name), escape(value)))
+        self.file.write('</properties>\n')
+
+    def steps(self, steps):
+        if not steps:
+            return
+        self.file.write('    <steps>')
+        for step_timing in steps:
+            self.file.write('<step number="%(number)s" description="%(description)s" start="%(start)s" end="%(end)s" '
+                            'duration="%(duration)s"/>' % dict(step_timing,
+                                                               description=escape(step_timing['description'])))
+        self.file.write('</steps>\n')
+
+    def failure(self, result_type, message, traceback):
+        self.file.write('    <%s type="%s" message="%s"><![CDATA[\n%s]]></%s>\n' % (escape(result_type),
+                                                                                   escape(result_type),
+                                                                                   escape(message),
+                                                                                   cdata(traceback),
+                                                                                   escape(result_type)))
+
+    def system_out(self, lines, chunk_size=65536):
+        """
+        Write log lines in chunks of about chunk_size characters
+        """
+        write = self.file.write
+        write('    <system-out><![CDATA[\n')
+        chunk, size, tail = [], 0, ''
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                tail = self._write_cdata(tail + ''.join(chunk))
+                chunk, size = [], 0
+        write(cdata(tail + ''.join(chunk)))
+        write(']]></system-out>\n')
+        write('    <system-err><![CDATA[]]></system-err>\n')
+
+    def _write_cdata(self, text):
+        # trailing ] could make ]]> with next chunk, it is written with next chunk
+        end = len(text.rstrip(']'))
+        self.file.write(cdata(text[:end]))
+        return text[end:]
+
+    def files(self, files):
+        """
+        :param files: xml of file entries
+        """
+        self.file.write('    <files>')
+        for file_xml in files:
+            self.file.write(file_xml)
+        self.file.write('</files>\n')
+
+    def end(self):
+        self.file.write('  </testcase>\n</testsuite>\n')
@@ -1,12 +1,14 @@
-import random
 import threading
 import weakref
 
 from bl.assertions import Assert, PjacError
 from bl.log import getLogger
+from bl.settings import Settings
 
+from .histogram import Histogram, LatencyRecorder
 from .load_generator import LoadGenerator
 from .result import Result
+from .sampler import ShuffledRange
 
 log = getLogger(__name__)
 
@@ -14,11 +16,14 @@ log = getLogger(__name__)
 class LocalLoadGenerator(LoadGenerator):
     """
     LocalLoadGenerator implements generation of test load for local mode.
-    In this mode all tests are added to queue and executed by workers
+    In this mode testcases are repeated repeat_count times in shuffled order and executed by workers.
+    Tests are created lazily: only feed_window tests are queued or running at once, so memory does not
+    depend on repeat count
     """
     TC_SEPARATORS = ',|;| |\t'
 
-    def __init__(self, workers, main_loop, test_factory, testcase_args, repeat_count, load_generator):
+    def __init__(self, workers, main_loop, test_factory, testcase_args, repeat_count, load_generator,
+                 feed_window=None, seed=None):
         super(LocalLoadGenerator, self).__init__()
         self.test_factory = test_factory
         self.workers = workers
@@ -37,13 +42,26 @@ class LocalLoadGenerator(LoadGenerator):
                 self.testcases.append(arg)
         Assert.not_empty(self.testcases, PjacError('Testcase list not empty', verbose=False))
         log.info('Running: %s (%d times)' % (' '.join(self.testcases), repeat_count), extra={'to_console': True})
-        self.testcases = self.testcases * repeat_count
-        random.shuffle(self.testcases)
-        self._left_count = 0
+        self.test_factory.preload(self.testcases)  # measured runs start with testcases imported
+        self.repeat_count = repeat_count
+        self.feed_window = feed_window or Settings.get('local_feed_window', with_type=int, default=1000)
+        seed = seed if seed is not None else Settings.get('shuffle_seed', with_type=int, default=None)
+        self.order = ShuffledRange(len(self.testcases) * repeat_count, seed=seed)
+        log.info('LocalLoadGenerator: %d tests, shuffle seed %d' % (len(self.order), self.order.seed))
+        self._feed = iter(self.order)
+        self._feed_lock = threading.Lock()
+        self._feed_pending = 0
+        self._feeding = False
+        self._left_count = len(self.order)  # tests which are not finished including ones which are not created yet
         self._failed_count = 0
         self._success_count = 0
         self._skipped_count = 0
         self._counters_lock = threading.RLock()
+        self.latency = LatencyRecorder()
+        self.step_latency = LatencyRecorder()
+        # bound once and shared by all tests. Forks do not come from shuffled sequence, so they do not feed it
+        self._test_callbacks = (self._on_started, self._on_finished)
+        self._fork_callbacks = (self._on_started, self._on_fork_finished)
         self.start()
 
     # 'test1(param1=1, param2=2) test2 test3' -> ['test1(param1=1, param2=2)', 'test2', 'test3']
@@ -66,27 +84,71 @@ class LocalLoadGenerator(LoadGenerator):
         return result
 
     def start(self):
-        for testcase in self.testcases:
-            self.add_test(testcase)
+        self._feed_tests(self.feed_window)
+
+    def _feed_tests(self, count):
+        """
+        Create and queue next count tests of shuffled sequence.
+        One thread feeds at a time and others only add to pending count, so tests which finish
+        at once on push(e.g. shed by workers pool) do not make recursion
+        """
+        with self._feed_lock:
+            self._feed_pending += count
+            if self._feeding:
+                return
+            self._feeding = True
+        while True:
+            with self._feed_lock:
+                index = next(self._feed, None) if self._feed_pending else None
+                if index is None:
+                    self._feed_pending = 0
+                    self._feeding = False
+                    return
+                self._feed_pending -= 1
+            self._push_test(self.testcases[index % len(self.testcases)], callbacks=self._test_callbacks)
 
     def add_test(self, testcase_id, arguments=None):
-        test = self.test_factory(testcase_id=testcase_id, arguments=arguments, load_generator=weakref.proxy(self))
-        test.on_started = self._on_started
-        test.on_finished = self._on_finished
-        self.workers.push(test)
         with self._counters_lock:
             self._left_count += 1
+        self._push_test(testcase_id, arguments, callbacks=self._fork_callbacks)
+
+    def _push_test(self, testcase_id, arguments=None, callbacks=None):
+        test = self.test_factory(testcase_id=testcase_id, arguments=arguments, load_generator=weakref.proxy(self))
+        test.on_started, test.on_finished = callbacks
+        self.workers.push(test)
 
     def stop(self):
+        self.workers.flush_reports()
         log.info('Ran %d tests' % self.total_count, extra={'to_console': True})
         log.info('failed: %d skipped: %d success: %d' % (self._failed_count, self._skipped_count, self._success_count),
                  extra={'to_console': True})
+        self.log_latency(title='Test duration', group_title='result', latency=self.latency)
+        self.log_latency(title='Step duration', group_title='step', latency=self.step_latency)
+        log_retention = getattr(getattr(self.test_factory, 'result_factory', None), 'log_retention', None)
+        if log_retention:
+            log.info('Test logs: %s' % log_retention.get_metrics())
         self.load_generator.stop()
 
+    @staticmethod
+    def log_latency(title, group_title, latency):
+        percentiles = ['p%s' % percent for percent in Histogram.PERCENTILES]
+        lines = ['%-20.20s %-8s %6s %9s' % ('testcase', group_title, 'count', 'mean') +
+                 ''.join(' %9s' % percentile for percentile in percentiles) + ' %9s' % 'max']
+        for testcase_id, groups in latency.summary().items():
+            for group, summary in groups.items():
+                lines.append('%-20.20s %-8s %6d %9.3f' % (testcase_id, group, summary['count'], summary['mean']) +
+                             ''.join(' %9.3f' % summary[percentile] for percentile in percentiles) +
+                             ' %9.3f' % summary['max'])
+        log.info('%s, seconds:\n%s' % (title, '\n'.join(lines)), extra={'to_console': True})
+
     def _on_started(self, test):
         log.debug('LocalLoadGenerator._on_started %s' % test)
 
     def _on_finished(self, test):
+        self._on_fork_finished(test)
+        self._feed_tests(1)  # finished test frees place in feed window
+
+    def _on_fork_finished(self, test):
         log.debug('LocalLoadGenerator._on_finished %s' % test)
         with self._counters_lock:
             result = test.result.get_result()
@@ -96,6 +158,9 @@ class LocalLoadGenerator(LoadGenerator):
                 self._success_count += 1
             if result == Result.Skip:
                 self._skipped_count += 1
+            self.latency.record(test.testcase_id, result.report_format, test.duration)
+            for step_timing in test.result.steps:
+                self.step_latency.record(test.testcase_id, step_timing.number, step_timing.duration)
 
             self._left_count -= 1
             if self._left_count == 0:
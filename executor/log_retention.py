@@ -0,0 +1,81 @@
+import threading
+
+from bl.settings import Settings
+
+from .log_store import LogStore, level_number
+
+
+class RetentionPolicy:
+    FULL = 'full'  # all captured lines are kept
+    FAILURES = 'failures'  # lines are kept only for tests which did not pass
+    RING = 'ring'  # 'ring:N', last N lines are kept for tests which passed
+
+
+class LogRetention:
+    """
+    Retention of test logs: minimum captured level and policy which applies when test finishes.
+    Lines below minimum level are dropped on capture, lines dropped by policy are kept in memory until test
+    finishes, because result of test is not known before. Counts bytes kept and discarded by tests of this retention
+    """
+    def __init__(self, policy=RetentionPolicy.FULL, min_level=None):
+        self.policy, _, ring_size = policy.partition(':')
+        if self.policy not in (RetentionPolicy.FULL, RetentionPolicy.FAILURES, RetentionPolicy.RING):
+            raise ValueError('Unknown log retention policy %s' % policy)
+        if self.policy == RetentionPolicy.RING:
+            self.ring_size = int(ring_size) if ring_size else 0
+            if self.ring_size <= 0:
+                raise ValueError('Log retention ring:N should have N greater 0')
+        if min_level:
+            level_number(min_level)  # unknown level is error of settings, it should not drop all lines silently
+        self.min_level = min_level
+        self._lock = threading.Lock()
+        self._kept_bytes = 0
+        self._discarded_bytes = 0
+        self._discarded_count = 0
+
+    # lock could not be pickled, so retention is created again in another process with own counters
+    def __getstate__(self):
+        return dict(policy=self.policy_name, min_level=self.min_level)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def policy_name(self):
+        return self.policy if self.policy != RetentionPolicy.RING else 'ring:%d' % self.ring_size
+
+    @staticmethod
+    def from_settings(mode):
+        """
+        Read retention of mode(local, service, stress). log_retention_<mode> and log_min_level_<mode>
+        override common log_retention and log_min_level settings
+        """
+        policy = Settings.get('log_retention_%s' % mode, default=None) or Settings.get('log_retention',
+                                                                                      default=RetentionPolicy.FULL)
+        min_level = Settings.get('log_min_level_%s' % mode, default=None) or Settings.get('log_min_level', default=None)
+        return LogRetention(policy=policy, min_level=min_level)
+
+    def create_store(self):
+        return LogStore(min_level=self.min_level)
+
+    def apply(self, logs, passed):
+        """
+        Drop lines of finished test according to policy and count kept and discarded bytes
+        """
+        if passed and self.policy == RetentionPolicy.FAILURES:
+            logs.discard(reason='test passed, log retention %s' % self.policy)
+        elif passed and self.policy == RetentionPolicy.RING and len(logs) > self.ring_size:
+            logs.discard(keep_last=self.ring_size, reason='test passed, log retention %s:%d' % (self.policy,
+                                                                                               self.ring_size))
+        with self._lock:
+            self._kept_bytes += logs.kept_bytes
+            self._discarded_bytes += logs.discarded_bytes
+            self._discarded_count += logs.discarded_count
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(policy=self.policy_name,
+                        min_level=self.min_level,
+                        kept_bytes=self._kept_bytes,
+                        discarded_bytes=self._discarded_bytes,
+                        discarded_lines=self._discarded_count)
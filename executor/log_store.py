@@ -0,0 +1,174 @@
+import datetime
+import logging
+import time
+
+_TEXT_INDENT = '\n' + ' ' * 48  # continuation lines of multiline message are aligned after line prefix
+
+
+def level_number(level):
+    """
+    Return number of logging level given by name(in any case), number or numeric string.
+    Raise ValueError for unknown level
+    """
+    if isinstance(level, int):
+        return level
+    level = str(level).strip()
+    if level.isdigit():
+        return int(level)
+    number = logging.getLevelName(level.upper())
+    if not isinstance(number, int):
+        raise ValueError('Unknown log level %s' % level)
+    return number
+
+
+class LogStore:
+    """
+    Compact log of one test. Entry is kept raw as (monotonic time, depth, level, module, message) tuple,
+    text of XML report and JSON tree of HTML report are rendered from entries only when report is written.
+    Supports nesting of log levels with level_down/level_up like HtmlReport.
+    Lines below min_level are dropped on capture, entries nested under dropped line are attached to its parent.
+    Kept entries could be also written to streaming html report as they are captured, see stream_to
+    """
+    def __init__(self, min_level=None):
+        self.entries = []
+        self.min_level = level_number(min_level) if min_level else None
+        self._level_numbers = {}
+        self.kept_bytes = 0
+        self.discarded_bytes = 0
+        self.discarded_count = 0
+        origin_time = datetime.datetime.now()
+        self._origin_monotonic = time.monotonic()
+        self._origin_microseconds = ((origin_time.hour * 60 + origin_time.minute) * 60 + origin_time.second) * 1000000 + \
+            origin_time.microsecond
+        self._counts = [0]  # count of written entries in every open level
+        self._last_kept = [False]  # if last entry of every open level was kept
+        self._nested = []  # if level opened under kept entry, for every level below root
+        self._depth = 0  # depth of kept entries
+        self._last_time = (None, '')
+        self._sink = None
+        self._sink_depth = 0
+
+    def write_log(self, module_name, level, message):
+        self._counts[-1] += 1
+        if self.min_level is not None and self._level_number(level) < self.min_level:
+            self._last_kept[-1] = False
+            self.discarded_bytes += len(message)
+            self.discarded_count += 1
+            return
+        entry = (time.monotonic(), self._depth, level, module_name, message)
+        self.entries.append(entry)
+        self._last_kept[-1] = True
+        self.kept_bytes += len(message)
+        if self._sink is not None:
+            self._sink_depth = self._replay_entry(self._sink, self._sink_depth, entry)
+
+    def _level_number(self, level):
+        number = self._level_numbers.get(level)
+        if number is None:
+            try:
+                number = level_number(level)
+            except ValueError:
+                number = logging.CRITICAL  # lines of unknown levels are not filtered out
+            self._level_numbers[level] = number
+        return number
+
+    def level_down(self):
+        """
+        Create new log level under last entry
+        """
+        if not self._counts[-1]:
+            raise IndexError('No log entry to create level for')
+        nested = self._last_kept[-1]
+        self._nested.append(nested)
+        self._depth += nested
+        self._counts.append(0)
+        self._last_kept.append(False)
+
+    def level_up(self):
+        """
+        Close current level and up
+        """
+        if len(self._counts) > 1:
+            self._counts.pop()
+            self._last_kept.pop()
+            self._depth -= self._nested.pop()
+
+    def discard(self, keep_last=0, reason=''):
+        """
+        Drop all entries except keep_last last ones. Kept entries whose parents were dropped are moved up,
+        reason is logged in place of dropped entries
+        """
+        dropped = self.entries[:-keep_last] if keep_last else self.entries
+        if not dropped:
+            return
+        kept = self.entries[len(dropped):]
+        dropped_bytes = sum(len(entry[4]) for entry in dropped)
+        self.discarded_bytes += dropped_bytes
+        self.kept_bytes -= dropped_bytes
+        self.discarded_count += len(dropped)
+        self.entries = [(dropped[-1][0], 0, 'INFO', 'log_retention',
+                         '%d log lines(%d bytes) were discarded: %s' % (len(dropped), dropped_bytes, reason))]
+        depth = -1  # first kept entry goes to root level
+        for monotonic, entry_depth, level, module_name, message in kept:
+            depth = min(entry_depth, depth + 1)
+            self.entries.append((monotonic, depth, level, module_name, message))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def format_time(self, monotonic):
+        """
+        Return wall clock time of monotonic time as HH:MM:SS.mmm
+        """
+        # plain arithmetic is several times faster than datetime.strftime
+        milliseconds = (self._origin_microseconds + int((monotonic - self._origin_monotonic) * 1000000)) // 1000
+        if milliseconds == self._last_time[0]:  # lines of burst share millisecond
+            return self._last_time[1]
+        key = milliseconds
+        seconds, milliseconds = divmod(milliseconds, 1000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        self._last_time = (key, '%02d:%02d:%02d.%03d' % (hours % 24, minutes, seconds, milliseconds))
+        return self._last_time[1]
+
+    def iter_text(self):
+        """
+        Yield log lines of XML report
+        """
+        format_time = self.format_time
+        for monotonic, _, level, module_name, message in self.entries:
+            yield '%s [%-25.25s] %s - %s\n' % (format_time(monotonic), module_name, level,
+                                               message.replace('\n', _TEXT_INDENT))
+
+    def text(self):
+        return ''.join(self.iter_text())
+
+    def replay(self, html_report):
+        """
+        Write entries to html_report restoring their nesting
+        """
+        depth = 0
+        for entry in self.entries:
+            depth = self._replay_entry(html_report, depth, entry)
+        return html_report
+
+    def stream_to(self, html_report):
+        """
+        Write entries to html_report as they are captured, entries captured before are written at once
+        """
+        self._sink = html_report
+        self._sink_depth = 0
+        for entry in self.entries:
+            self._sink_depth = self._replay_entry(html_report, self._sink_depth, entry)
+
+    def _replay_entry(self, html_report, depth, entry):
+        # write entry which goes after entry of given depth, return depth of written entry
+        monotonic, entry_depth, level, module_name, message = entry
+        while depth > entry_depth:
+            html_report.level_up()
+            depth -= 1
+        while depth < entry_depth:
+            html_report.level_down()
+            depth += 1
+        html_report.write_log(module_name=module_name, level=level, message=message, time=self.format_time(monotonic))
+        return depth
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import psutil
+from bl.log import getLogger
+from bl.settings import Settings
+
+log = getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class MemoryState:
+    OK = 'ok'
+    SOFT = 'soft'  # new tests are not dispatched to workers
+    HARD = 'hard'  # queued tests are shed
+
+
+class MemoryGuard:
+    """
+    Watches RSS of process and available system memory.
+    Over soft limit WorkersPool stops dispatching new tests, over hard limit it also sheds queued tests.
+    Guard without limits is disabled and never blocks
+    """
+    def __init__(self, soft_limit=None, hard_limit=None, soft_available=None, hard_available=None, interval=None):
+        """
+        :param soft_limit, hard_limit: limits of process RSS, MB
+        :param soft_available, hard_available: limits of available system memory, MB
+        """
+        self.soft_limit = soft_limit or Settings.get('memory_soft_limit_mb', with_type=int, default=None)
+        self.hard_limit = hard_limit or Settings.get('memory_hard_limit_mb', with_type=int, default=None)
+        self.soft_available = soft_available or Settings.get('memory_soft_available_mb', with_type=int, default=None)
+        self.hard_available = hard_available or Settings.get('memory_hard_available_mb', with_type=int, default=None)
+        self.interval = interval or Settings.get('memory_check_interval', with_type=float, default=1.0)
+        self.enabled = any((self.soft_limit, self.hard_limit, self.soft_available, self.hard_available))
+        self.state = MemoryState.OK
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._stop_event = None
+        self._thread = None
+        self._rss = None
+        self._available = None
+        self._state_changed = time.monotonic()
+        self._state_seconds = {MemoryState.OK: 0.0, MemoryState.SOFT: 0.0, MemoryState.HARD: 0.0}
+        self._blocked_count = 0
+        self.start()
+
+    def start(self):
+        """
+        Start watching memory. Guard could be started again after stop
+        """
+        with self._cond:
+            if not self.enabled or self._thread:
+                return
+            log.info('Starting memory guard rss soft/hard[%s/%s]MB available soft/hard[%s/%s]MB' %
+                     (self.soft_limit, self.hard_limit, self.soft_available, self.hard_available))
+            self._stop_event = threading.Event()  # every thread has its own event, so restart does not race stop
+            self._thread = threading.Thread(target=self._thread_func, args=(self._stop_event,), name='MemoryGuard')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def add_listener(self, listener):
+        """
+        :param listener: callback(state) called from guard thread when state changes
+        """
+        self._listeners.append(listener)
+
+    def _thread_func(self, stop_event):
+        process = psutil.Process()
+        while not stop_event.wait(self.interval):
+            try:
+                self.check(rss=process.memory_info().rss / MB, available=psutil.virtual_memory().available / MB)
+            except Exception:
+                log.exception('MemoryGuard: cant check memory')
+
+    @staticmethod
+    def _over(value, limit, available, available_limit):
+        return bool(limit and value > limit) or bool(available_limit and available < available_limit)
+
+    def check(self, rss, available):
+        """
+        Update state by sampled process RSS and available system memory(MB). Return new state
+        """
+        if self._over(rss, self.hard_limit, available, self.hard_available):
+            state = MemoryState.HARD
+        elif self._over(rss, self.soft_limit, available, self.soft_available):
+            state = MemoryState.SOFT
+        else:
+            state = MemoryState.OK
+        with self._cond:
+            self._rss = rss
+            self._available = available
+            previous, self.state = self.state, state
+            if state != previous:
+                now = time.monotonic()
+                self._state_seconds[previous] += now - self._state_changed
+                self._state_changed = now
+                self._cond.notify_all()
+        if state != previous:
+            log.warning('MemoryGuard: %s -> %s rss[%.0f]MB available[%.0f]MB' % (previous, state, rss, available),
+                        extra={'to_console': True})
+            for listener in self._listeners:
+                try:
+                    listener(state)
+                except Exception:
+                    log.exception('MemoryGuard: listener failed')
+        return state
+
+    def wait(self, interrupted=lambda: False):
+        """
+        Block while memory is over soft or hard limit and interrupted() is False
+        """
+        if self.state == MemoryState.OK:
+            return
+        with self._cond:
+            self._blocked_count += 1
+            try:
+                self._cond.wait_for(lambda: self.state == MemoryState.OK or interrupted())
+            finally:
+                self._blocked_count -= 1
+
+    def wake(self):
+        """
+        Wake up waiting threads, so they check their interrupted condition
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            thread, self._thread = self._thread, None
+            stop_event = self._stop_event
+            self.state = MemoryState.OK
+            self._cond.notify_all()
+        if thread:
+            stop_event.set()
+            thread.join()
+
+    def get_metrics(self):
+        with self._cond:
+            state_seconds = dict(self._state_seconds)
+            state_seconds[self.state] += time.monotonic() - self._state_changed
+            return dict(enabled=self.enabled,
+                        state=self.state,
+                        rss_mb=self._rss,
+                        available_mb=self._available,
+                        blocked_workers=self._blocked_count,
+                        soft_seconds=state_seconds[MemoryState.SOFT],
+                        hard_seconds=state_seconds[MemoryState.HARD])
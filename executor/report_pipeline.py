@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+
+from bl.log import getLogger
+from bl.settings import Settings
+
+log = getLogger(__name__)
+
+_STOP = object()
+
+
+class ReportPipeline:
+    """
+    Writes test reports in background threads, so workers do not spend their time on report I/O.
+    Queue of results is bounded: when writers can not keep up, submit blocks workers (back-pressure)
+    """
+    def __init__(self, writers=None, queue_size=None):
+        self.writers = writers or Settings.get('report_writers', with_type=int, default=2)
+        self.queue_size = queue_size or Settings.get('report_queue_size', with_type=int, default=100)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self._submitted_count = 0
+        self._written_count = 0
+        self._failed_count = 0
+        self._blocked_count = 0
+        self._blocked_seconds = 0.0
+        self._max_depth = 0
+        self.threads = [threading.Thread(target=self._thread_func, name='ReportWriter:%d' % index)
+                        for index in range(self.writers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    # threads do not survive fork and could not be pickled, so pipeline is restarted in another process
+    def __getstate__(self):
+        return dict(writers=self.writers, queue_size=self.queue_size)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def submit(self, result):
+        """
+        Put result to queue of reports to write. Blocks while queue is full
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        try:
+            self.queue.put_nowait(result)
+        except queue.Full:
+            started = time.monotonic()
+            self.queue.put(result)
+            with self._lock:
+                self._blocked_count += 1
+                self._blocked_seconds += time.monotonic() - started
+        with self._lock:
+            self._submitted_count += 1
+            self._max_depth = max(self._max_depth, self.queue.qsize())
+
+    def _thread_func(self):
+        while True:
+            result = self.queue.get()
+            try:
+                if result is _STOP:
+                    return
+                result.write_report()
+                with self._lock:
+                    self._written_count += 1
+            except Exception:
+                log.exception('ReportPipeline: cant write report')
+                with self._lock:
+                    self._failed_count += 1
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Wait until all submitted reports are written
+        """
+        log.info('ReportPipeline.flush %d reports in queue' % self.queue.qsize())
+        self.queue.join()
+
+    def stop(self):
+        self.flush()
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self._pid = None  # pipeline is started again on next submit
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(queue_depth=self.queue.qsize(),
+                        max_queue_depth=self._max_depth,
+                        queue_size=self.queue_size,
+                        submitted=self._submitted_count,
+                        written=self._written_count,
+                        failed=self._failed_count,
+                        blocked=self._blocked_count,
+                        blocked_seconds=self._blocked_seconds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,258 @@
+import itertools
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+import zlib
+from urllib.parse import urljoin
+
+import requests
+from bl.log import getLogger
+from bl.paths import Paths
+from bl.settings import Settings
+from requests.adapters import HTTPAdapter
+
+log = getLogger(__name__)
+
+_STOP = object()
+
+
+class UploadItem:
+    """
+    Report prepared for upload: form fields and compressed html content
+    """
+    def __init__(self, fields, filename, content):
+        self.fields = fields
+        self.filename = filename
+        self.content = content
+
+
+def compress_file(path, chunk_size=1024 * 1024):
+    compressor = zlib.compressobj()
+    chunks = []
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    return b''.join(chunks)
+
+
+class ReportUploader:
+    """
+    Uploads stress reports to manager over pooled keep-alive connections.
+    Reports are sent by background thread in batches of up to report_upload_batch reports:
+    single report is posted to /reports as before, several ones are posted to /reports/batch with
+    'reports' field holding JSON list of report fields and 'content' files in the same order.
+    When manager is unavailable reports are spooled to disk and replayed after next successful upload
+    """
+    def __init__(self, batch_size=None, batch_delay=None, spool_dir=None, queue_size=None, timeout=None):
+        self.batch_size = batch_size or Settings.get('report_upload_batch', with_type=int, default=1)
+        self.batch_delay = batch_delay or Settings.get('report_upload_delay', with_type=float, default=0.5)
+        self.spool_dir = spool_dir or os.path.join(Paths.reports(), 'upload_spool')
+        self.timeout = timeout or Settings.get('report_upload_timeout', with_type=float, default=30)
+        self.queue_size = queue_size or Settings.get('report_upload_queue', with_type=int, default=1000)
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self._lock = threading.Lock()
+        self._thread_lock = threading.Lock()  # upload thread is started and stopped under it
+        self._thread = None
+        self._spool_sequence = itertools.count()
+        self._uploaded_count = 0
+        self._requests_count = 0
+        self._failed_count = 0
+        self._spooled_count = 0
+        self._replayed_count = 0
+        self._lost_count = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    # session, queue and thread could not be pickled, so uploader is created again in another process
+    def __getstate__(self):
+        return dict(batch_size=self.batch_size, batch_delay=self.batch_delay, spool_dir=self.spool_dir,
+                    queue_size=self.queue_size, timeout=self.timeout)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def submit(self, saved_report, fields):
+        """
+        Compress saved html report, delete it and queue it for upload
+        :param saved_report: SavedReport
+        :param fields: form fields of report
+        """
+        item = UploadItem(fields=fields, filename=saved_report.filename, content=compress_file(saved_report.full_path))
+        saved_report.delete()
+        with self._thread_lock:  # stopped queue is replaced under lock, so item is never queued behind sentinel
+            self._ensure_started()
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+        log.warning('ReportUploader: upload queue is full, spooling %s' % item.filename)
+        self._spool([item])
+
+    def _ensure_started(self):
+        # should be called with _thread_lock
+        if not self._thread:
+            self._thread = threading.Thread(target=self._thread_func, args=(self.queue,), name='ReportUploader')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _thread_func(self, items):
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    batch = [items.get(timeout=self.batch_delay * 10)]
+                except queue.Empty:
+                    self._replay_spool()
+                    continue
+                deadline = time.monotonic() + self.batch_delay
+                while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                    try:
+                        batch.append(items.get(timeout=max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        break
+                if batch[-1] is _STOP:
+                    stopping = True
+                    batch.pop()
+                if batch:
+                    if self._upload(batch):
+                        self._replay_spool()
+                    else:
+                        self._spool(batch)
+        except Exception:
+            log.exception('ReportUploader: upload thread failed')
+        finally:
+            # uploader is started again by next submit if thread died
+            with self._thread_lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _upload(self, batch):
+        manager_url = Settings.manager_url
+        started = time.monotonic()
+        try:
+            if len(batch) == 1:
+                item = batch[0]
+                response = self.session.post(urljoin(manager_url, '/reports'),
+                                             data=item.fields,
+                                             files=[('content', (item.filename, item.content, 'application/gzip'))],
+                                             timeout=self.timeout)
+            else:
+                response = self.session.post(urljoin(manager_url, '/reports/batch'),
+                                             data={'reports': json.dumps([item.fields for item in batch])},
+                                             files=[('content', (item.filename, item.content, 'application/gzip'))
+                                                    for item in batch],
+                                             timeout=self.timeout)
+            response.raise_for_status()
+        except Exception:
+            log.exception('Warning: Cant upload %d reports to manager' % len(batch))
+            with self._lock:
+                self._failed_count += 1
+            return False
+        latency = time.monotonic() - started
+        with self._lock:
+            self._requests_count += 1
+            self._uploaded_count += len(batch)
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+        return True
+
+    def _spool(self, batch):
+        spooled_count = 0
+        for item in batch:
+            # names are ordered by spool time, so reports are replayed in order they were spooled
+            path = os.path.join(self.spool_dir, '%020d_%010d_%d.report' % (time.time() * 1e6, next(self._spool_sequence),
+                                                                            os.getpid()))
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                with open(path + '.tmp', 'wb') as file:
+                    pickle.dump(item, file)
+                os.replace(path + '.tmp', path)
+            except Exception:
+                log.exception('Warning: Cant spool report %s, it is lost' % item.filename)
+                with self._lock:
+                    self._lost_count += 1
+                continue
+            spooled_count += 1
+        with self._lock:
+            self._spooled_count += spooled_count
+        log.warning('ReportUploader: %d reports spooled to %s' % (spooled_count, self.spool_dir), extra={'to_console': True})
+
+    def _spooled_files(self):
+        if not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(os.path.join(self.spool_dir, name) for name in os.listdir(self.spool_dir) if name.endswith('.report'))
+
+    def _replay_spool(self):
+        spooled_files = self._spooled_files()
+        for start in range(0, len(spooled_files), self.batch_size):
+            paths = spooled_files[start:start + self.batch_size]
+            batch = []
+            for path in list(paths):
+                try:
+                    with open(path, 'rb') as file:
+                        batch.append(pickle.load(file))
+                except Exception:
+                    log.exception('Warning: Cant read spooled report %s, moving it aside' % path)
+                    self._move_aside(path)
+                    paths.remove(path)
+            if not batch:
+                continue
+            if not self._upload(batch):
+                return
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    log.exception('Warning: Cant remove replayed report %s' % path)
+            with self._lock:
+                self._replayed_count += len(batch)
+            log.info('ReportUploader: replayed %d spooled reports' % len(batch))
+
+    def _move_aside(self, path):
+        # broken file is renamed so it is not replayed again and again, but is kept for investigation
+        try:
+            os.replace(path, path + '.broken')
+        except OSError:
+            log.exception('Warning: Cant move aside spooled report %s' % path)
+        with self._lock:
+            self._lost_count += 1
+
+    def stop(self):
+        """
+        Upload or spool queued reports and stop upload thread. Uploader is started again on next submit
+        """
+        # thread gets its own queue with sentinel, so reports submitted while it stops go to a new thread
+        with self._thread_lock:
+            thread, items = self._thread, self.queue
+            if not thread:
+                return
+            self._thread = None
+            self.queue = queue.Queue(maxsize=self.queue_size)
+        if not thread.is_alive():
+            return
+        try:
+            items.put(_STOP, timeout=self.timeout)
+        except queue.Full:
+            log.warning('ReportUploader: upload thread is stuck, %d reports are not uploaded' % items.qsize())
+            return
+        thread.join()
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(queue_depth=self.queue.qsize(),
+                        uploaded=self._uploaded_count,
+                        requests=self._requests_count,
+                        failed_requests=self._failed_count,
+                        spooled=self._spooled_count,
+                        replayed=self._replayed_count,
+                        lost=self._lost_count,
+                        latency_avg=self._latency_total / self._requests_count if self._requests_count else 0.0,
+                        latency_max=self._latency_max)
@@ -1,14 +1,13 @@
 import datetime
+import json
 import os
 import sys
+import threading
+import time
 import unittest
-import zlib
 from traceback import format_exception
-from urllib.parse import urljoin
-from xml.sax.saxutils import escape as sax_escape
 
 import bl.log
-import requests
 from bl import helpers
 from bl.accountpool import AccountPoolException
 from bl.assertions import Assert
@@ -20,7 +19,10 @@ from bl.settings import Settings
 from bl.step import step
 from bl.utils.ignore_exception import SuppressExceptions
 
-from .html_report import HtmlReport
+from .html_report import HtmlReport, StreamingHtmlReport
+from .junit_xml import JUnitXmlWriter, escape
+from .log_retention import LogRetention
+from .report_uploader import ReportUploader
 
 log = bl.log.getLogger(__name__)
 
@@ -30,16 +32,13 @@ class ReportType:
     HTML = 'html'
 
 
-def escape(text):
-    return sax_escape(text, entities={"'": '&#39;', '"': '&#34;', '\n': '&#10;'})
-
-
 class Attachment:
     """
     Attachment represents files attached to test result
     """
     def __init__(self, path):
         self.path = path
+        self.prepared = False
 
     # make object hashable(so we can use it in set) with __hash__ and __eq__
     def __hash__(self):
@@ -48,7 +47,20 @@ class Attachment:
     def __eq__(self, other):
         return self.path == other
 
+    def processed(self, path):
+        """
+        Use file produced by AttachmentProcessor instead of original one
+        """
+        original_file_name = self.path
+        self.path = path
+        self.prepared = True
+        if path != original_file_name:
+            self.remove(original_file_name)
+
     def _prepare(self, need_attachment):
+        if self.prepared:
+            return
+        self.prepared = True
         from bl.telco.voice_file import Lame
         original_file_name = self.path
         path_base, ext = os.path.splitext(original_file_name)
@@ -104,6 +116,31 @@ class Attachment:
             return 0
 
 
+class StepTiming:
+    """
+    Monotonic start and end time of test step
+    """
+    def __init__(self, number, description, start, end=None):
+        self.number = number
+        self.description = description
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def as_dict(self, origin):
+        """
+        :param origin: monotonic time of test start, step times are reported relative to it
+        """
+        return dict(number=self.number,
+                    description=self.description,
+                    start=round(self.start - origin, 6),
+                    end=None if self.end is None else round(self.end - origin, 6),
+                    duration=None if self.end is None else round(self.duration, 6))
+
+
 class ResultType:
     """
     Type of result
@@ -123,21 +160,45 @@ class Result:
     Skip = ResultType('skipped', 'SKIP')
     Failure = ResultType('failure', 'FAIL')
 
+    @staticmethod
+    def type_by_report_format(report_format):
+        for result_type in (Result.Unknown, Result.Error, Result.Success, Result.Skip, Result.Failure):
+            if result_type.report_format == report_format:
+                return result_type
+        return Result.Unknown
+
     class Factory:
+        mode = 'local'
 
-        def __init__(self, run_number):
+        def __init__(self, run_number, report_pipeline=None, log_retention=None, attachment_processor=None):
             self.run_number = run_number
+            self.report_pipeline = report_pipeline
+            self.log_retention = log_retention or LogRetention.from_settings(self.mode)
+            self.attachment_processor = attachment_processor
 
         def __call__(self):
-            result = Result(run_number=self.run_number)
+            result = Result(run_number=self.run_number, report_pipeline=self.report_pipeline,
+                            log_retention=self.log_retention, attachment_processor=self.attachment_processor)
             return result
 
-    def __init__(self, run_number):
+    attachments_in_report = True  # attachments are listed in XML report, so they are processed before it is written
+
+    def __init__(self, run_number, report_pipeline=None, log_retention=None, attachment_processor=None):
         context().result = self
         self.result = Result.Unknown
-        self.log = []
+        self.log_retention = log_retention or LogRetention()
+        self.logs = self.log_retention.create_store()
+        # streamed html report gets every kept line as it is captured, so its log tree is never kept in memory.
+        # Log retention applied at the end of test shortens only XML report log then
+        self._streaming_html_report = None
+        if Settings.get('html_report_streaming', with_type=bool, default=False):
+            self._streaming_html_report = StreamingHtmlReport()
+            self.logs.stream_to(self._streaming_html_report)
         self.start_time = datetime.datetime.now()
         self.stop_time = datetime.datetime.now()
+        self.start_monotonic = time.monotonic()
+        self.steps = []
+        self.on_step = None  # callback(result) called when current step changes
         self.attachments = set()
         self.group_name = 'GROUP_NAME'
         self.exception_message = ''
@@ -147,13 +208,38 @@ class Result:
         self.testcase_id = ''
         self.run_id = ''
         self.run_number = run_number
+        self.report_pipeline = report_pipeline
+        self.report_writer = None  # callback(result) which saves report instead of test thread, e.g. for coroutine tests
+        self.attachment_processor = attachment_processor
+        self.report_saved = threading.Event()
         self.arguments = {}
         self.call_ids = set()
         self.current_step = None
-        self.html_report = HtmlReport()
         step(0, f'Starting test on %s[%s]' % (helpers.get_hostname(), helpers.local_ip_address()))
 
+    @property
+    def current_step(self):
+        return self._current_step
+
+    @current_step.setter
+    def current_step(self, value):
+        now = time.monotonic()
+        self._finish_step(now)
+        self._current_step = value
+        if value is not None:
+            self.steps.append(StepTiming(number=value.number, description=value.description, start=now))
+        if self.on_step:
+            self.on_step(self)
+
+    def _finish_step(self, now):
+        if self.steps and self.steps[-1].end is None:
+            self.steps[-1].end = now
+
+    def steps_as_dicts(self):
+        return [step_timing.as_dict(self.start_monotonic) for step_timing in self.steps]
+
     def stop_report(self, result, exc_info=None):
+        self._finish_step(time.monotonic())
         self.stop_time = datetime.datetime.now()
         self.result = result
         if exc_info:
@@ -161,22 +247,29 @@ class Result:
             self.exception_message = Assert.format_exception_message(value)
             self.exception_traceback = ''.join(format_exception('', None, traceback)[:-1])
             self.failure_group_type, _, _ = self.exception_message.partition('.')
+        self.log_retention.apply(self.logs, passed=result == Result.Success)
 
     def get_result(self):
         return self.result
 
     def add_log(self, id, level, message):
-        self.log.append('%s [%-25.25s] %s - %s\n' % (Result.current_time(),
-                                                     id,
-                                                     level,
-                                                     message.replace('\n',
-                                                                     '\n                                                ')))
+        self.logs.write_log(module_name=id, level=level, message=message)
 
-        self.html_report.write_log(module_name=id, level=level, message=message)
+    @property
+    def html_report(self):
+        # log levels are nested through html_report by logging code, entries are rendered to HTML on save
+        return self.logs
+
+    @property
+    def log(self):
+        """
+        Log lines of XML report, rendered on access
+        """
+        return list(self.logs.iter_text())
 
     @staticmethod
     def current_time():
-        return datetime.datetime.now().strftime('%H:%M:%S.%f')[:-3]
+        return HtmlReport.current_time()
 
     def attach(self, path):
         log.info('Attaching %s' % path)
@@ -189,67 +282,79 @@ class Result:
                                                          (self.testcase_id, arguments, self.run_id, self.run_number,
                                                           report_type)))
 
+    def write_report(self):
+        """
+        Create report and clean up attachments. Called by worker or by ReportPipeline.
+        Attachments which have handler in attachment_processor are processed in its pool first,
+        then report is written from callback of processor
+        """
+        attachments = []
+        try:
+            if self.attachment_processor and self.attachments_in_report and self.need_attachment():
+                attachments = [attachment for attachment in self.attachments
+                               if not attachment.prepared and self.attachment_processor.handler(attachment.path)]
+        except Exception:
+            log.exception('Cant process attachments in background, they are processed with report')
+        if attachments:
+            self.attachment_processor.process(attachments, on_done=self._write_report)
+        else:
+            self._write_report()
+
+    def _write_report(self):
+        try:
+            self.create_report()
+            self._remove_attachments()
+        finally:
+            self.report_saved.set()
+
     def create_report(self):
         saved_report = self._create_html_report()
         self._create_xml_report(saved_report.full_path)
 
     def _create_html_report(self):
-        return self.html_report.save(filename=self._report_file_name(report_type=ReportType.HTML),
-                                     test_id=self.testcase_id,
-                                     arguments=['%s=%s' % (key, value) for key, value in list(self.arguments.items())],
-                                     class_name=self.class_name,
-                                     groups=[self.group_name],
-                                     result=self.result.console_format,
-                                     exception=self.exception_message,
-                                     start_time=self.start_time.isoformat(timespec='microseconds'),
-                                     traceback=self.exception_traceback,
-                                     call_ids=list(self.call_ids),
-                                     short_exception_message=self.short_exception_message)
+        html_report = self._streaming_html_report or self.logs.replay(HtmlReport())
+        try:
+            return html_report.save(filename=self._report_file_name(report_type=ReportType.HTML),
+                                    test_id=self.testcase_id,
+                                    arguments=['%s=%s' % (key, value) for key, value in list(self.arguments.items())],
+                                    class_name=self.class_name,
+                                    groups=[self.group_name],
+                                    result=self.result.console_format,
+                                    exception=self.exception_message,
+                                    start_time=self.start_time.isoformat(timespec='microseconds'),
+                                    traceback=self.exception_traceback,
+                                    call_ids=list(self.call_ids),
+                                    steps=self.steps_as_dicts(),
+                                    short_exception_message=self.short_exception_message)
+        finally:
+            if self._streaming_html_report:
+                self._streaming_html_report.close()
 
     def _create_xml_report(self, html_attachment):
-        failure_text = ''
-        if self.result != Result.Success:
-            failure_content = '    <%(result_type)s type=\"%(result_type)s\" message=\"%(message)s\"><![CDATA[\n%(trace_back)s]]></%(result_type)s>'
-            failure_text = failure_content % dict(result_type=escape(self.result.report_format),
-                                                  message=escape(self.exception_message),
-                                                  trace_back=self.exception_traceback)
-        properties_text = ''
-        if self.arguments:
-            properties_text = '<properties>%s</properties>' % ''.join(
-                ['<property name="%s" value="%s"/>' % (k, v) for k, v in self.arguments.items()])
-
-        xml_attachments = [attach.as_xml(self.need_attachment()) for attach in self.attachments]
-        xml_attachments.append(Attachment(html_attachment).as_xml(need_attachment=True))
-        files_text = '<files>%s</files>' % '\n'.join(xml_attachments)
-
-        xml_template = '''<?xml version="1.0" encoding="UTF-8"?>
-        <testsuite errors=\"%(errors)d\" failures=\"%(failures)d\" skipped=\"%(skipped)d\"  name=\"bl.infra.testcase.common.PjacTestSuite\" tests=\"1\" time=\"%(time)d\">
-  <testcase classname=\"%(classname)s\" name=\"%(testcaseid)s\" testcaseid=\"%(testcaseid)s\" testrun=\"%(testrun)s\" timestamp=\"%(start_time)s\" time=\"%(time)s\" groups=\"%(groups)s\" run=\"%(run)s\">
-    %(properties)s
-    %(failure_text)s<system-out><![CDATA[\n%(log)s]]></system-out>
-    <system-err><![CDATA[]]></system-err>
-    %(files_text)s
-  </testcase>
-</testsuite>
-'''
-        log = ''.join(self.log)
-        xml_content = xml_template % dict(errors=int(self.result == Result.Error),
-                                          failures=int(self.result == Result.Failure),
-                                          skipped=int(self.result == Result.Skip),
-                                          time=(datetime.datetime.now() - self.start_time).total_seconds(),
-                                          classname=escape(self.class_name),
-                                          testcaseid=escape(self.testcase_id),
-                                          testrun=escape(self.run_id),
-                                          start_time=escape(self.start_time.strftime('%Y-%m-%d_%H-%M-%S')),
-                                          groups=self.group_name,
-                                          run=self.run_number,
-                                          failure_text=failure_text,
-                                          log=log,
-                                          files_text=files_text,
-                                          properties=properties_text)
         filename = self._report_file_name(report_type=ReportType.XML)
         with open(filename, 'w', encoding='utf-8') as file:
-            file.write(xml_content)
+            writer = JUnitXmlWriter(file)
+            writer.start(errors=int(self.result == Result.Error),
+                         failures=int(self.result == Result.Failure),
+                         skipped=int(self.result == Result.Skip),
+                         time=(datetime.datetime.now() - self.start_time).total_seconds(),
+                         classname=self.class_name,
+                         testcase_id=self.testcase_id,
+                         testrun=self.run_id,
+                         timestamp=self.start_time.strftime('%Y-%m-%d_%H-%M-%S'),
+                         groups=self.group_name,
+                         run=self.run_number)
+            writer.properties(self.arguments)
+            writer.steps(self.steps_as_dicts())
+            if self.result != Result.Success:
+                writer.failure(result_type=self.result.report_format,
+                               message=self.exception_message,
+                               traceback=self.exception_traceback)
+            writer.system_out(self.logs.iter_text())
+            need_attachment = self.need_attachment()
+            writer.files([attach.as_xml(need_attachment) for attach in self.attachments] +
+                         [Attachment(html_attachment).as_xml(need_attachment=True)])
+            writer.end()
 
     def need_attachment(self):
         # If test fails store attachments. If test pass store only if Settings.attachments_in_passed is enabled
@@ -288,18 +393,42 @@ class Result:
             self.stop_report(result=Result.Failure, exc_info=sys.exc_info())
         else:
             self.stop_report(result=Result.Error, exc_info=sys.exc_info())
-        self.create_report()
-        self._remove_attachments()
+        if self.report_writer:
+            self.report_writer(self)
+        else:
+            self.save_report()
         return True
 
+    def save_report(self):
+        """
+        Write report or pass it to report pipeline
+        """
+        if self.report_pipeline:
+            self.report_pipeline.submit(self)
+        else:
+            self.write_report()
+
+
+class ResultSummary:
+    """
+    Lightweight result of test which was executed in another process
+    """
+    def __init__(self, result, exception_message='', steps=None):
+        self.result = result
+        self.exception_message = exception_message
+        self.steps = steps or []
+
+    def get_result(self):
+        return self.result
+
 
 class ServiceResult(Result):
-    class Factory:
-        def __init__(self, run_number):
-            self.run_number = run_number
+    class Factory(Result.Factory):
+        mode = 'service'
 
         def __call__(self):
-            return ServiceResult(run_number=self.run_number)
+            return ServiceResult(run_number=self.run_number, report_pipeline=self.report_pipeline,
+                                 log_retention=self.log_retention, attachment_processor=self.attachment_processor)
 
     def _report_file_name(self, report_type=ReportType.XML):
         return '%s_%s.%s' % (self.testcase_id, self.run_id, report_type)
@@ -307,37 +436,46 @@ class ServiceResult(Result):
 
 class StressResult(Result):
     class Factory(Result.Factory):
+        mode = 'stress'
 
-        def __init__(self, *args, **kwargs):
+        def __init__(self, *args, uploader=None, **kwargs):
             super(StressResult.Factory, self).__init__(*args, **kwargs)
             self.stress_run_id = None
+            # reports are uploaded only when manager is configured, otherwise they are kept locally
+            self.uploader = uploader or (ReportUploader() if getattr(Settings, 'manager_url', None) else None)
 
         def __call__(self):
-            result = StressResult(run_number=self.run_number, stress_run_id=self.stress_run_id)
+            result = StressResult(run_number=self.run_number,
+                                  stress_run_id=self.stress_run_id,
+                                  report_pipeline=self.report_pipeline,
+                                  uploader=self.uploader,
+                                  log_retention=self.log_retention,
+                                  attachment_processor=self.attachment_processor)
             return result
 
-    def __init__(self, run_number, stress_run_id):
-        super(StressResult, self).__init__(run_number=run_number)
+    attachments_in_report = False  # only HTML report is uploaded
+
+    def __init__(self, run_number, stress_run_id, report_pipeline=None, uploader=None, log_retention=None,
+                 attachment_processor=None):
+        super(StressResult, self).__init__(run_number=run_number, report_pipeline=report_pipeline,
+                                           log_retention=log_retention, attachment_processor=attachment_processor)
         self.stress_run_id = stress_run_id
+        self.uploader = uploader
 
     def create_report(self):
+        saved_html_report = None
         try:
-            result = self.result.console_format.lower()
             saved_html_report = self._create_html_report()
-
-            response = requests.post(urljoin(Settings.manager_url, '/reports'),
-                                     data={'message': self.short_exception_message,
-                                           'result_type': result,
-                                           'run_id': self.stress_run_id,
-                                           'testcase_id': self.testcase_id,
-                                           'finished_time': self.stop_time.isoformat()},
-                                     files=[('content', (saved_html_report.filename,
-                                                         zlib.compress(saved_html_report.content.encode()),
-                                                         'application/gzip'))])
-            response.raise_for_status()
-            saved_html_report.delete()
+            if not self.uploader:
+                return
+            self.uploader.submit(saved_html_report, fields={'message': self.short_exception_message,
+                                                            'result_type': self.result.console_format.lower(),
+                                                            'run_id': self.stress_run_id,
+                                                            'testcase_id': self.testcase_id,
+                                                            'finished_time': self.stop_time.isoformat(),
+                                                            'steps': json.dumps(self.steps_as_dicts())})
         except Exception as e:
-            log.exception('Warning: Cant upload report %s to manager' % saved_html_report.full_path)
-            log.warning('Warning: Cant upload report %s to manager)' % saved_html_report.full_path,
+            report_path = saved_html_report.full_path if saved_html_report else self.testcase_id
+            log.exception('Warning: Cant upload report %s to manager' % report_path)
+            log.warning('Warning: Cant upload report %s to manager)' % report_path,
                         {'to_console': True})
-
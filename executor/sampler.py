@@ -0,0 +1,114 @@
+import math
+import random
+from numbers import Number
+
+from bl.assertions import PjacError
+
+
+class WeightedSampler:
+    """
+    Weighted random choice of item in O(1) per draw (Vose's alias method).
+    Weights are validated and normalised, so they do not have to sum up to 100
+    """
+    def __init__(self, items_weights):
+        """
+        :param items_weights: list of (item, weight) pairs
+        """
+        self.items_weights = list(items_weights)
+        if not self.items_weights:
+            raise PjacError('Testcases mix is empty', verbose=False)
+        for item, weight in self.items_weights:
+            if isinstance(weight, bool) or not isinstance(weight, Number) or not math.isfinite(weight) or weight < 0:
+                raise PjacError('Invalid weight %r of %s' % (weight, item), verbose=False)
+        total = float(sum(weight for _, weight in self.items_weights))
+        if total <= 0:
+            raise PjacError('Sum of testcases weights should be greater 0', verbose=False)
+
+        self.items = [item for item, _ in self.items_weights]
+        self.probabilities = [weight / total for _, weight in self.items_weights]
+        self._prob, self._alias = self._build_tables(self.probabilities)
+
+    @staticmethod
+    def _build_tables(probabilities):
+        count = len(probabilities)
+        prob = [0.0] * count
+        alias = list(range(count))
+        scaled = [p * count for p in probabilities]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        for i in small + large:  # leftovers are 1.0 up to rounding error
+            prob[i] = 1.0
+        return prob, alias
+
+    def sample(self):
+        """
+        Return one random item
+        """
+        # one uniform number gives both column and coin toss
+        position = random.random() * len(self._prob)
+        column = int(position)
+        return self.items[column] if position - column < self._prob[column] else self.items[self._alias[column]]
+
+    def sample_many(self, count):
+        """
+        Return list of count random items
+        """
+        items, prob, alias, size = self.items, self._prob, self._alias, len(self._prob)
+        result = []
+        for position in (random.random() * size for _ in range(count)):
+            column = int(position)
+            result.append(items[column] if position - column < prob[column] else items[alias[column]])
+        return result
+
+    @property
+    def percents(self):
+        """
+        Normalised mix as list of (item, percent) pairs
+        """
+        return [(item, probability * 100) for item, probability in zip(self.items, self.probabilities)]
+
+
+class ShuffledRange:
+    """
+    Seeded random permutation of range(count) generated lazily in O(1) memory.
+    Index is encrypted by balanced Feistel network over smallest even bit width which covers count,
+    values outside of range are skipped(cycle walking). Same seed gives same order
+    """
+    ROUNDS = 4
+
+    def __init__(self, count, seed=None):
+        self.count = count
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        half_bits = max((count - 1).bit_length() + 1, 2) // 2
+        self._half_bits = half_bits
+        self._mask = (1 << half_bits) - 1
+        keys = random.Random(self.seed)
+        self._keys = [keys.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    @staticmethod
+    def _round(value, key, mask):
+        value = ((value ^ key) * 0x45d9f3b) & 0xffffffff
+        value = (((value >> 16) ^ value) * 0x45d9f3b) & 0xffffffff
+        return ((value >> 16) ^ value) & mask
+
+    def _encrypt(self, index):
+        left, right = index >> self._half_bits, index & self._mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key, self._mask)
+        return (left << self._half_bits) | right
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            value = self._encrypt(index)
+            while value >= self.count:
+                value = self._encrypt(value)
+            yield value
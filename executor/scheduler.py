@@ -0,0 +1,170 @@
+import collections
+import heapq
+import queue
+import time
+
+from .histogram import Histogram
+
+
+class Priority:
+    HIGH = 0  # interactive service mode actions
+    NORMAL = 1
+    LOW = 2
+
+    NAMES = {HIGH: 'high', NORMAL: 'normal', LOW: 'low'}
+
+
+def parse_weights(value):
+    """
+    Parse tenant weights from string 'tenant:weight,tenant:weight'
+    """
+    weights = {}
+    for item in filter(None, (item.strip() for item in (value or '').split(','))):
+        tenant, weight = item.rsplit(':', 1)
+        weights[tenant.strip()] = float(weight)
+        if weights[tenant.strip()] <= 0:
+            raise ValueError('Weight of tenant %s should be greater 0' % tenant)
+    return weights
+
+
+class _Class:
+    """
+    Tasks of one priority: per tenant FIFO queues and stride scheduler over active tenants.
+    Tenant with lowest pass value is served next, its pass grows by 1/weight per served task
+    """
+    def __init__(self):
+        self.tenants = {}
+        self.heap = []  # (pass, sequence, tenant) of tenants which have tasks
+        self.virtual_time = 0.0
+        self.size = 0
+        self.wait_time = Histogram()
+
+    def put(self, tenant, entry, sequence):
+        tasks = self.tenants.get(tenant)
+        if tasks is None:
+            tasks = self.tenants[tenant] = collections.deque()
+        if not tasks:
+            # tenant which was idle joins at current virtual time, so it can not claim its idle share back
+            heapq.heappush(self.heap, (self.virtual_time, sequence, tenant))
+        tasks.append(entry)
+        self.size += 1
+
+    def get(self, weights):
+        pass_, sequence, tenant = heapq.heappop(self.heap)
+        self.virtual_time = pass_
+        tasks = self.tenants[tenant]
+        entry = tasks.popleft()
+        self.size -= 1
+        if tasks:
+            heapq.heappush(self.heap, (pass_ + 1.0 / weights.get(tenant, 1.0), sequence, tenant))
+        else:
+            del self.tenants[tenant]
+        return entry
+
+    def drain(self, predicate):
+        items = []
+        for tenant, tasks in list(self.tenants.items()):
+            items.extend(task for task, _ in tasks if predicate(task))
+            tasks = collections.deque(entry for entry in tasks if not predicate(entry[0]))
+            if tasks:
+                self.tenants[tenant] = tasks
+            else:
+                del self.tenants[tenant]
+        self.heap = [item for item in self.heap if item[2] in self.tenants]
+        heapq.heapify(self.heap)
+        self.size -= len(items)
+        return items
+
+
+class FairShareQueue(queue.Queue):
+    """
+    Tasks queue with strict priorities between classes and weighted fair sharing between tenants
+    (testcase ids or submitting clients) inside class, so one heavy tenant can not take all workers.
+    Supports clear, drain and put_front. Wait time of tasks is measured per priority class
+    """
+    def __init__(self, maxsize=0, weights=None):
+        self.weights = dict(weights or {})
+        super(FairShareQueue, self).__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._front = collections.deque()
+        self._classes = {priority: _Class() for priority in Priority.NAMES}
+        self._sequence = 0
+
+    def _qsize(self):
+        return len(self._front) + sum(class_.size for class_ in self._classes.values())
+
+    def _put(self, item):
+        task, priority, tenant = item
+        self._sequence += 1
+        self._classes[priority].put(tenant, (task, time.monotonic()), self._sequence)
+
+    def _get(self):
+        if self._front:
+            return self._front.popleft()
+        for priority in sorted(self._classes):
+            class_ = self._classes[priority]
+            if class_.size:
+                task, enqueued = class_.get(self.weights)
+                class_.wait_time.record(time.monotonic() - enqueued)
+                return task
+
+    def push(self, task, priority=Priority.NORMAL, tenant=None, block=True, timeout=None):
+        if priority not in self._classes:
+            raise ValueError('Unknown priority %s' % priority)
+        self.put((task, priority, tenant), block=block, timeout=timeout)
+
+    def set_weight(self, tenant, weight):
+        if weight <= 0:
+            raise ValueError('Weight of tenant %s should be greater 0' % tenant)
+        with self.mutex:
+            self.weights[tenant] = weight
+
+    def clear(self, predicate=None):
+        """
+        Remove items for which predicate is true(all items by default). Return count of removed items
+        """
+        return len(self.drain(predicate))
+
+    def drain(self, predicate=None):
+        """
+        Remove and return items for which predicate is true(all items by default)
+        """
+        predicate = predicate or (lambda task: True)
+        with self.mutex:
+            items = [item for item in self._front if predicate(item)]
+            self._front = collections.deque(item for item in self._front if not predicate(item))
+            for class_ in self._classes.values():
+                items.extend(class_.drain(predicate))
+            return items
+
+    def put_front(self, item, count=1):
+        """
+        Put count copies of item in front of queue, so they are got before queued items of any priority
+        """
+        with self.not_empty:
+            self._front.extendleft([item] * count)
+            self.unfinished_tasks += count
+            self.not_empty.notify(count)
+
+    def put_behind(self, item, predicate):
+        """
+        Put item in front of queue behind leading items for which predicate is true
+        """
+        with self.not_empty:
+            index = 0
+            while index < len(self._front) and predicate(self._front[index]):
+                index += 1
+            self._front.insert(index, item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def get_metrics(self):
+        """
+        Return queue depth and wait time per priority class
+        """
+        with self.mutex:
+            return {Priority.NAMES[priority]: dict(queue_depth=class_.size,
+                                                   tenants=len(class_.tenants),
+                                                   wait_time=class_.wait_time.summary())
+                    for priority, class_ in sorted(self._classes.items())}
@@ -1,18 +1,35 @@
+import time
 import weakref
+from functools import lru_cache
 from importlib import import_module
 from urllib.parse import urljoin
 
+from bl.executor.action_registry import ActionRegistry, ActionSummary
+from bl.executor.file_response import FileResponse
 from bl.executor.load_generator import LoadGenerator
 from bl.executor.result import ReportType
+from bl.executor.scheduler import Priority
 from bl.executor.test import State
 from bl.log import getLogger
+from bl.settings import Settings
 from wheezy.core.json import json_encode
 from wheezy.http import HTTPResponse
+from wheezy.http.response import HTTP_STATUS
 from wheezy.routing import url
 
 log = getLogger(__name__)
 
 
+@lru_cache(maxsize=1024)
+def resolve_class(classname):
+    """
+    Return class by its fullname. Resolved classes are cached, so module import and attribute
+    lookup are done once per classname
+    """
+    from_, import_ = classname.rsplit('.', 1)
+    return getattr(import_module(from_), import_)
+
+
 def instantiate(classname, parameters):
     """
     Method for creation class object by classname
@@ -20,9 +37,7 @@ def instantiate(classname, parameters):
     :param parameters: dict parameters for object
     :return: Initialized object with parameters
     """
-    from_, import_ = classname.rsplit('.', 1)
-    class_ = getattr(import_module(from_), import_)
-    return class_(**parameters)
+    return resolve_class(classname)(**parameters)
 
 
 def create_response(data, status_code):
@@ -32,6 +47,77 @@ def create_response(data, status_code):
     return response
 
 
+STATES_ORDER = [State.NOT_STARTED, State.RUNNING, State.FINISHED]
+
+
+def action_state(action):
+    return State.FINISHED if isinstance(action, ActionSummary) else action.state
+
+
+def action_data(action):
+    """
+    Status of action as it is returned by actions/{action_id}
+    """
+    if isinstance(action, ActionSummary):
+        return dict(result='OK',
+                    status=action.status,
+                    duration=action.duration)
+
+    if action.state == State.NOT_STARTED:
+        return dict(result='OK',
+                    status='NOT_STARTED')
+
+    if action.state == State.RUNNING:
+        # result is created a bit later than test is started
+        current_step = action.result.current_step if action.result else None
+        return dict(status='RUNNING',
+                    result='OK',
+                    current_step_number=current_step.number if current_step else None,
+                    current_step_description=current_step.description if current_step else None)
+
+    return dict(result='OK',
+                status=action.result.result.console_format)
+
+
+class EventStreamResponse(HTTPResponse):
+    """
+    Server-sent events stream of action status. Event is sent on every change of state or step,
+    stream is finished after action is finished or evicted
+    """
+    def __init__(self, actions, run_id, keepalive=15):
+        super(EventStreamResponse, self).__init__(content_type='text/event-stream; charset=UTF-8')
+        self.actions = actions
+        self.run_id = run_id
+        self.keepalive = keepalive
+
+    def __call__(self, start_response):
+        self.headers.append(('Cache-Control', 'no-cache'))
+        start_response(HTTP_STATUS[self.status_code], self.headers)
+        return self._events()
+
+    def _events(self):
+        # client is counted as waiter while stream is open, not only while it waits for change
+        self.actions.add_waiter()
+        try:
+            last_data = None
+            while True:
+                action = self.actions.wait(self.run_id, lambda action: action_data(action) != last_data,
+                                           timeout=self.keepalive, counted=False)
+                if action is None:
+                    yield b'event: evicted\ndata: {}\n\n'
+                    return
+                data = action_data(action)
+                if data == last_data:
+                    yield b': keepalive\n\n'  # comment line, lets server notice disconnected client
+                    continue
+                last_data = data
+                yield ('event: status\ndata: %s\n\n' % json_encode(data)).encode()
+                if action_state(action) == State.FINISHED:
+                    return
+        finally:  # generator is closed by server when client disconnects
+            self.actions.remove_waiter()
+
+
 class ServiceLoadGenerator(LoadGenerator):
     """
     ServiceLoadGenerator generates load for service mode
@@ -41,43 +127,139 @@ class ServiceLoadGenerator(LoadGenerator):
         self.workers = workers
         self.test_factory = test_factory
         self.load_generator = load_generator
-        self.running_tests = {}
+        self.actions = ActionRegistry()
+        self.max_wait = Settings.get('action_max_wait', with_type=float, default=60)
+        # long-polls and event streams hold web server threads, so their count is limited
+        self.max_waiters = Settings.get('action_max_waiters', with_type=int, default=200)
         self.load_generator.path_router.add_routes([url('actions', self.on_post_action),
+                                                    url('actions/batch', self.on_post_actions_batch),
+                                                    url('actions/registry', self.on_get_registry),
                                                     url('actions/{action_id}', self.on_get_action),
-                                                    url('actions/{action_id}/report', self.on_get_action_report)])
+                                                    url('actions/{action_id}/events', self.on_get_action_events),
+                                                    url('actions/{action_id}/report', self.on_get_action_report),
+                                                    url('actions/{action_id}/html_report', self.on_get_action_html_report)])
+
+    def _action_not_found(self, run_id):
+        if self.actions.is_evicted(run_id):
+            return create_response(data=dict(result='ERROR',
+                                             error_description='Action was evicted'),
+                                   status_code=410)
+        return create_response(data=dict(result='ERROR',
+                                         error_description='Action not found'),
+                               status_code=404)
+
+    def on_get_registry(self, request):
+        return create_response(data=dict(result='OK', **self.actions.get_metrics()), status_code=200)
 
     def on_get_action_report(self, request):
+        return self._report_response(request, report_type=ReportType.XML)
+
+    def on_get_action_html_report(self, request):
+        return self._report_response(request, report_type=ReportType.HTML)
+
+    def _report_response(self, request, report_type):
         run_id = request.environ['route_args'].action_id
-        test = self.running_tests.get(run_id)
-        filename = test.result._report_file_name(report_type=ReportType.XML)
-        with open(filename, 'r', encoding='utf-8') as file:
-            response = HTTPResponse('text/xml; charset=UTF-8')
-            response.write(file.read())
-        return response
+        action = self.actions.get(run_id)
+        if not action:
+            return self._action_not_found(run_id)
+        if not isinstance(action, ActionSummary) or (action.report_saved and not action.report_saved.is_set()):
+            return create_response(data=dict(result='ERROR',
+                                             error_description='Action is not finished'),
+                                   status_code=409)
+        path = action.report_path if report_type == ReportType.XML else action.html_report_path
+        content_type = 'text/xml; charset=UTF-8' if report_type == ReportType.XML else 'text/html; charset=UTF-8'
+        if path is not None:  # path is None for cancelled action
+            try:
+                return FileResponse(path, content_type=content_type, environ=request.environ)
+            except IOError:
+                pass
+        return create_response(data=dict(result='ERROR',
+                                         error_description='Report not found'),
+                               status_code=404)
 
     def on_post_action(self, request):
         log.info('ServiceLoadGenerator.on_post_action: %s' % request)
-        testcase_id = request.form.get('testcase_id')
-        arguments = {}
+        try:
+            testcase_id, arguments, tenant = self._parse_action(request.form, tenant=None)
+        except ValueError as e:
+            return create_response(data=dict(result='ERROR',
+                                             error_description=str(e)),
+                                   status_code=400)
 
-        for argument_name, pjac_object in request.form.get('args', {}).items():
-            classname, parameters = pjac_object.popitem()
-            arguments[argument_name] = instantiate(classname, parameters)
+        test = self._submit_action(testcase_id, arguments, tenant=tenant)
+        return create_response(data=dict(result='OK', **self._action_urls(test)), status_code=201)
 
-        if not testcase_id:
+    def on_post_actions_batch(self, request):
+        """
+        Submit list of actions [{testcase_id, args}] in one request. Batch is validated and arguments are
+        instantiated before any action is queued, so invalid batch does not leave part of actions running
+        """
+        actions = request.form.get('actions')
+        log.info('ServiceLoadGenerator.on_post_actions_batch: %d actions' % len(actions or []))
+        if not isinstance(actions, list) or not actions:
             return create_response(data=dict(result='ERROR',
-                                             error_description='No testcase_id parameter'),
+                                             error_description='No actions parameter'),
                                    status_code=400)
 
-        log.info('New test %s args[%s]' % (testcase_id, arguments))
-        test = self.test_factory(testcase_id=testcase_id, arguments=arguments, load_generator=weakref.proxy(self))
-        self.workers.push(test)
-        self.running_tests[test.run_id] = test
+        start = time.monotonic()
+        batch = []
+        for index, action in enumerate(actions):
+            try:
+                batch.append(self._parse_action(action, tenant=request.form.get('tenant')))
+            except ValueError as e:
+                return create_response(data=dict(result='ERROR',
+                                                 error_description='%s in action %d' % (e, index)),
+                                       status_code=400)
+
+        tests = [self._submit_action(testcase_id, arguments, tenant) for testcase_id, arguments, tenant in batch]
+        submit_seconds = time.monotonic() - start
+        log.info('ServiceLoadGenerator.on_post_actions_batch: %d actions submitted in %.3fs' %
+                 (len(tests), submit_seconds))
         return create_response(data=dict(result='OK',
-                                         status_url=urljoin(self.load_generator.address, 'actions/%s' % test.run_id),
-                                         report_url=urljoin(self.load_generator.address, 'actions/%s/report' % test.run_id)),
+                                         actions=[self._action_urls(test) for test in tests],
+                                         submit_seconds=round(submit_seconds, 6)),
                                status_code=201)
 
+    @classmethod
+    def _parse_action(cls, action, tenant):
+        """
+        Return (testcase_id, arguments, tenant) of action form. Raise ValueError if action is invalid
+        """
+        testcase_id = action.get('testcase_id') if hasattr(action, 'get') else None
+        if not testcase_id:
+            raise ValueError('No testcase_id parameter')
+        try:
+            arguments = cls._instantiate_arguments(action.get('args', {}))
+        except (ImportError, AttributeError, ValueError, TypeError) as e:
+            raise ValueError('Invalid args(%s)' % e)
+        return testcase_id, arguments, action.get('tenant', tenant)
+
+    @staticmethod
+    def _instantiate_arguments(args):
+        arguments = {}
+        for argument_name, pjac_object in args.items():
+            (classname, parameters), = pjac_object.items()  # form is not changed, so request could be logged later
+            arguments[argument_name] = instantiate(classname, parameters)
+        return arguments
+
+    def _submit_action(self, testcase_id, arguments, tenant=None):
+        """
+        Queue action ahead of bulk tests. Actions of one tenant(submitting client) share workers fairly with
+        other tenants, testcase id is tenant when client is not given
+        """
+        log.info('New test %s args[%s]' % (testcase_id, arguments))
+        test = self.test_factory(testcase_id=testcase_id, arguments=arguments, load_generator=weakref.proxy(self))
+        test.on_started = self.actions.notify
+        test.on_step = self.actions.notify
+        test.on_finished = self.actions.on_finished
+        self.actions.add(test)
+        self.workers.push(test, priority=Priority.HIGH, tenant=tenant)
+        return test
+
+    def _action_urls(self, test):
+        return dict(status_url=urljoin(self.load_generator.address, 'actions/%s' % test.run_id),
+                    report_url=urljoin(self.load_generator.address, 'actions/%s/report' % test.run_id))
+
     def on_get_action(self, request):
         log.info('ServiceLoadGenerator.on_get_action: %s' % request)
         run_id = request.environ['route_args'].action_id
@@ -86,28 +268,41 @@ class ServiceLoadGenerator(LoadGenerator):
                                              error_description='No action_id parameter'),
                                    status_code=400)
 
-        test = self.running_tests.get(run_id)
-        if not test:
-            return create_response(data=dict(result='ERROR',
-                                             error_description='Action not found'),
-                                   status_code=404)
-
-        if test.state == State.NOT_STARTED:
-            return create_response(data=dict(result='OK',
-                                             status='NOT_STARTED'),
-                                   status_code=200)
-
-        if test.state == State.RUNNING:
-            return create_response(data=dict(status='RUNNING',
-                                             result='OK',
-                                             current_step_number=test.result.current_step.number,
-                                             current_step_description=test.result.current_step.description),
-                                   status_code=200)
-
-        if test.state == State.FINISHED:
-            return create_response(data=dict(result='OK',
-                                             status=test.result.result.console_format),
-                                   status_code=200)
+        wait_for = request.get_param('wait_for')
+        if wait_for:
+            if wait_for not in STATES_ORDER:
+                return create_response(data=dict(result='ERROR',
+                                                 error_description='Unknown state %s' % wait_for),
+                                       status_code=400)
+            try:
+                timeout = min(float(request.get_param('timeout') or 30), self.max_wait)
+            except ValueError:
+                return create_response(data=dict(result='ERROR',
+                                                 error_description='Invalid timeout'),
+                                       status_code=400)
+            if self.actions.waiters_count < self.max_waiters:
+                position = STATES_ORDER.index(wait_for)
+                self.actions.wait(run_id,
+                                  lambda action: STATES_ORDER.index(action_state(action)) >= position,
+                                  timeout=timeout)
+
+        action = self.actions.get(run_id)
+        if not action:
+            return self._action_not_found(run_id)
+        return create_response(data=action_data(action), status_code=200)
+
+    def on_get_action_events(self, request):
+        log.info('ServiceLoadGenerator.on_get_action_events: %s' % request)
+        run_id = request.environ['route_args'].action_id
+        if not self.actions.get(run_id):
+            return self._action_not_found(run_id)
+        if self.actions.waiters_count >= self.max_waiters:
+            response = create_response(data=dict(result='ERROR',
+                                                 error_description='Too many waiting clients'),
+                                       status_code=503)
+            response.headers.append(('Retry-After', '1'))
+            return response
+        return EventStreamResponse(self.actions, run_id)
 
     @property
     def total_count(self):
@@ -0,0 +1,247 @@
+import multiprocessing
+import os
+import threading
+
+from bl.log import getLogger
+from bl.settings import Settings
+
+from .result import Result, ResultSummary
+from .scheduler import Priority
+from .test import State
+from .workers_pool import WorkersPool
+
+log = getLogger(__name__)
+
+
+class _ShardLoadGenerator:
+    """
+    Load generator of test running in shard process. Forks are forwarded to parent process
+    """
+    def __init__(self, events, index, run_id):
+        self.events = events
+        self.index = index
+        self.run_id = run_id
+
+    def add_test(self, testcase_id, arguments=None):
+        self.events.put(('fork', self.index, self.run_id, testcase_id, arguments))
+
+    @property
+    def total_count(self):
+        return None
+
+    @property
+    def finished_count(self):
+        return None
+
+
+def _shard_main(index, test_factory, tasks, events):
+    """
+    Entry point of shard process: runs own WorkersPool and executes commands received from parent
+    """
+    def on_started(test):
+        events.put(('started', index, test.run_id))
+
+    def on_finished(test):
+        result = test.result.get_result() if test.result else Result.Unknown
+        steps = test.result.steps if test.result else []
+        events.put(('finished', index, test.run_id, result.report_format, test.duration, steps, test.cancelled))
+
+    log.info('Shard %d started in process %d' % (index, os.getpid()))
+    # reports of shard tests are written by pipeline of result factory copied to shard process
+    result_factory = getattr(test_factory, 'result_factory', None)
+    report_pipeline = getattr(result_factory, 'report_pipeline', None)
+    attachment_processor = getattr(result_factory, 'attachment_processor', None)
+    with WorkersPool(report_pipeline=report_pipeline, attachment_processor=attachment_processor) as workers:
+        while True:
+            command, *args = tasks.get()
+            if command == 'test':
+                run_id, testcase_id, arguments, priority, tenant, stress_run_id, cancelled = args
+                if stress_run_id is not None:  # run id is set to factory of parent process after shard is started
+                    result_factory.stress_run_id = stress_run_id
+                test = test_factory(testcase_id=testcase_id,
+                                    arguments=arguments,
+                                    load_generator=_ShardLoadGenerator(events, index, run_id))
+                test.run_id = run_id
+                test.on_started = on_started
+                test.on_finished = on_finished
+                if cancelled:  # test was shed in parent process before it was dispatched
+                    test.cancel('Test was shed before dispatch')
+                else:
+                    workers.push(test, priority=priority, tenant=tenant)
+            elif command == 'set_threads':
+                workers.set_threads(args[0])
+                events.put(('workers', index, workers.workers_count()))
+            elif command == 'reset':
+                workers.reset()
+                events.put(('workers', index, workers.workers_count()))
+            elif command == 'flush':
+                workers.flush_reports()
+                events.put(('flushed', index))
+            elif command == 'stop':
+                break
+    log.info('Shard %d stopped' % index)
+
+
+class _Shard:
+    """
+    Handle of shard process in parent process
+    """
+    def __init__(self, index, context, test_factory, events):
+        self.index = index
+        self.threads = 0
+        self.workers_count = 0
+        self.running_count = 0
+        self.flushed = threading.Event()
+        self.tasks = context.Queue()
+        self.process = context.Process(target=_shard_main,
+                                       args=(index, test_factory, self.tasks, events),
+                                       name='WorkersShard:%d' % index)
+        self.process.daemon = True
+        self.process.start()
+
+    def __str__(self):
+        return 'Shard[%s:%s]' % (self.index, self.process.pid)
+
+    def send(self, command, *args):
+        self.tasks.put((command,) + args)
+
+
+class ShardedWorkersPool:
+    """
+    Pool of workers spread over several processes to avoid GIL contention.
+    Every shard process runs its own WorkersPool. Tests are dispatched to shards as
+    (run_id, testcase_id, arguments) and recreated there with test_factory, so test_factory
+    should be picklable. Test callbacks and forks are delivered back to tests in this process,
+    so load generators see one logical pool.
+    """
+    def __init__(self, test_factory, count=0, shards=None, flush_timeout=60):
+        self.result_factory = getattr(test_factory, 'result_factory', None)
+        self.flush_timeout = flush_timeout
+        shards = shards or Settings.get('workers_shards', with_type=int, default=os.cpu_count())
+        # default start method of platform is used unless overridden (fork keeps loaded settings and testcases)
+        context = multiprocessing.get_context(Settings.get('workers_shards_start_method', default=None))
+        self.events = context.Queue()
+        self.tests = {}
+        self.tests_lock = threading.Lock()
+        self._finished_count = 0
+        self._failed_count = 0
+        self.shards = [_Shard(index, context, test_factory, self.events) for index in range(shards)]
+        self._events_thread = threading.Thread(target=self._events_func, name='WorkersShardsEvents')
+        self._events_thread.daemon = True
+        self._events_thread.start()
+        self.set_threads(count)
+
+    def push(self, task, priority=Priority.NORMAL, tenant=None):
+        with self.tests_lock:
+            shard = min(self.shards, key=lambda shard: shard.running_count / (shard.threads or 1))
+            shard.running_count += 1
+            self.tests[task.run_id] = task
+        shard.send('test', task.run_id, task.testcase_id, dict(task.arguments), priority, tenant,
+                   getattr(self.result_factory, 'stress_run_id', None), task.cancelled)
+
+    def set_threads(self, thread_count):
+        log.info('ShardedWorkersPool.set_threads %d threads over %d shards' % (thread_count, len(self.shards)))
+        for shard in self.shards:
+            shard.threads = thread_count // len(self.shards) + int(shard.index < thread_count % len(self.shards))
+            shard.send('set_threads', shard.threads)
+
+    def stop(self, bottom_count=0):
+        if bottom_count:
+            self.set_threads(bottom_count)
+            return
+        log.info('ShardedWorkersPool.stop stopping %d shards' % len(self.shards))
+        for shard in self.shards:
+            shard.send('stop')
+        for shard in self.shards:
+            shard.process.join(timeout=60)
+            if shard.process.is_alive():
+                log.warn('ShardedWorkersPool.stop cant stop %s, terminating' % shard)
+                shard.process.terminate()
+        self.events.put(('stop', None))
+        self._events_thread.join()
+
+    def reset(self):
+        with self.tests_lock:
+            log.info('ShardedWorkersPool.reset %d tests are dispatched, clearing' % len(self.tests))
+            self.tests.clear()
+            for shard in self.shards:
+                shard.running_count = 0
+                shard.threads = 0
+        for shard in self.shards:
+            shard.send('reset')
+
+    def flush_reports(self):
+        """
+        Wait until every shard writes reports of its finished tests
+        """
+        for shard in self.shards:
+            shard.flushed.clear()
+            shard.send('flush')
+        for shard in self.shards:
+            if not shard.flushed.wait(timeout=self.flush_timeout):
+                log.warn('ShardedWorkersPool.flush_reports %s did not flush reports in %ss' % (shard,
+                                                                                               self.flush_timeout))
+
+    def workers_count(self):
+        return sum(shard.workers_count for shard in self.shards)
+
+    @property
+    def finished_count(self):
+        with self.tests_lock:
+            return self._finished_count
+
+    @property
+    def failed_count(self):
+        with self.tests_lock:
+            return self._failed_count
+
+    def _events_func(self):
+        while True:
+            event, index, *args = self.events.get()
+            if event == 'stop':
+                break
+            try:
+                getattr(self, '_on_%s' % event)(self.shards[index], *args)
+            except Exception:
+                log.exception('ShardedWorkersPool._events_func: exception on %s event' % event)
+
+    def _on_flushed(self, shard):
+        shard.flushed.set()
+
+    def _on_workers(self, shard, workers_count):
+        shard.workers_count = workers_count
+
+    def _on_started(self, shard, run_id):
+        with self.tests_lock:
+            test = self.tests.get(run_id)
+        if test:
+            test.state = State.RUNNING
+            test.on_started(test)
+
+    def _on_finished(self, shard, run_id, report_format, duration, steps, cancelled):
+        result = Result.type_by_report_format(report_format)
+        with self.tests_lock:
+            test = self.tests.pop(run_id, None)
+            if not test:  # test was dropped by reset
+                return
+            shard.running_count -= 1
+            self._finished_count += 1
+            if result in (Result.Error, Result.Failure):
+                self._failed_count += 1
+        test.result = ResultSummary(result, steps=steps)
+        test.duration = duration
+        test.cancelled = cancelled  # shed in shard, load generators count such tests separately
+        test.on_finished(test)
+        test.state = State.FINISHED
+
+    def _on_fork(self, shard, run_id, testcase_id, arguments):
+        with self.tests_lock:
+            test = self.tests.get(run_id)
+        if test:
+            test.load_generator.add_test(testcase_id=testcase_id, arguments=arguments)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -1,5 +1,6 @@
+from bl.assertions import PjacError
 from bl.executor.load_generator import LoadGenerator
-from bl.executor.stresser import Stresser
+from bl.executor.stresser import Stresser, Distribution
 from bl.log import getLogger
 from wheezy.http import json_response
 from wheezy.routing import url
@@ -7,6 +8,12 @@ from wheezy.routing import url
 log = getLogger(__name__)
 
 
+def error_response(description, status_code=400):
+    response = json_response(dict(result='error', error_description=description))
+    response.status_code = status_code
+    return response
+
+
 class StressLoadGenerator(LoadGenerator):
     """
     StressLoadGenerator implements logic for stress mode
@@ -17,6 +24,9 @@ class StressLoadGenerator(LoadGenerator):
         self.stresser = Stresser(test_factory=test_factory, workers=workers)
         self.load_generator.path_router.add_routes([url('run_tests', self._run_tests),
                                                     url('set_threads', self._set_threads),
+                                                    url('set_rate', self._set_rate),
+                                                    url('set_testcases', self._set_testcases),
+                                                    url('set_concurrency_bounds', self._set_concurrency_bounds),
                                                     url('get_status', self._get_status)])
 
     def _run_tests(self, request):
@@ -26,7 +36,20 @@ class StressLoadGenerator(LoadGenerator):
         threads = request.form['threads']
         tests = request.form['testcases']
         testcases_percents = [(test['id'], test['percent']) for test in tests]
-        self.stresser.run_tests(run_id=run_id, testcases_percents=testcases_percents, threads=threads)
+        try:
+            self.stresser.run_tests(run_id=run_id, testcases_percents=testcases_percents, threads=threads)
+        except PjacError as e:
+            return error_response(e.message)
+        return json_response(dict(result='ok'))
+
+    def _set_testcases(self, request):
+        log.info('ServiceLoadGenerator._set_testcases: %s' % request)
+
+        testcases_percents = [(test['id'], test['percent']) for test in request.form['testcases']]
+        try:
+            self.stresser.set_testcases(testcases_percents)
+        except PjacError as e:
+            return error_response(e.message)
         return json_response(dict(result='ok'))
 
     def _set_threads(self, request):
@@ -35,6 +58,26 @@ class StressLoadGenerator(LoadGenerator):
         self.stresser.set_threads(request.form['threads'])
         return json_response(dict(result='ok'))
 
+    def _set_rate(self, request):
+        log.info('ServiceLoadGenerator._set_rate: %s' % request)
+        try:
+            self.stresser.set_rate(rate=request.form.get('rate'),
+                                   distribution=request.form.get('distribution', Distribution.POISSON))
+        except ValueError as e:
+            return error_response(str(e))
+        return json_response(dict(result='ok'))
+
+    def _set_concurrency_bounds(self, request):
+        log.info('ServiceLoadGenerator._set_concurrency_bounds: %s' % request)
+        try:
+            self.stresser.set_concurrency_bounds(min_threads=request.form.get('min_threads'),
+                                                 max_threads=request.form.get('max_threads'))
+        except PjacError as e:
+            return error_response(e.message, status_code=409)
+        except ValueError as e:
+            return error_response(str(e))
+        return json_response(dict(result='ok'))
+
     def _stop_tests(self, request):
         log.info('ServiceLoadGenerator._stop_tests: %s' % request)
         self.stresser.stop_tests()
@@ -46,4 +89,8 @@ class StressLoadGenerator(LoadGenerator):
         return json_response(dict(result='ok',
                                   status=status,
                                   run_seconds=run_seconds,
-                                  threads=threads))
+                                  threads=threads,
+                                  **self.stresser.get_statistics(reset_latency=bool(request.form.get('reset_latency')))))
+
+    def stop(self):
+        self.stresser.stop()
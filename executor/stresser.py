@@ -1,14 +1,40 @@
 import datetime
 import random
 import threading
+import time
 import weakref
 
+from bl.assertions import PjacError
+from bl.log import getLogger
+from bl.settings import Settings
+
+from .concurrency_controller import ConcurrencyController
+from .histogram import LatencyRecorder
+from .memory_guard import MemoryState
+from .sampler import WeightedSampler
+
+log = getLogger(__name__)
+
 
 class Status:
     IDLE = 'idle'
     RUNNING = 'running'
 
 
+class Distribution:
+    """
+    Inter-arrival time distribution of open model
+    """
+    POISSON = 'poisson'
+    CONSTANT = 'constant'
+
+    @staticmethod
+    def interval(distribution, rate):
+        if distribution == Distribution.POISSON:
+            return random.expovariate(rate)
+        return 1.0 / rate
+
+
 class Stresser:
     """
     Stresser implements stress test execution logic
@@ -17,22 +43,109 @@ class Stresser:
         self.status = Status.IDLE
         self.started = None
         self.workers = workers
-        self.testcases_percents = None
+        self.sampler = None
         self.test_factory = test_factory
         self._finished_count = 0
+        self._cancelled_count = 0  # tests shed by workers pool, they are not counted as finished
+        self._pending_count = 0
         self._counters_lock = threading.RLock()
+        self.latency = LatencyRecorder()
+        self.step_latency = LatencyRecorder()
+        self.rate = None
+        self.distribution = Distribution.POISSON
+        self._rate_cond = threading.Condition()
+        self._rate_generation = 0
+        self._rate_thread = None
+        self._dispatched_count = 0
+        self._scheduler_lag = 0.0
+        self._overloaded = False
+        self._shed_count = 0  # tests of closed model shed by workers pool and not replaced yet
+        self._test_callbacks = (self._on_started, self._on_finished)  # bound once and shared by all tests
+        memory_guard = getattr(workers, 'memory_guard', None)
+        if memory_guard:
+            memory_guard.add_listener(self._on_memory_state)
+        self.controller = None
+        if Settings.get('adaptive_concurrency', with_type=bool, default=False):
+            self.controller = ConcurrencyController(workers=workers, on_change=self._on_threads_changed)
 
     def set_threads(self, threads):
-        self.workers.set_threads(threads)
+        if self.controller and self.status == Status.RUNNING:
+            self.controller.set_threads(threads)
+        else:
+            self.workers.set_threads(threads)
+
+    def set_concurrency_bounds(self, min_threads=None, max_threads=None):
+        """
+        Bound thread count of adaptive concurrency. Raises ValueError for invalid bounds
+        """
+        if not self.controller:
+            raise PjacError('Adaptive concurrency is disabled', verbose=False)
+        self.controller.set_bounds(min_threads=min_threads, max_threads=max_threads)
+
+    def _on_threads_changed(self, previous, target):
+        # in closed model every worker needs test, queued tests are taken by new workers first
+        missing = target - previous - self._pending_count
+        if self.status == Status.RUNNING and not self.rate and missing > 0:
+            self._adjust_running_test(missing)
+
+    def set_rate(self, rate, distribution=Distribution.POISSON):
+        """
+        Switch to open model: new tests are started with fixed arrival rate(tests per second)
+        regardless of how long running tests take. Rate None or not positive switches back to closed model
+        """
+        if distribution not in (Distribution.POISSON, Distribution.CONSTANT):
+            raise ValueError('Unknown distribution %s' % distribution)
+        rate = float(rate) if rate is not None else 0.0  # rate may come as string, and '0' is truthy
+        if not rate > 0:  # negative rate makes schedule go back, so tests are started nonstop
+            rate = None
+        log.info('Stresser.set_rate rate[%s] distribution[%s]' % (rate, distribution))
+        with self._rate_cond:
+            closed_model = not self.rate
+            self.rate = rate
+            self.distribution = distribution
+            self._rate_generation += 1
+            self._rate_cond.notify()
+        if self.status != Status.RUNNING:
+            return
+        if self.rate:
+            self._start_rate_thread()
+        elif not closed_model:
+            self._adjust_running_test()
+
+    @property
+    def testcases_percents(self):
+        sampler = self.sampler
+        return sampler.items_weights if sampler else None
+
+    @testcases_percents.setter
+    def testcases_percents(self, testcases_percents):
+        self.sampler = WeightedSampler(testcases_percents) if testcases_percents is not None else None
+
+    def set_testcases(self, testcases_percents):
+        """
+        Replace testcases mix of running stress. Running tests and workers are not affected
+        """
+        sampler = WeightedSampler(testcases_percents)
+        log.info('Stresser.set_testcases new mix %s' % sampler.percents)
+        self.test_factory.preload(testcase_id for testcase_id, _ in testcases_percents)
+        self.sampler = sampler  # new sampler is built completely before swap, so swap is atomic
 
     def run_tests(self, run_id, testcases_percents, threads=None):
+        self.testcases_percents = testcases_percents
+        self.test_factory.preload(testcase_id for testcase_id, _ in testcases_percents)
         self.test_factory.result_factory.stress_run_id = run_id
         self.status = Status.RUNNING
         self.started = datetime.datetime.now()
-        self.testcases_percents = testcases_percents
 
-        self.workers.set_threads(threads)
-        self._adjust_running_test(threads)
+        if self.controller:
+            self.controller.start(threads)
+            threads = self.controller.target
+        else:
+            self.workers.set_threads(threads)
+        if self.rate:
+            self._start_rate_thread()
+        else:
+            self._adjust_running_test(threads)
 
     def get_status(self):
         """
@@ -48,37 +161,152 @@ class Stresser:
                 run_seconds,
                 self.workers.workers_count())
 
+    def get_statistics(self, reset_latency=False):
+        """
+        returns dict with additional details of stress run
+        :param reset_latency: start new window of test and step latency after read
+        """
+        report_pipeline = getattr(self.test_factory.result_factory, 'report_pipeline', None)
+        uploader = getattr(self.test_factory.result_factory, 'uploader', None)
+        log_retention = getattr(self.test_factory.result_factory, 'log_retention', None)
+        attachment_processor = getattr(self.test_factory.result_factory, 'attachment_processor', None)
+        workers_metrics = getattr(self.workers, 'get_metrics', None)
+        memory_guard = getattr(self.workers, 'memory_guard', None)
+        return dict(rate=self.get_rate_status(),
+                    cancelled=self.cancelled_count,
+                    workers=workers_metrics() if workers_metrics else None,
+                    concurrency=self.controller.get_metrics() if self.controller else None,
+                    memory=memory_guard.get_metrics() if memory_guard else None,
+                    latency=self.latency.summary(reset=reset_latency),
+                    step_latency=self.step_latency.summary(reset=reset_latency),
+                    reports=report_pipeline.get_metrics() if report_pipeline else None,
+                    uploads=uploader.get_metrics() if uploader else None,
+                    logs=log_retention.get_metrics() if log_retention else None,
+                    attachments=attachment_processor.get_metrics() if attachment_processor else None)
+
+    def get_rate_status(self):
+        """
+        returns state of open model scheduling or None for closed model
+        """
+        if not self.rate:
+            return None
+        with self._counters_lock:
+            return dict(rate=self.rate,
+                        distribution=self.distribution,
+                        dispatched=self._dispatched_count,
+                        backlog=self._pending_count,
+                        scheduler_lag=self._scheduler_lag,
+                        overloaded=self._overloaded)
+
     def stop_tests(self):
+        self.stop()
         self.workers.reset()
+        with self._counters_lock:  # queued tests were dropped by reset, they are never started
+            self._pending_count = 0
+            self._overloaded = False
+
+    def stop(self):
+        with self._rate_cond:
+            self.status = Status.IDLE
+            self._rate_cond.notify()
+        if self.controller:
+            self.controller.stop()
+        uploader = getattr(self.test_factory.result_factory, 'uploader', None)
+        if uploader:
+            uploader.stop()
 
     def add_test(self, testcase_id, arguments=None):
         if self.status != Status.RUNNING:
             return
         test = self.test_factory(testcase_id=testcase_id, arguments=arguments, load_generator=weakref.proxy(self))
-        test.on_started = self._on_started
-        test.on_finished = self._on_finished
+        test.on_started, test.on_finished = self._test_callbacks
+        with self._counters_lock:
+            self._pending_count += 1
         self.workers.push(test)
 
     def _on_started(self, test):
-        pass
+        with self._counters_lock:
+            self._pending_count -= 1
+
+    def _on_memory_state(self, state):
+        # tests shed under memory pressure are replaced when memory is back to normal
+        if state != MemoryState.OK or self.status != Status.RUNNING or self.rate:
+            return
+        with self._counters_lock:
+            count, self._shed_count = self._shed_count, 0
+        if count:
+            log.info('Stresser: memory is back to normal, replacing %d shed tests' % count)
+            self._adjust_running_test(count)
 
     def _on_finished(self, test):
         with self._counters_lock:
-            self._finished_count += 1
-        self.add_test(testcase_id=self.get_next_testcase_id())
+            if test.cancelled:
+                self._cancelled_count += 1
+                self._pending_count -= 1  # cancelled test was never started
+                if not self.rate:
+                    self._shed_count += 1
+            else:
+                self._finished_count += 1
+        if test.cancelled:  # test did not run, so it has no latency
+            return
+        self.latency.record(test.testcase_id, test.result.get_result().report_format, test.duration)
+        for step_timing in test.result.steps:
+            self.step_latency.record(test.testcase_id, step_timing.number, step_timing.duration)
+        if not self.rate:
+            self.add_test(testcase_id=self.get_next_testcase_id())
 
     def get_next_testcase_id(self):
-        chance = random.random() * 100
-        current_percent = 0
-        for testcase, percent in self.testcases_percents:
-            current_percent += percent
-            if chance < current_percent:
-                return testcase
+        sampler = self.sampler
+        return sampler.sample() if sampler else None
 
     def _adjust_running_test(self, count=None):
         count = count or self.workers.workers_count()
-        for i in range(count):
-            self.add_test(testcase_id=self.get_next_testcase_id())
+        for testcase_id in self.sampler.sample_many(count):
+            self.add_test(testcase_id=testcase_id)
+
+    def _start_rate_thread(self):
+        with self._rate_cond:
+            if self._rate_thread:
+                return
+            self._rate_thread = threading.Thread(target=self._rate_thread_func, name='StresserRate')
+            self._rate_thread.daemon = True
+            self._rate_thread.start()
+
+    def _rate_thread_func(self):
+        log.info('Stresser arrival scheduler started')
+        generation = None
+        next_time = time.monotonic()
+        while True:
+            with self._rate_cond:
+                while self.rate and self.status == Status.RUNNING and generation == self._rate_generation:
+                    timeout = next_time - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._rate_cond.wait(timeout)
+                if not self.rate or self.status != Status.RUNNING:
+                    self._rate_thread = None
+                    break
+                if generation != self._rate_generation:  # rate was changed, start new schedule from now
+                    generation = self._rate_generation
+                    next_time = time.monotonic()
+                rate, distribution = self.rate, self.distribution
+
+            self._dispatch_scheduled(lag=time.monotonic() - next_time)
+            next_time += Distribution.interval(distribution, rate)
+        log.info('Stresser arrival scheduler stopped')
+
+    def _dispatch_scheduled(self, lag):
+        with self._counters_lock:
+            self._dispatched_count += 1
+            self._scheduler_lag = lag
+            # tests which are waiting for free worker are backlog. If it is bigger than pool, schedule is not kept
+            overloaded = self._pending_count > self.workers.workers_count()
+            if overloaded != self._overloaded:
+                self._overloaded = overloaded
+                message = 'can not keep up with' if overloaded else 'keep up again with'
+                log.warning('Stresser: workers %s %s tests/s (backlog %d)' % (message, self.rate, self._pending_count),
+                            extra={'to_console': True})
+        self.add_test(testcase_id=self.get_next_testcase_id())
 
     @property
     def total_count(self):
@@ -88,3 +316,8 @@ class Stresser:
     def finished_count(self):
         with self._counters_lock:
             return self._finished_count
+
+    @property
+    def cancelled_count(self):
+        with self._counters_lock:
+            return self._cancelled_count
@@ -1,6 +1,15 @@
+import asyncio
+import itertools
+import sys
+import time
+import types
+from contextlib import contextmanager
+from functools import lru_cache
+
 from bl import helpers
 from bl.context import context
-from bl.executor.result import Result
+from bl.executor.result import Result, ResultSummary
+from bl.executor.testcase_index import TestcaseIndex
 
 from bl.log import getLogger
 
@@ -13,14 +22,61 @@ class State:
     FINISHED = 'FINISHED'
 
 
+def _no_callback(test):
+    pass
+
+
+class _TestContext:
+    """
+    Awaitable which runs coroutine of test. Coroutine tests share loop thread and its thread local context,
+    so test and its result are put back to context every time coroutine is resumed
+    """
+    def __init__(self, coroutine, test, result):
+        self.coroutine = coroutine
+        self.test = test
+        self.result = result
+
+    def __await__(self):
+        value, exception = None, None
+        while True:
+            context().thread_data.test = self.test
+            context().result = self.result
+            try:
+                if exception is None:
+                    future = self.coroutine.send(value)
+                else:
+                    future = self.coroutine.throw(exception)
+            except StopIteration as stop:
+                return stop.value
+            value, exception = None, None
+            try:
+                value = yield future
+            except BaseException as e:  # CancelledError is passed to coroutine too
+                exception = e
+
+
 class Test:
+    """
+    Test is queued in large numbers, so it is kept compact: no instance dict, shared default callbacks,
+    interned testcase id and arguments parsed once per distinct testcase id string.
+    Arguments parsed from testcase id are shared between tests, so they are read only
+    """
+    __slots__ = ('storage', 'load_generator', 'testcase_id', 'arguments', 'class_name', 'state', 'result', 'duration',
+                 'cancelled', 'run_id', 'on_started', 'on_finished', 'on_step', 'result_factory')
 
     class Factory:
 
         def __init__(self, storage, result_factory):
-            self.storage = storage
+            self.storage = TestcaseIndex(storage)
             self.result_factory = result_factory
 
+        def preload(self, testcase_ids):
+            """
+            Resolve and import testcases before load is started. Arguments in testcase ids are ignored.
+            Return list of testcase ids which were not found
+            """
+            return self.storage.preload(Test._parse_testcase_id(testcase_id)[0] for testcase_id in testcase_ids)
+
         def __call__(self, testcase_id, load_generator, arguments):
             return Test(testcase_id=testcase_id,
                         arguments=arguments,
@@ -28,24 +84,27 @@ class Test:
                         load_generator=load_generator,
                         result_factory=self.result_factory)
 
-    _next_run_id = 0
+    _run_ids = itertools.count()  # next() of itertools.count is atomic, so run ids are unique across threads
 
     @staticmethod
     def get_next_run_id():
-        next_run_id = Test._next_run_id
-        Test._next_run_id += 1
-        return 'test-%d' % next_run_id
+        return 'test-%d' % next(Test._run_ids)
 
     def __init__(self, testcase_id, storage, load_generator, result_factory, arguments=None):
         self.storage = storage
         self.load_generator = load_generator
-        self.testcase_id, self.arguments = self._parse_testcase_id(testcase_id)
-        self.arguments.update(arguments or {})
+        self.testcase_id, self.arguments = self._parse_testcase_id_cached(testcase_id)
+        if arguments:
+            self.arguments = dict(self.arguments, **arguments)
         self.class_name = 'unknown class'
         self.state = State.NOT_STARTED
+        self.result = None
+        self.duration = None
+        self.cancelled = False
         self.run_id = Test.get_next_run_id()
-        self.on_started = lambda test: None
-        self.on_finished = lambda test: None
+        self.on_started = _no_callback
+        self.on_finished = _no_callback
+        self.on_step = _no_callback
         self.result_factory = result_factory
 
     def __str__(self):
@@ -55,21 +114,50 @@ class Test:
         return str(self)
 
     def run(self):
+        with self._running() as testcase:
+            if testcase:
+                testcase.run(arguments=dict(self.arguments))
+
+    async def run_async(self, report_writer=None):
+        """
+        Coroutine counterpart of run for testcases which implement run as a coroutine.
+        report_writer(result) saves report, so report I/O does not block event loop
+        """
+        with self._running(report_writer) as testcase:
+            if testcase:
+                await _TestContext(testcase.run(arguments=dict(self.arguments)), self, self.result)
+
+    def is_coroutine(self):
+        """
+        Return True if testcase should be awaited with run_async instead of calling run
+        """
+        testcase = self.storage.get(self.testcase_id)
+        return testcase is not None and asyncio.iscoroutinefunction(testcase.run)
+
+    @contextmanager
+    def _running(self, report_writer=None):
+        # common part of run and run_async: yields testcase to run or None if it was not found
         self.state = State.RUNNING
+        started = time.monotonic()
         context().thread_data.test = self
         log.info('Start test %s with id %s' % (self.testcase_id, self.run_id))
 
         self.on_started(self)
         try:
             with self.result_factory() as result:
+                self.result = result
+                result.on_step = self._on_result_step
+                if report_writer:
+                    result.report_writer = report_writer
                 testcase = self.storage.get(self.testcase_id)
                 result.testcase_id = self.testcase_id
                 result.run_id = self.run_id
-                result.arguments = self.arguments
+                result.arguments = dict(self.arguments)
                 if not testcase:
                     result.class_name = 'not found'
                     result.exception_message = 'Test not found'
                     result.result = Result.Skip
+                    yield None
                     return
 
                 result.class_name = testcase.testclass.__name__
@@ -79,8 +167,9 @@ class Test:
                 if arguments_str:
                     arguments_str = '(%s)' % arguments_str
                 log.info('%-9.9s:%-40.40s started%s' % (self.testcase_id, result.class_name, arguments_str), extra={'to_console': True})
-                testcase.run(arguments=self.arguments)
+                yield testcase
         finally:
+            self.duration = time.monotonic() - started
             self.on_finished(self)
             log.info('%-9.9s:%-40.40s %s %s/%s' % (self.testcase_id,
                                                    result.class_name,
@@ -91,9 +180,28 @@ class Test:
             self.state = State.FINISHED
             context().thread_data.test = None
 
+    def _on_result_step(self, result):
+        self.on_step(self)
+
+    def cancel(self, reason):
+        """
+        Finish test which was not started as skipped, e.g. when it is shed by WorkersPool
+        """
+        log.info('Test %s with id %s cancelled: %s' % (self.testcase_id, self.run_id, reason))
+        self.cancelled = True
+        self.result = ResultSummary(Result.Skip, exception_message=reason)
+        self.on_finished(self)
+        self.state = State.FINISHED
+
     def on_fork(self, arguments):
         self.load_generator.add_test(testcase_id=self.testcase_id, arguments=arguments)
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _parse_testcase_id_cached(testcase_id):
+        testcase_id, arguments = Test._parse_testcase_id(testcase_id)
+        return sys.intern(testcase_id), types.MappingProxyType(arguments)
+
     @staticmethod
     @helpers.describe('Parse testcase id')
     def _parse_testcase_id(testcase_id):
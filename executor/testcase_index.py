@@ -0,0 +1,71 @@
+import threading
+import time
+
+from bl.log import getLogger
+
+log = getLogger(__name__)
+
+
+class TestcaseIndex:
+    """
+    In-memory index of testcases over testcase storage.
+    Testcases are resolved(and their modules imported) once, by preload at startup or by first get,
+    so measured runs do not pay lookup and import cost. Missing testcases are remembered too
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self._testcases = {}
+        self._lock = threading.Lock()
+        self.import_seconds = {}
+
+    def __getstate__(self):
+        # index is rebuilt in process it is copied to(e.g. shard process), resolved testcases may be not picklable
+        return dict(storage=self.storage)
+
+    def __setstate__(self, state):
+        self.__init__(state['storage'])
+
+    def get(self, testcase_id):
+        try:
+            return self._testcases[testcase_id]
+        except KeyError:
+            return self._resolve(testcase_id)
+
+    def _resolve(self, testcase_id):
+        with self._lock:
+            if testcase_id in self._testcases:
+                return self._testcases[testcase_id]
+            started = time.monotonic()
+            testcase = self.storage.get(testcase_id)
+            if testcase is not None:
+                testcase.testclass  # touch class, so lazily loaded module of testcase is imported now
+            self.import_seconds[testcase_id] = time.monotonic() - started
+            self._testcases[testcase_id] = testcase
+            return testcase
+
+    def preload(self, testcase_ids):
+        """
+        Resolve and import testcases. Return sorted list of testcase ids which were not found
+        """
+        testcase_ids = sorted(set(testcase_ids) - set(self._testcases))
+        if not testcase_ids:
+            return self.unresolved()
+        started = time.monotonic()
+        for testcase_id in testcase_ids:
+            self._resolve(testcase_id)
+        log.info('TestcaseIndex.preload %d testcases in %.3fs' % (len(testcase_ids), time.monotonic() - started))
+        log.info('%-20s %10s' % ('testcase', 'import, s'))
+        for testcase_id in testcase_ids:
+            log.info('%-20s %10.3f%s' % (testcase_id,
+                                         self.import_seconds[testcase_id],
+                                         '' if self._testcases[testcase_id] else ' not found'))
+        unresolved = self.unresolved()
+        if unresolved:
+            log.warning(f'Testcases not found: {" ".join(unresolved)}', extra={'to_console': True})
+        return unresolved
+
+    def unresolved(self):
+        return sorted(testcase_id for testcase_id, testcase in self._testcases.items() if testcase is None)
+
+    def __len__(self):
+        return len(self._testcases)
@@ -0,0 +1,104 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from bl.executor.action_registry import ActionRegistry, ActionSummary
+from bl.executor.result import Result, ResultSummary
+
+
+def create_test(run_id):
+    test = Mock(run_id=run_id, testcase_id='TBB-1', duration=1.5)
+    test.result.get_result.return_value = Result.Success
+    test.result._report_file_name.return_value = '/reports/%s.xml' % run_id
+    test.result.start_time = None
+    return test
+
+
+def test_finished_actions_compacted():
+    registry = ActionRegistry(max_size=10, ttl=60)
+    test = create_test('test-1')
+    registry.add(test)
+    assert registry.get('test-1') is test
+
+    registry.on_finished(test)
+    summary = registry.get('test-1')
+    assert isinstance(summary, ActionSummary)
+    assert summary.status == 'PASS'
+    assert summary.result == 'success'
+    assert summary.report_path == '/reports/test-1.xml'
+    assert summary.duration == 1.5
+    assert registry.get_metrics()['finished'] == 1
+    assert registry.get_metrics()['summaries_bytes'] > 0
+
+    cancelled = Mock(run_id='test-2', testcase_id='TBB-1', duration=None, result=ResultSummary(Result.Skip))
+    registry.add(cancelled)
+    registry.on_finished(cancelled)
+    assert registry.get('test-2').report_path is None
+    assert registry.get('test-2').status == 'SKIP'
+
+
+def test_size_limit_evicts_oldest_finished():
+    registry = ActionRegistry(max_size=3, ttl=60, evicted_size=2)
+    tests = [create_test('test-%d' % i) for i in range(5)]
+    for test in tests:
+        registry.add(test)
+    assert len(registry) == 5  # active actions are never evicted
+
+    registry.on_finished(tests[3])
+    registry.on_finished(tests[1])
+    assert len(registry) == 3
+    assert registry.is_evicted('test-3')
+    assert registry.is_evicted('test-1')
+    assert registry.get('test-0') is tests[0]
+
+    registry.on_finished(tests[0])
+    assert isinstance(registry.get('test-0'), ActionSummary)
+    registry.add(create_test('test-5'))
+    assert len(registry) == 3
+    assert not registry.is_evicted('test-3')  # only evicted_size ids are remembered
+    assert registry.is_evicted('test-0')
+
+    metrics = registry.get_metrics()
+    assert metrics['evicted'] == 3
+    assert metrics['evicted_ids'] == 2
+    assert metrics['active'] == 3
+    assert metrics['index_bytes'] > 0
+
+
+def test_ttl():
+    registry = ActionRegistry(max_size=10, ttl=0.1)
+    test = create_test('test-1')
+    registry.add(test)
+    registry.on_finished(test)
+    assert registry.get('test-1')
+    time.sleep(0.2)
+    assert registry.get('test-1') is None
+    assert registry.is_evicted('test-1')
+    assert not registry.is_evicted('test-2')
+
+
+def test_wait():
+    registry = ActionRegistry(max_size=10, ttl=60)
+    test = create_test('test-1')
+    test.state = 'NOT_STARTED'
+    registry.add(test)
+
+    started = time.monotonic()
+    assert registry.wait('test-1', lambda action: action.state == 'RUNNING', timeout=0.1) is test
+    assert time.monotonic() - started >= 0.1
+
+    def run():
+        time.sleep(0.1)
+        test.state = 'RUNNING'
+        registry.notify(test)
+        time.sleep(0.1)
+        registry.on_finished(test)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert registry.wait('test-1', lambda action: action.state == 'RUNNING', timeout=5) is test
+    assert registry.waiters_count == 0
+    action = registry.wait('test-1', lambda action: isinstance(action, ActionSummary), timeout=5)
+    assert isinstance(action, ActionSummary)
+    thread.join()
+    assert registry.wait('test-2', lambda action: True, timeout=5) is None
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+from bl.settings import Settings
+
+from bl.executor import AsyncWorkersPool
+from bl.unittest_testcase import PjacUnitTestCase
+
+
+class BlockingTask:
+    def __init__(self, duration=0):
+        self.duration = duration
+        self.thread = None
+
+    def is_coroutine(self):
+        return False
+
+    def run(self):
+        self.thread = threading.current_thread()
+        time.sleep(self.duration)
+
+
+class CoroutineTask:
+    def __init__(self, duration=0, report_duration=0):
+        self.duration = duration
+        self.report_duration = report_duration
+        self.finished = False
+        self.report_thread = None
+
+    def is_coroutine(self):
+        return True
+
+    async def run_async(self, report_writer=None):
+        await asyncio.sleep(self.duration)
+        self.finished = True
+        report_writer(self)  # task is result of itself
+
+    def save_report(self):
+        time.sleep(self.report_duration)
+        self.report_thread = threading.current_thread()
+
+
+class Tests(PjacUnitTestCase):
+
+    def setUp(self):
+        super(Tests, self).setUp()
+        Settings.set('cpu_throtlng_percent', 100)
+
+    def tearDown(self):
+        super(Tests, self).tearDown()
+        Settings.reset()
+
+    def test_async_pool_set_threads(self):
+        with AsyncWorkersPool(loops=2, blocking_threads=2) as pool:
+            self.assertEqual(pool.workers_count(), 0)
+            pool.set_threads(1000)
+            self.assertEqual(pool.workers_count(), 1000)
+            self.assertEqual(sorted(loop.slots_count for loop in pool.loops), [500, 500])
+
+            pool.set_threads(10)
+            self.assertEqual(pool.workers_count(), 10)
+        self.assertEqual(pool.workers_count(), 0)
+
+    def test_coroutine_tasks_run_concurrently(self):
+        with AsyncWorkersPool(count=2000, blocking_threads=1) as pool:
+            tasks = [CoroutineTask(duration=1) for _ in range(2000)]
+            for task in tasks:
+                pool.push(task)
+
+            time.sleep(2)
+            self.assertTrue(all(task.finished for task in tasks))
+
+    def test_reports_saved_out_of_loop(self):
+        with AsyncWorkersPool(count=10, blocking_threads=2) as pool:
+            tasks = [CoroutineTask(report_duration=0.2) for _ in range(10)]
+            for task in tasks:
+                pool.push(task)
+            time.sleep(0.5)
+            self.assertTrue(all(task.finished for task in tasks))  # report of one task does not delay others
+
+            pool.flush_reports()
+            threads = set(task.report_thread for task in tasks)
+            self.assertNotIn(None, threads)
+            self.assertFalse(any(thread.name.startswith('AsyncWorkersLoop') for thread in threads))
+
+    def test_loops_without_slots(self):
+        with AsyncWorkersPool(count=1, loops=2) as pool:
+            tasks = [CoroutineTask() for _ in range(10)]
+            for task in tasks:
+                pool.push(task)
+
+            time.sleep(0.5)
+            self.assertTrue(all(task.finished for task in tasks))
+
+    def test_blocking_tasks_run_in_executor(self):
+        with AsyncWorkersPool(count=10, blocking_threads=2) as pool:
+            tasks = [BlockingTask() for _ in range(10)]
+            for task in tasks:
+                pool.push(task)
+
+            time.sleep(1)
+            threads = set(task.thread for task in tasks)
+            self.assertLessEqual(len(threads), 2)
+            self.assertNotIn(None, threads)
+
+    def test_stop_waits_busy_slots(self):
+        with AsyncWorkersPool(count=5, stop_timeout=5) as pool:
+            task = CoroutineTask(duration=1)
+            pool.push(task)
+            time.sleep(0.1)
+
+            pool.stop()
+            self.assertTrue(task.finished)
+            self.assertEqual(pool.workers_count(), 0)
+
+    def test_reset(self):
+        with AsyncWorkersPool() as pool:
+            for _ in range(10):
+                pool.push(CoroutineTask())
+            self.assertEqual(pool.qsize(), 10)
+
+            pool.reset()
+            self.assertEqual(pool.qsize(), 0)
+            self.assertEqual(pool.workers_count(), 0)
@@ -0,0 +1,160 @@
+import gzip
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import Mock, patch
+from xml.etree import ElementTree as ET
+
+from bl.paths import Paths
+
+from bl.executor.attachment_processor import AttachmentProcessor, compress_pcapng, minify_har
+from bl.executor.result import Attachment, Result
+
+
+def upper(path):
+    # handlers run in pool process, so they should be module level functions
+    new_path = path + '.upper'
+    with open(path) as source, open(new_path, 'w') as target:
+        target.write(source.read().upper())
+    return new_path
+
+
+def slow(path):
+    time.sleep(0.2)
+    return path
+
+
+def failing(path):
+    raise ValueError(path)
+
+
+def crash(path):
+    os._exit(1)  # pool process dies as if it was killed
+
+
+def write_file(path, text='hello'):
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def test_process(tmp_path):
+    attachments = [Attachment(write_file(str(tmp_path / ('%d.txt' % index)))) for index in range(3)]
+    done = threading.Event()
+    with AttachmentProcessor(processes=2, queue_size=2, handlers=dict(txt=upper)) as processor:
+        processor.process(attachments, on_done=done.set)
+        processor.flush()
+        assert done.is_set()
+        metrics = processor.get_metrics()
+    for attachment in attachments:
+        assert attachment.prepared
+        with open(attachment.path) as file:
+            assert file.read() == 'HELLO'
+    assert (metrics['submitted'], metrics['completed'], metrics['failed'], metrics['queue_depth']) == (3, 3, 0, 0)
+    assert metrics['process_time']['txt']['count'] == 3
+
+
+def test_failed_job_keeps_original(tmp_path):
+    attachment = Attachment(write_file(str(tmp_path / 'a.txt')))
+    done = threading.Event()
+    with AttachmentProcessor(processes=1, handlers=dict(txt=failing)) as processor:
+        processor.process([attachment], on_done=done.set)
+        processor.flush()
+        assert processor.get_metrics()['failed'] == 1
+    assert done.is_set()
+    assert attachment.path == str(tmp_path / 'a.txt')
+
+
+def test_crashed_pool_is_restarted(tmp_path):
+    crashed = Attachment(write_file(str(tmp_path / 'a.crash')))
+    attachment = Attachment(write_file(str(tmp_path / 'b.txt')))
+    done = threading.Event()
+    with AttachmentProcessor(processes=1, queue_size=1, handlers=dict(crash=crash, txt=upper)) as processor:
+        processor.process([crashed], on_done=Mock())
+        processor.flush()
+        processor.process([attachment], on_done=done.set)
+        processor.flush()
+        metrics = processor.get_metrics()
+    assert crashed.path == str(tmp_path / 'a.crash')  # original file is kept
+    assert done.is_set()
+    assert attachment.path == str(tmp_path / 'b.txt.upper')
+    assert (metrics['failed'], metrics['completed'], metrics['queue_depth']) == (1, 1, 0)
+    assert metrics['pool_restarts'] == 1
+
+
+def test_concurrent_first_use(tmp_path):
+    attachments = [Attachment(write_file(str(tmp_path / ('%d.txt' % index)))) for index in range(4)]
+    done = [threading.Event() for _ in attachments]
+    starting = threading.Event()
+    create_executor = ProcessPoolExecutor
+
+    def slow_executor(*args, **kwargs):
+        starting.set()
+        time.sleep(0.2)  # other threads come while processor is being started
+        return create_executor(*args, **kwargs)
+
+    with patch('bl.executor.attachment_processor.ProcessPoolExecutor', side_effect=slow_executor) as executor_mock:
+        with AttachmentProcessor(processes=1, handlers=dict(txt=upper)) as processor:
+            threads = [threading.Thread(target=processor.process, args=([attachment], event.set))
+                       for attachment, event in zip(attachments, done)]
+            for thread in threads:
+                thread.start()
+            assert starting.wait(timeout=5)
+            assert processor.get_metrics() is None  # half started processor is not used
+            processor.flush()
+            for thread in threads:
+                thread.join()
+            processor.flush()
+            assert processor.get_metrics()['completed'] == 4
+    executor_mock.assert_called_once()
+    assert all(event.is_set() for event in done)
+
+
+def test_back_pressure(tmp_path):
+    attachments = [Attachment(str(tmp_path / ('%d.txt' % index))) for index in range(3)]
+    with AttachmentProcessor(processes=1, queue_size=1, handlers=dict(txt=slow)) as processor:
+        processor.process(attachments, on_done=Mock())
+        metrics = processor.get_metrics()
+        assert metrics['blocked'] == 2
+        assert metrics['max_queue_depth'] == 1
+        processor.flush()
+
+
+def test_handlers_from_settings():
+    with patch('bl.executor.attachment_processor.Settings.get', side_effect=lambda name, **kwargs: {
+            'attachment_handlers': 'wav, har'}.get(name, kwargs.get('default'))):
+        processor = AttachmentProcessor()
+    assert processor.handler('a.WAV') is not None
+    assert processor.handler('a.har') is minify_har
+    assert processor.handler('a.pcapng') is None
+    assert processor.get_metrics() is None  # pool is started by first process
+
+
+def test_compress_and_minify(tmp_path):
+    pcapng = compress_pcapng(write_file(str(tmp_path / 'a.pcapng')))
+    with gzip.open(pcapng, 'rt') as file:
+        assert file.read() == 'hello'
+    har = minify_har(write_file(str(tmp_path / 'a.har'), '{\n  "log": {\n    "entries": []\n  }\n}'))
+    with open(har) as file:
+        assert file.read() == '{"log":{"entries":[]}}'
+
+
+@patch('bl.executor.result.Settings')
+@patch('bl.executor.result.step')
+@patch('bl.executor.result.context')
+def test_result_report_waits_for_attachments(context_mock, step_mock, settings_mock):
+    xml_report = os.path.join(Paths.reports(), 'TBB-0___1.xml')
+    path = write_file(os.path.join(Paths.artifacts(), 'attachment_processor.txt'))
+    with AttachmentProcessor(processes=1, handlers=dict(txt=upper)) as processor:
+        with Result(run_number=1, attachment_processor=processor) as result:
+            result.testcase_id = 'TBB-0'
+            result.attach(path)
+            raise ValueError('error')
+        processor.flush()
+    assert result.report_saved.is_set()
+    assert not os.path.exists(path)
+    with open(xml_report) as file:
+        files = ET.parse(file).getroot().find('testcase/files')
+    assert files[0].attrib['path'] == path + '.upper'
+    os.remove(path + '.upper')
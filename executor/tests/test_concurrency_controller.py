@@ -0,0 +1,92 @@
+import threading
+import time
+from unittest.mock import Mock, call
+
+import pytest
+from bl.executor.concurrency_controller import ConcurrencyController
+
+
+def create_controller(**kwargs):
+    cpu_monitor = Mock(threshold=80, load=0.0, throttling=True)
+    workers = Mock()
+    kwargs.setdefault('interval', 60)
+    controller = ConcurrencyController(workers=workers, cpu_monitor=cpu_monitor, min_threads=2, margin=5,
+                                       increase_step=1, decrease_factor=0.5, **kwargs)
+    return controller, workers, cpu_monitor
+
+
+def test_aimd():
+    on_change = Mock()
+    controller, workers, cpu_monitor = create_controller(on_change=on_change)
+    controller.start(threads=10)
+    assert cpu_monitor.throttling is False
+    workers.set_threads.assert_called_with(10)
+
+    assert controller.adjust(load=95, elapsed=1) == 5  # multiplicative decrease
+    assert controller.adjust(load=95, elapsed=1) == 2
+    assert controller.adjust(load=95, elapsed=1) == 2  # min bound
+    assert controller.adjust(load=77, elapsed=1) == 2  # inside margin, hold
+    assert controller.adjust(load=50, elapsed=1) == 3  # additive increase
+    for _ in range(20):
+        controller.adjust(load=50, elapsed=1)
+    assert controller.target == 10  # requested thread count is max bound by default
+
+    assert workers.set_threads.mock_calls[:4] == [call(10), call(5), call(2), call(3)]
+    assert on_change.mock_calls[:3] == [call(10, 5), call(5, 2), call(2, 3)]
+    metrics = controller.get_metrics()
+    assert metrics['throttled_seconds'] == 3
+    assert metrics['decreases'] == 2
+    assert metrics['increases'] == 8
+    assert metrics['load'] == 50
+
+    controller.stop()
+    assert cpu_monitor.throttling is True
+    assert controller.get_metrics()['running'] is False
+
+
+def test_bounds():
+    controller, workers, _ = create_controller()
+    controller.start(threads=10)
+
+    controller.set_bounds(max_threads=4)
+    assert controller.target == 4
+    workers.set_threads.assert_called_with(4)
+    controller.set_bounds(min_threads=6, max_threads=20)
+    assert controller.target == 6
+
+    with pytest.raises(ValueError):
+        controller.set_bounds(min_threads=30)
+    with pytest.raises(ValueError):
+        controller.set_bounds(min_threads=-1)
+    with pytest.raises(ValueError):
+        controller.set_bounds(min_threads=0)
+
+    controller.set_threads(15)
+    assert controller.target == 15
+    controller.stop()
+
+
+def test_control_thread():
+    controller, workers, cpu_monitor = create_controller(interval=0.05)
+    cpu_monitor.load = 99
+    controller.start(threads=16)
+    time.sleep(0.5)
+    controller.stop()
+    assert controller.target == 2
+    assert controller.get_metrics()['throttled_seconds'] > 0.1
+
+
+def test_concurrent_changes_applied_in_order():
+    controller, workers, _ = create_controller()
+    controller.start(threads=10)
+    applied = []
+    workers.set_threads.side_effect = lambda threads: time.sleep(0.1) or applied.append(threads)
+    setters = [threading.Thread(target=controller.set_threads, args=(threads,)) for threads in (4, 8, 6)]
+    for setter in setters:
+        setter.start()
+        time.sleep(0.02)
+    for setter in setters:
+        setter.join()
+    assert applied == [4, 8, 6]
+    assert applied[-1] == controller.target
+    controller.stop()
@@ -0,0 +1,101 @@
+import gzip
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+import pytest
+from bl.executor.file_response import FileResponse, accepts_gzip, parse_range
+
+CONTENT = b''.join(b'<line number="%d"/>\n' % i for i in range(10000))
+
+
+@pytest.fixture
+def report_path():
+    file, path = tempfile.mkstemp(suffix='.xml')
+    os.write(file, CONTENT)
+    os.close(file)
+    yield path
+    os.remove(path)
+
+
+def serve(path, **environ):
+    start_response = Mock()
+    body = b''.join(FileResponse(path, content_type='text/xml', environ=environ, chunk_size=1000)(start_response))
+    status, headers = start_response.call_args[0]
+    return status, dict(headers), body
+
+
+def test_full_content(report_path):
+    status, headers, body = serve(report_path)
+    assert status == '200 OK'
+    assert body == CONTENT
+    assert headers['Content-Length'] == str(len(CONTENT))
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert 'Content-Encoding' not in headers
+
+
+def test_gzip(report_path):
+    status, headers, body = serve(report_path, HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.8')
+    assert status == '200 OK'
+    assert headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in headers
+    assert gzip.decompress(body) == CONTENT
+    assert len(body) < len(CONTENT) / 5
+
+
+@pytest.mark.parametrize('range_header, start, end', [('bytes=0-99', 0, 99),
+                                                      ('bytes=100-', 100, len(CONTENT) - 1),
+                                                      ('bytes=-50', len(CONTENT) - 50, len(CONTENT) - 1),
+                                                      ('bytes=5-10000000', 5, len(CONTENT) - 1)])
+def test_range(report_path, range_header, start, end):
+    status, headers, body = serve(report_path, HTTP_RANGE=range_header, HTTP_ACCEPT_ENCODING='gzip')
+    assert status == '206 Partial Content'
+    assert body == CONTENT[start:end + 1]
+    assert headers['Content-Range'] == 'bytes %d-%d/%d' % (start, end, len(CONTENT))
+    assert headers['Content-Length'] == str(end - start + 1)
+    assert 'Content-Encoding' not in headers
+
+
+def test_range_not_satisfiable(report_path):
+    status, headers, body = serve(report_path, HTTP_RANGE='bytes=%d-' % len(CONTENT))
+    assert status == '416 Requested Range Not Satisfiable'
+    assert headers['Content-Range'] == 'bytes */%d' % len(CONTENT)
+    assert body == b''
+
+
+def test_parse_helpers():
+    assert parse_range('bytes=0-1,5-6', 10) is None
+    assert parse_range('items=0-1', 10) is None
+    with pytest.raises(ValueError):
+        parse_range('bytes=5-1', 10)
+    assert accepts_gzip('gzip')
+    assert accepts_gzip('*')
+    assert not accepts_gzip('gzip;q=0')
+    assert not accepts_gzip('identity')
+    assert not accepts_gzip('')
+
+
+@pytest.mark.parametrize('accept_encoding, accepted', [('deflate;q=1, gzip;q=0.5', True),
+                                                       ('gzip;q=0, *', False),
+                                                       ('*, gzip;q=0', False),
+                                                       ('*;q=0, gzip', True),
+                                                       ('*;q=0', False),
+                                                       ('GZIP; Q=0.1', True),
+                                                       ('gzip;level=1;q=0.0', False),
+                                                       ('gzip;q=abc', False)])
+def test_accepts_gzip_quality(accept_encoding, accepted):
+    assert accepts_gzip(accept_encoding) is accepted
+
+
+def test_file_opened_on_iteration(report_path):
+    with patch('bl.executor.file_response.open', side_effect=open) as open_mock:
+        response = FileResponse(report_path, content_type='text/xml', environ={})
+        body = response(Mock())
+        open_mock.assert_not_called()  # response which is never sent does not hold file
+        assert b''.join(body) == CONTENT
+        open_mock.assert_called_once_with(report_path, 'rb')
+
+
+def test_missing_file():
+    with pytest.raises(IOError):
+        FileResponse('missing.xml', content_type='text/xml', environ={})
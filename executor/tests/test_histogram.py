@@ -0,0 +1,58 @@
+import random
+import threading
+
+import pytest
+from bl.executor.histogram import Histogram, LatencyRecorder
+
+
+def test_percentiles_precision():
+    histogram = Histogram()
+    values = [random.uniform(0.001, 10) for _ in range(100000)]
+    for value in values:
+        histogram.record(value)
+
+    values.sort()
+    for percent in Histogram.PERCENTILES:
+        exact = values[int(len(values) * percent / 100) - 1]
+        assert histogram.percentile(percent) == pytest.approx(exact, rel=0.02)
+    assert histogram.count == len(values)
+    assert histogram.max == values[-1]
+    assert len(histogram.counts) < 1500
+
+
+def test_empty_and_merge():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    assert histogram.summary()['mean'] is None
+
+    other = Histogram()
+    other.record(2)
+    other.record(0.000001)
+    histogram.record(1)
+    histogram.merge(other)
+    assert histogram.count == 3
+    assert histogram.min == 0.000001
+    assert histogram.max == 2
+    assert histogram.percentile(50) == pytest.approx(1, rel=0.01)
+
+
+def test_latency_recorder_reset():
+    recorder = LatencyRecorder()
+
+    def record():
+        for _ in range(1000):
+            recorder.record('TBB-1', 'success', 0.5)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.record('TBB-2', 'failure', 1)
+    recorder.record('TBB-2', 'failure', None)
+
+    summary = recorder.summary(reset=True)
+    assert summary['TBB-1']['success']['count'] == 4000
+    assert summary['TBB-1']['success']['p99.9'] == 0.5
+    assert summary['TBB-2']['failure']['count'] == 1
+    assert recorder.summary() == {}
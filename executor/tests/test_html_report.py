@@ -1,13 +1,15 @@
 import json
-from bl.executor.html_report import HtmlReport, BEFORE_JSON_LOG, AFTER_JSON_LOG
+import pytest
+from bl.executor.html_report import HtmlReport, StreamingHtmlReport, BEFORE_JSON_LOG, AFTER_JSON_LOG
 from unittest.mock import patch
 from bl.helpers import uniq_file_name
 
 
+@pytest.mark.parametrize('report_class', [HtmlReport, StreamingHtmlReport])
 @patch('bl.executor.html_report.HtmlReport.current_time', side_effect=['1', '2', '3', '4', '5'])
-def test_level(current_time_patch):
+def test_level(current_time_patch, report_class):
     log_file = uniq_file_name(postfix='_unittest.html')
-    report = HtmlReport()
+    report = report_class()
     report.write_log(module_name='html_loger', level='INFO', message='Parent message')
 
     report.level_down()
@@ -33,3 +35,33 @@ def test_level(current_time_patch):
     with open(log_file) as file:
         content = file.read()
     assert content == html_content
+
+
+@pytest.mark.parametrize('report_class', [HtmlReport, StreamingHtmlReport])
+@patch('bl.executor.html_report.HtmlReport.current_time', side_effect=[str(i) for i in range(10)])
+def test_reenter_level(current_time_patch, report_class):
+    log_file = uniq_file_name(postfix='_unittest.html')
+    report = report_class()
+    report.write_log(module_name='m', level='INFO', message='Parent')
+    report.level_down()
+    report.write_log(module_name='m', level='INFO', message='Child')
+    report.level_down()
+    report.write_log(module_name='m', level='INFO', message='Grandchild')
+    report.level_up()
+    report.level_up()
+    report.level_down()
+    report.write_log(module_name='m', level='INFO', message='Child again')
+    report.level_down()
+    report.write_log(module_name='m', level='INFO', message='Unclosed')
+
+    report.save(filename=log_file)
+
+    with open(log_file) as file:
+        content = file.read()
+    json_log = json.loads(content[len(BEFORE_JSON_LOG):-len(AFTER_JSON_LOG)])
+    assert json_log == {'log': [
+        {'time': '0', 'msg': 'Parent', 'lvl': 'INFO', 'module': 'm', 'log': [
+            {'time': '1', 'msg': 'Child', 'lvl': 'INFO', 'module': 'm', 'log': [
+                {'time': '2', 'msg': 'Grandchild', 'lvl': 'INFO', 'module': 'm'}]},
+            {'time': '3', 'msg': 'Child again', 'lvl': 'INFO', 'module': 'm', 'log': [
+                {'time': '4', 'msg': 'Unclosed', 'lvl': 'INFO', 'module': 'm'}]}]}]}
@@ -0,0 +1,51 @@
+import io
+from xml.etree import ElementTree as ET
+
+from bl.executor.junit_xml import JUnitXmlWriter, cdata, escape
+
+
+def write_report(lines, traceback='Traceback'):
+    file = io.StringIO()
+    writer = JUnitXmlWriter(file)
+    writer.start(errors=0, failures=1, skipped=0, time=1.5, classname='Test<1>', testcase_id='TBB-1', testrun='test-1',
+                 timestamp='2020-01-01_00-00-00', groups='group "a"', run=1)
+    writer.properties(dict(number='+1 <555>'))
+    writer.steps([dict(number=1, description='login & call', start=0, end=1, duration=1)])
+    writer.failure(result_type='failure', message='Expected "a"', traceback=traceback)
+    writer.system_out(lines)
+    writer.files(['      <file name="report.html" path="report.html" type="5"/>\n'])
+    writer.end()
+    return ET.fromstring(file.getvalue())
+
+
+def test_report():
+    root = write_report(iter(['line 1\n', 'line 2\n']))
+    assert root.attrib['failures'] == '1'
+    testcase = root.find('testcase')
+    assert testcase.attrib['classname'] == 'Test<1>'
+    assert testcase.attrib['groups'] == 'group "a"'
+    assert testcase.find('properties/property').attrib == dict(name='number', value='+1 <555>')
+    assert testcase.find('steps/step').attrib['description'] == 'login & call'
+    assert testcase.find('failure').attrib['message'] == 'Expected "a"'
+    assert testcase.find('failure').text == '\nTraceback'
+    assert testcase.find('system-out').text == '\nline 1\nline 2\n'
+    assert testcase.find('files/file').attrib['type'] == '5'
+
+
+def test_cdata_end_and_invalid_chars_are_escaped():
+    root = write_report(['response: <![CDATA[x]]> done\n', 'bell\x07\n'], traceback='value ]]> in traceback')
+    assert root.find('testcase/system-out').text == '\nresponse: <![CDATA[x]]> done\nbell\n'
+    assert root.find('testcase/failure').text == '\nvalue ]]> in traceback'
+
+
+def test_escape():
+    assert escape('a<b>&"\'\n') == 'a&lt;b&gt;&amp;&#34;&#39;&#10;'
+    assert escape(1) == '1'
+    assert cdata(']]>]]>') == ']]]]><![CDATA[>]]]]><![CDATA[>'
+
+
+def test_cdata_end_between_chunks():
+    file = io.StringIO()
+    JUnitXmlWriter(file).system_out(['a]', ']', '>b]]', '>'], chunk_size=1)
+    assert file.getvalue() == '    <system-out><![CDATA[\na]]]]><![CDATA[>b]]]]><![CDATA[>]]></system-out>\n' \
+                              '    <system-err><![CDATA[]]></system-err>\n'
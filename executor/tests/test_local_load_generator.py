@@ -4,7 +4,7 @@ from unittest.mock import Mock, call
 
 import pytest
 from bl.executor.local_load_generator import LocalLoadGenerator
-from bl.executor.result import Result
+from bl.executor.result import Result, StepTiming
 
 
 def test_testcase_split():
@@ -22,7 +22,10 @@ def test_local_load_generator():
             super().__init__()
             _result = lambda: None
             _result.get_result = lambda: result
+            _result.steps = [StepTiming(number=1, description='login', start=0, end=0.5)]
             self.result = _result
+            self.testcase_id = 'T-1'
+            self.duration = 1.5
 
     tests = [TestMock(Result.Error), TestMock(Result.Failure), TestMock(Result.Skip), TestMock(Result.Success)]
     workers = Mock()
@@ -39,7 +42,8 @@ def test_local_load_generator():
 
     assert local_load_generator.total_count == len(tests)
     assert local_load_generator.finished_count == 0
-    assert sorted(local_load_generator.testcases) == ['T-1', 'T-1', 'T-2', 'T-2']
+    assert local_load_generator.testcases == ['T-1', 'T-2']
+    test_factory.preload.assert_called_once_with(['T-1', 'T-2'])
     test_factory.assert_has_calls(
         [call(arguments=None, load_generator=weakref.proxy(local_load_generator), testcase_id='T-2'),
          call(arguments=None, load_generator=weakref.proxy(local_load_generator), testcase_id='T-2'),
@@ -54,6 +58,54 @@ def test_local_load_generator():
     assert local_load_generator.finished_count == len(tests)
     main_loop.stop.assert_called()
 
+    latency = local_load_generator.latency.summary()
+    assert sorted(latency['T-1']) == ['error', 'failure', 'skipped', 'success']
+    assert latency['T-1']['success']['p99'] == 1.5
+    assert local_load_generator.step_latency.summary()['T-1'][1]['count'] == 4
+    local_load_generator.stop()
+
+
+def test_bounded_feed():
+    workers = Mock()
+    main_loop = Mock()
+
+    def create_test(testcase_id, arguments, load_generator):
+        test = Mock(testcase_id=testcase_id, duration=1)
+        test.result.get_result.return_value = Result.Success
+        test.result.steps = []
+        return test
+
+    local = LocalLoadGenerator(workers=workers, main_loop=main_loop, test_factory=Mock(side_effect=create_test),
+                               testcase_args=['T-1,T-2,T-3'], repeat_count=1000, load_generator=Mock(),
+                               feed_window=10, seed=42)
+    assert local.total_count == 3000
+    assert len(workers.push.mock_calls) == 10
+
+    local.add_test('T-4')  # fork is counted but does not take place of shuffled test
+    assert local.total_count == 3001
+    fork = workers.push.mock_calls[-1][1][0]
+    fork.on_finished(fork)
+    assert len(workers.push.mock_calls) == 11  # finished fork does not let one more shuffled test in
+    pushed = 0
+    while pushed < len(workers.push.mock_calls):
+        test = workers.push.mock_calls[pushed][1][0]
+        if test is not fork:
+            test.on_finished(test)
+        pushed += 1
+    assert pushed == 3001
+    assert local.finished_count == 3001
+    main_loop.stop.assert_called_once()
+
+    testcase_ids = [call[1][0].testcase_id for call in workers.push.mock_calls if call[1][0].testcase_id != 'T-4']
+    assert sorted(set(testcase_ids)) == ['T-1', 'T-2', 'T-3']
+    assert testcase_ids.count('T-1') == 1000
+    assert testcase_ids[:100] != sorted(testcase_ids[:100])  # shuffled
+
+    same_seed = LocalLoadGenerator(workers=Mock(), main_loop=Mock(), test_factory=Mock(side_effect=create_test),
+                                   testcase_args=['T-1,T-2,T-3'], repeat_count=1000, load_generator=Mock(),
+                                   feed_window=10, seed=42)
+    assert [call[1][0].testcase_id for call in same_seed.workers.push.mock_calls] == testcase_ids[:10]
+
 
 @pytest.fixture
 def csv_resource():
@@ -72,4 +124,5 @@ def test_load_from_csv(csv_resource):
                                testcase_args=[pytest.csv_file],
                                repeat_count=2,
                                load_generator=Mock())
-    assert sorted(local.testcases) == ['T-1', 'T-1', 'T-2', 'T-2', 'T-3', 'T-3', 'T-4', 'T-4']
+    assert local.testcases == ['T-1', 'T-2', 'T-3', 'T-4']
+    assert local.total_count == 8
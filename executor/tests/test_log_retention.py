@@ -0,0 +1,111 @@
+import logging
+import pickle
+
+import pytest
+from bl.settings import Settings
+
+from bl.executor.html_report import HtmlReport
+from bl.executor.log_retention import LogRetention
+from bl.executor.log_store import LogStore, level_number
+
+
+def write_logs(logs, count=10):
+    for index in range(count):
+        logs.write_log(module_name='test', level='INFO', message='line %d' % index)
+        logs.level_down()
+        logs.write_log(module_name='test', level='DEBUG', message='detail %d' % index)
+        logs.level_up()
+
+
+def test_full():
+    retention = LogRetention()
+    logs = retention.create_store()
+    write_logs(logs)
+    retention.apply(logs, passed=True)
+    assert len(logs) == 20
+    assert retention.get_metrics() == dict(policy='full', min_level=None, kept_bytes=140, discarded_bytes=0,
+                                           discarded_lines=0)
+
+
+def test_failures():
+    retention = LogRetention(policy='failures')
+    failed, passed = retention.create_store(), retention.create_store()
+    write_logs(failed)
+    write_logs(passed)
+    retention.apply(failed, passed=False)
+    retention.apply(passed, passed=True)
+    assert len(failed) == 20
+    assert [entry[4] for entry in passed.entries] == [
+        '20 log lines(140 bytes) were discarded: test passed, log retention failures']
+    metrics = retention.get_metrics()
+    assert (metrics['kept_bytes'], metrics['discarded_bytes'], metrics['discarded_lines']) == (140, 140, 20)
+
+
+def test_ring():
+    retention = LogRetention(policy='ring:3')
+    logs = retention.create_store()
+    write_logs(logs)
+    retention.apply(logs, passed=True)
+    assert [(entry[1], entry[4]) for entry in logs.entries] == [(0, '17 log lines(118 bytes) were discarded: '
+                                                                    'test passed, log retention ring:3'),
+                                                                (0, 'detail 8'),  # parent was discarded
+                                                                (0, 'line 9'),
+                                                                (1, 'detail 9')]
+    logs.replay(HtmlReport())  # nesting stays valid
+    assert retention.get_metrics()['policy'] == 'ring:3'
+
+
+def test_min_level():
+    retention = LogRetention(min_level='INFO')
+    logs = retention.create_store()
+    write_logs(logs)
+    logs.write_log(module_name='test', level='DEBUG', message='dropped parent')
+    logs.level_down()
+    logs.write_log(module_name='test', level='ERROR', message='error')
+    logs.level_up()
+    retention.apply(logs, passed=False)
+    assert len(logs) == 11
+    assert logs.entries[-1][1:] == (0, 'ERROR', 'test', 'error')  # moved to level of dropped parent
+    logs.replay(HtmlReport())
+    assert retention.get_metrics()['discarded_lines'] == 11
+
+
+@pytest.mark.parametrize('level', ['info', 'Warning', '20', 20, ' ERROR '])
+def test_level_number(level):
+    assert level_number(level) in (logging.INFO, logging.WARNING, logging.ERROR)
+    logs = LogStore(min_level=level)
+    logs.write_log(module_name='test', level='ERROR', message='error')
+    logs.write_log(module_name='test', level='DEBUG', message='debug')
+    assert [entry[4] for entry in logs.entries] == ['error']
+
+
+def test_unknown_level():
+    with pytest.raises(ValueError):
+        LogRetention(min_level='verbose')
+    logs = LogStore(min_level='INFO')
+    logs.write_log(module_name='test', level='STEP', message='step')  # unknown level of line is kept
+    assert len(logs) == 1
+
+
+def test_pickle():
+    retention = LogRetention(policy='ring:3', min_level='INFO')
+    retention.apply(retention.create_store(), passed=True)
+    copy = pickle.loads(pickle.dumps(retention))
+    assert (copy.policy_name, copy.min_level) == ('ring:3', 'INFO')
+
+
+@pytest.mark.parametrize('policy', ['all', 'ring', 'ring:0', 'ring:x'])
+def test_invalid_policy(policy):
+    with pytest.raises(ValueError):
+        LogRetention(policy=policy)
+
+
+def test_from_settings():
+    Settings.set('log_retention', 'failures')
+    Settings.set('log_min_level_stress', 'WARNING')
+    try:
+        stress, local = LogRetention.from_settings('stress'), LogRetention.from_settings('local')
+    finally:
+        Settings.reset()
+    assert (stress.policy, stress.min_level) == ('failures', 'WARNING')
+    assert (local.policy, local.min_level) == ('failures', None)
@@ -0,0 +1,84 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from bl.executor.html_report import HtmlReport, StreamingHtmlReport, BEFORE_JSON_LOG, AFTER_JSON_LOG
+from bl.executor.log_store import LogStore
+from bl.helpers import uniq_file_name
+
+
+def write_logs(report):
+    report.write_log(module_name='html_loger', level='INFO', message='Parent message')
+    report.level_down()
+    report.write_log(module_name='html_loger', level='INFO', message='Child message')
+    report.level_down()
+    report.write_log(module_name='html_loger', level='INFO', message='Grandchild message')
+    report.level_up()
+    report.level_up()
+    report.level_up()
+    report.write_log(module_name='html_loger', level='DEBUG', message='Some\nmultiline\nmessage')
+    report.level_down()
+    report.write_log(module_name='html_loger', level='INFO', message='Child message again')
+
+
+def saved_log(report):
+    log_file = uniq_file_name(postfix='_unittest.html')
+    report.save(filename=log_file, testcase_id='TEST-1')
+    with open(log_file) as file:
+        return json.loads(file.read()[len(BEFORE_JSON_LOG):-len(AFTER_JSON_LOG)])
+
+
+@pytest.mark.parametrize('report_class', [HtmlReport, StreamingHtmlReport])
+def test_replay_gives_same_html_report(report_class):
+    with patch('bl.executor.html_report.HtmlReport.current_time', return_value='1'):
+        expected = report_class()
+        write_logs(expected)
+    logs = LogStore()
+    write_logs(logs)
+    with patch('bl.executor.log_store.LogStore.format_time', return_value='1'):
+        assert saved_log(logs.replay(report_class())) == saved_log(expected)
+    assert len(logs) == 5
+
+
+@pytest.mark.parametrize('min_level', [None, 'INFO'])
+def test_stream_gives_same_html_report(min_level):
+    with patch('bl.executor.log_store.LogStore.format_time', return_value='1'):
+        logs = LogStore(min_level=min_level)
+        logs.write_log(module_name='html_loger', level='INFO', message='Captured before streaming')
+        streamed = StreamingHtmlReport()
+        logs.stream_to(streamed)
+        write_logs(logs)
+        assert saved_log(streamed) == saved_log(logs.replay(HtmlReport()))
+    streamed.close()
+
+
+@patch('bl.executor.log_store.time.monotonic', side_effect=[100, 101.5, 102.25])
+def test_text(monotonic_mock):
+    logs = LogStore()
+    logs.write_log(module_name='test', level='INFO', message='hello')
+    logs.write_log(module_name='test', level='ERROR', message='multiline\nmessage')
+    start = logs.format_time(100)
+    assert logs.format_time(101.5) != start
+    assert list(logs.iter_text()) == [
+        '%s [test                     ] INFO - hello\n' % logs.format_time(101.5),
+        '%s [test                     ] ERROR - multiline\n%smessage\n' % (logs.format_time(102.25), ' ' * 48)]
+    assert logs.text() == ''.join(logs.iter_text())
+
+
+def test_level_down_without_entry():
+    logs = LogStore()
+    with pytest.raises(IndexError):
+        logs.level_down()
+    logs.level_up()  # root level is not closed
+    logs.write_log(module_name='test', level='INFO', message='hello')
+    logs.level_down()
+    assert logs.entries[-1][1] == 0
+
+
+def test_format_time():
+    logs = LogStore()
+    logs._origin_monotonic = 1000.0
+    logs._origin_microseconds = ((23 * 60 + 59) * 60 + 59) * 1000000 + 123456  # 23:59:59.123456
+    assert logs.format_time(1000.0) == '23:59:59.123'
+    assert logs.format_time(1000.5) == '23:59:59.623'
+    assert logs.format_time(1001.0) == '00:00:00.123'
@@ -0,0 +1,59 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from bl.executor.memory_guard import MemoryGuard, MemoryState
+
+
+def test_disabled_by_default():
+    guard = MemoryGuard()
+    assert not guard.enabled
+    assert guard.check(rss=100000, available=0) == MemoryState.OK
+    guard.wait()
+    guard.stop()
+
+
+def test_states():
+    guard = MemoryGuard(soft_limit=100, hard_limit=200, soft_available=1000, hard_available=500, interval=60)
+    listener = Mock()
+    guard.add_listener(listener)
+
+    assert guard.check(rss=50, available=2000) == MemoryState.OK
+    assert guard.check(rss=150, available=2000) == MemoryState.SOFT
+    assert guard.check(rss=50, available=800) == MemoryState.SOFT
+    assert guard.check(rss=250, available=2000) == MemoryState.HARD
+    assert guard.check(rss=50, available=100) == MemoryState.HARD
+    assert guard.check(rss=50, available=2000) == MemoryState.OK
+
+    assert [c[1][0] for c in listener.mock_calls] == [MemoryState.SOFT, MemoryState.HARD, MemoryState.OK]
+    metrics = guard.get_metrics()
+    assert metrics['state'] == MemoryState.OK
+    assert metrics['rss_mb'] == 50
+    assert metrics['soft_seconds'] > 0
+    guard.stop()
+
+
+def test_wait():
+    guard = MemoryGuard(soft_limit=100, interval=60)
+    guard.check(rss=150, available=2000)
+    released = []
+    interrupted = threading.Event()
+
+    threads = [threading.Thread(target=lambda: (guard.wait(), released.append(1))),
+               threading.Thread(target=lambda: (guard.wait(interrupted.is_set), released.append(2)))]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    assert released == []
+    assert guard.get_metrics()['blocked_workers'] == 2
+
+    interrupted.set()
+    guard.wake()
+    time.sleep(0.2)
+    assert released == [2]
+
+    guard.check(rss=50, available=2000)
+    for thread in threads:
+        thread.join(1)
+    assert sorted(released) == [1, 2]
+    guard.stop()
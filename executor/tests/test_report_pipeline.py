@@ -0,0 +1,68 @@
+import pickle
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+from bl.executor.report_pipeline import ReportPipeline
+
+
+class SlowResult:
+    def __init__(self, duration=0.0, fail=False):
+        self.duration = duration
+        self.fail = fail
+        self.thread = None
+
+    def write_report(self):
+        self.thread = threading.current_thread()
+        time.sleep(self.duration)
+        if self.fail:
+            raise IOError('disk full')
+
+
+def test_reports_written_off_caller_thread():
+    with ReportPipeline(writers=2, queue_size=10) as pipeline:
+        results = [SlowResult() for _ in range(5)] + [SlowResult(fail=True)]
+        for result in results:
+            pipeline.submit(result)
+        pipeline.flush()
+
+        assert all(result.thread and result.thread != threading.current_thread() for result in results)
+        metrics = pipeline.get_metrics()
+        assert metrics['submitted'] == 6
+        assert metrics['written'] == 5
+        assert metrics['failed'] == 1
+        assert metrics['queue_depth'] == 0
+
+
+def test_back_pressure():
+    with ReportPipeline(writers=1, queue_size=1) as pipeline:
+        started = time.monotonic()
+        for _ in range(4):
+            pipeline.submit(SlowResult(duration=0.2))
+
+        assert time.monotonic() - started == pytest.approx(0.4, abs=0.15)
+        metrics = pipeline.get_metrics()
+        assert metrics['blocked'] >= 2
+        assert metrics['blocked_seconds'] == pytest.approx(0.4, abs=0.15)
+        assert metrics['max_queue_depth'] == 1
+
+
+def test_stop_flushes():
+    pipeline = ReportPipeline(writers=1, queue_size=10)
+    result = Mock()
+    pipeline.submit(result)
+    pipeline.stop()
+    result.write_report.assert_called_once_with()
+
+    pipeline.submit(result)  # stopped pipeline is started again
+    pipeline.stop()
+    assert result.write_report.call_count == 2
+
+
+def test_pickle():
+    with ReportPipeline(writers=1, queue_size=5) as pipeline:
+        copy = pickle.loads(pickle.dumps(pipeline))
+        with copy:
+            assert copy.queue_size == 5
+            assert copy.threads[0].is_alive()
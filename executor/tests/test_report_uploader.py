@@ -0,0 +1,178 @@
+import json
+import os
+import pickle
+import threading
+import time
+import zlib
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+from bl.executor.html_report import SavedReport
+from bl.executor.report_uploader import ReportUploader
+from bl.helpers import uniq_file_name
+
+
+def saved_report(content='<html>report</html>'):
+    filename = uniq_file_name(postfix='_unittest.html')
+    with open(filename, 'w') as file:
+        file.write(content)
+    return SavedReport(filename)
+
+
+@pytest.fixture
+def settings():
+    with patch('bl.executor.report_uploader.Settings') as settings_mock:
+        settings_mock.manager_url = 'http://manager:8080'
+        yield settings_mock
+
+
+def create_uploader(tmpdir, batch_size):
+    uploader = ReportUploader(batch_size=batch_size, batch_delay=0.2, spool_dir=str(tmpdir), queue_size=10, timeout=1)
+    uploader.session = Mock()
+    return uploader
+
+
+def test_single_report(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    report = saved_report()
+    uploader.submit(report, fields=dict(testcase_id='TBB-1'))
+    uploader.stop()
+
+    assert not os.path.exists(report.full_path)
+    (url,), kwargs = uploader.session.post.call_args
+    assert url == 'http://manager:8080/reports'
+    assert kwargs['data'] == dict(testcase_id='TBB-1')
+    name, (filename, content, content_type) = kwargs['files'][0]
+    assert zlib.decompress(content) == b'<html>report</html>'
+    assert uploader.get_metrics()['uploaded'] == 1
+
+
+def test_batch(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=3)
+    for i in range(3):
+        uploader.submit(saved_report(), fields=dict(testcase_id='TBB-%d' % i))
+    uploader.stop()
+
+    uploader.session.post.assert_called_once()
+    (url,), kwargs = uploader.session.post.call_args
+    assert url == 'http://manager:8080/reports/batch'
+    assert json.loads(kwargs['data']['reports']) == [dict(testcase_id='TBB-%d' % i) for i in range(3)]
+    assert len(kwargs['files']) == 3
+    metrics = uploader.get_metrics()
+    assert metrics['requests'] == 1
+    assert metrics['uploaded'] == 3
+
+
+def test_spool_and_replay(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    uploader.session.post.side_effect = requests.ConnectionError('manager is down')
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-1'))
+    uploader.stop()
+    assert len(os.listdir(str(tmpdir))) == 1
+    assert uploader.get_metrics()['spooled'] == 1
+
+    uploader.session.post.side_effect = None
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-2'))
+    uploader.stop()
+
+    assert os.listdir(str(tmpdir)) == []
+    uploaded = [kwargs['data']['testcase_id'] for _, kwargs in uploader.session.post.call_args_list[1:]]
+    assert uploaded == ['TBB-2', 'TBB-1']
+    metrics = uploader.get_metrics()
+    assert metrics['replayed'] == 1
+    assert metrics['failed_requests'] == 1
+
+
+def test_submit_during_stop(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    uploader.session.post.side_effect = lambda *args, **kwargs: time.sleep(0.3) or Mock()
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-1'))
+    stopping = threading.Thread(target=uploader.stop)
+    stopping.start()
+    time.sleep(0.1)
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-2'))  # test finishing while stress is stopped
+    stopping.join(timeout=5)
+    assert not stopping.is_alive()
+
+    stopping = threading.Thread(target=uploader.stop)
+    stopping.start()
+    stopping.join(timeout=5)
+    assert not stopping.is_alive()
+    assert uploader.get_metrics()['uploaded'] == 2
+
+
+def test_pickle(tmpdir):
+    uploader = pickle.loads(pickle.dumps(ReportUploader(batch_size=3, batch_delay=0.2, spool_dir=str(tmpdir),
+                                                        queue_size=10, timeout=1)))
+    assert (uploader.batch_size, uploader.queue.maxsize, uploader.spool_dir) == (3, 10, str(tmpdir))
+
+
+def test_replay_order(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    uploader.session.post.side_effect = requests.ConnectionError('manager is down')
+    for i in range(12):
+        uploader.submit(saved_report(), fields=dict(testcase_id='TBB-%d' % i))
+        uploader.stop()
+
+    uploader.session.post.side_effect = None
+    uploader.session.post.reset_mock()
+    uploader._replay_spool()
+    uploaded = [kwargs['data']['testcase_id'] for _, kwargs in uploader.session.post.call_args_list]
+    assert uploaded == ['TBB-%d' % i for i in range(12)]
+
+
+def test_broken_spool_file(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    tmpdir.join('00000000000000000000_0000000000_1.report').write('broken')
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-1'))
+    uploader.stop()
+
+    assert os.listdir(str(tmpdir)) == ['00000000000000000000_0000000000_1.report.broken']
+    uploaded = [kwargs['data']['testcase_id'] for _, kwargs in uploader.session.post.call_args_list]
+    assert uploaded == ['TBB-1']
+    assert uploader.get_metrics()['lost'] == 1
+
+
+def test_spool_failure_keeps_thread(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    uploader.session.post.side_effect = requests.ConnectionError('manager is down')
+    with patch('bl.executor.report_uploader.pickle.dump', side_effect=OSError('No space left on device')):
+        uploader.submit(saved_report(), fields=dict(testcase_id='TBB-1'))
+        uploader.submit(saved_report(), fields=dict(testcase_id='TBB-2'))
+        time.sleep(0.5)
+        assert uploader._thread.is_alive()
+        uploader.stop()
+    metrics = uploader.get_metrics()
+    assert (metrics['lost'], metrics['spooled']) == (2, 0)
+
+
+def test_failed_thread_is_restarted(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    with patch.object(uploader, '_upload', side_effect=RuntimeError('bug')):
+        uploader.submit(saved_report(), fields=dict(testcase_id='TBB-1'))
+        for _ in range(50):
+            if not uploader._thread:
+                break
+            time.sleep(0.1)
+    assert uploader._thread is None
+
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-2'))
+    uploader.stop()
+    assert uploader.get_metrics()['uploaded'] == 1
+
+
+def test_stop_stuck_thread(settings, tmpdir):
+    uploader = create_uploader(tmpdir, batch_size=1)
+    posted, uploaded = threading.Event(), threading.Event()
+    uploader.session.post.side_effect = lambda *args, **kwargs: posted.set() or uploaded.wait() or Mock()
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-0'))
+    assert posted.wait(timeout=5)
+    for i in range(1, 11):  # one report is being uploaded, queue is full
+        uploader.submit(saved_report(), fields=dict(testcase_id='TBB-%d' % i))
+    started = time.monotonic()
+    uploader.stop()
+    assert time.monotonic() - started < 5
+    uploader.submit(saved_report(), fields=dict(testcase_id='TBB-11'))  # submit is not blocked by stuck thread
+    uploaded.set()
+    uploader.stop()
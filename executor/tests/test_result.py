@@ -1,17 +1,21 @@
-from bl.executor.result import Result
-from unittest.mock import patch
+from bl.executor.result import Result, StressResult
+from unittest.mock import Mock, patch
 from bl.paths import Paths
 import os
+import pickle
+import pytest
 from xml.etree import ElementTree as ET
 
 
-@patch('bl.executor.result.Result.current_time', return_value='1')
+@pytest.mark.parametrize('streaming', [True, False])
+@patch('bl.executor.log_store.LogStore.format_time', return_value='1')
 @patch('bl.executor.result.Settings')
 @patch('bl.executor.result.step')
 @patch('bl.executor.result.context')
-def test_result_log(current_time, context_mock, step_mock, settings_mock):
+def test_result_log(context_mock, step_mock, settings_mock, current_time, streaming):
     xml_report = os.path.join(Paths.reports(), 'TBB-0___1.xml')
     html_report = os.path.join(Paths.html_reports(), 'TBB-0___1.html')
+    settings_mock.get.side_effect = lambda name, **kwargs: streaming if name == 'html_report_streaming' else True
 
     with Result(run_number=1) as result:
         result.testcase_id = 'TBB-0'
@@ -35,3 +39,95 @@ def test_result_log(current_time, context_mock, step_mock, settings_mock):
     assert html_attach['name'] == 'TBB-0___1.html'
     assert html_attach['path'] == html_report
     assert html_attach['type'] == '5'
+    with open(html_report) as file:
+        assert 'hello world' in file.read()
+
+
+@patch('bl.executor.result.Settings')
+@patch('bl.executor.result.step')
+@patch('bl.executor.result.context')
+def test_result_report_pipeline(context_mock, step_mock, settings_mock):
+    report_pipeline = Mock()
+    with Result(run_number=1, report_pipeline=report_pipeline) as result:
+        result.testcase_id = 'TBB-0'
+        raise ValueError('error')
+
+    report_pipeline.submit.assert_called_once_with(result)
+    assert result.get_result() == Result.Error
+    assert not result.report_saved.is_set()
+
+    result.write_report()
+    assert result.report_saved.is_set()
+
+
+@patch('bl.executor.result.Settings')
+@patch('bl.executor.result.step')
+@patch('bl.executor.result.context')
+def test_result_report_writer(context_mock, step_mock, settings_mock):
+    report_pipeline = Mock()
+    with Result(run_number=1, report_pipeline=report_pipeline) as result:
+        result.testcase_id = 'TBB-0'
+        result.report_writer = Mock()
+
+    result.report_writer.assert_called_once_with(result)
+    report_pipeline.submit.assert_not_called()
+    result.save_report()
+    report_pipeline.submit.assert_called_once_with(result)
+
+
+@patch('bl.executor.result.time.monotonic', side_effect=[100, 100, 100, 101, 103, 106])
+@patch('bl.executor.result.Settings')
+@patch('bl.executor.result.step')
+@patch('bl.executor.result.context')
+def test_result_steps(context_mock, step_mock, settings_mock, monotonic_mock):
+    xml_report = os.path.join(Paths.reports(), 'TBB-0___1.xml')
+    html_report = os.path.join(Paths.html_reports(), 'TBB-0___1.html')
+
+    with Result(run_number=1) as result:
+        result.testcase_id = 'TBB-0'
+        result.on_step = Mock()
+        result.current_step = Mock(number=1, description='login <user>')
+        result.current_step = Mock(number=2, description='call')
+
+    assert [(step.number, step.duration) for step in result.steps] == [(1, 2), (2, 3)]
+    assert result.current_step.number == 2
+    assert result.on_step.call_count == 2
+
+    with open(xml_report) as file:
+        steps = ET.parse(file).getroot().find('testcase/steps')
+    assert [step.attrib for step in steps] == [
+        dict(number='1', description='login <user>', start='1', end='3', duration='2'),
+        dict(number='2', description='call', start='3', end='6', duration='3')]
+
+    with open(html_report) as file:
+        assert '"steps": [{"number": 1, "description": "login <user>", "start": 1, "end": 3, "duration": 2}' in file.read()
+
+
+def test_factories_are_picklable():
+    # factories are copied to spawn-started shard processes
+    for factory in (Result.Factory(run_number=1), StressResult.Factory(run_number=1)):
+        copy = pickle.loads(pickle.dumps(factory))
+        assert copy.log_retention.policy_name == factory.log_retention.policy_name
+
+
+def test_stress_uploader_created_for_manager():
+    with patch('bl.executor.result.Settings.manager_url', None, create=True):
+        assert StressResult.Factory(run_number=1).uploader is None
+    with patch('bl.executor.result.Settings.manager_url', 'http://manager:8080', create=True):
+        assert StressResult.Factory(run_number=1).uploader is not None
+
+
+@patch('bl.executor.result.Settings')
+@patch('bl.executor.result.step')
+@patch('bl.executor.result.context')
+def test_stress_report_kept_without_uploader(context_mock, step_mock, settings_mock):
+    settings_mock.get.side_effect = lambda name, **kwargs: kwargs.get('default')
+    with StressResult(run_number=1, stress_run_id=1) as result:
+        result.testcase_id = 'TBB-0'
+    html_report = os.path.join(Paths.html_reports(), 'TBB-0___1.html')
+    assert os.path.exists(html_report)
+    os.remove(html_report)
+
+
+def test_current_time():
+    assert len(Result.current_time()) == len('00:00:00.000')
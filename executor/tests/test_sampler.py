@@ -0,0 +1,45 @@
+import pytest
+from bl.assertions import PjacError
+from bl.executor.sampler import ShuffledRange, WeightedSampler
+
+
+def test_distribution():
+    sampler = WeightedSampler([('TBB-1', 10), ('TBB-2', 20), ('TBB-3', 70)])
+    run_count = 100000
+    items = sampler.sample_many(run_count) + [sampler.sample() for _ in range(run_count)]
+
+    assert items.count('TBB-1') / (2 * run_count) == pytest.approx(0.1, abs=0.01)
+    assert items.count('TBB-2') / (2 * run_count) == pytest.approx(0.2, abs=0.01)
+    assert items.count('TBB-3') / (2 * run_count) == pytest.approx(0.7, abs=0.01)
+
+
+def test_normalisation():
+    sampler = WeightedSampler([('TBB-1', 0), ('TBB-2', 1), ('TBB-3', 3)])
+    assert sampler.percents == [('TBB-1', 0), ('TBB-2', 25), ('TBB-3', 75)]
+    assert 'TBB-1' not in sampler.sample_many(10000)
+
+
+def test_single_item():
+    assert WeightedSampler([('TBB-1', 0.5)]).sample_many(3) == ['TBB-1', 'TBB-1', 'TBB-1']
+
+
+@pytest.mark.parametrize('items_weights', [[],
+                                           [('TBB-1', 0), ('TBB-2', 0)],
+                                           [('TBB-1', -1), ('TBB-2', 2)],
+                                           [('TBB-1', '10')],
+                                           [('TBB-1', float('nan'))],
+                                           [('TBB-1', True)]])
+def test_invalid_weights(items_weights):
+    with pytest.raises(PjacError):
+        WeightedSampler(items_weights)
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 5, 16, 17, 1000])
+def test_shuffled_range_is_permutation(count):
+    assert sorted(ShuffledRange(count)) == list(range(count))
+
+
+def test_shuffled_range_seed():
+    assert list(ShuffledRange(100, seed=1)) == list(ShuffledRange(100, seed=1))
+    assert list(ShuffledRange(100, seed=1)) != list(ShuffledRange(100, seed=2))
+    assert list(ShuffledRange(100, seed=1)) != list(range(100))
@@ -0,0 +1,80 @@
+import pytest
+
+from bl.executor.scheduler import FairShareQueue, Priority, parse_weights
+
+
+def get_all(tasks):
+    return [tasks.get_nowait() for _ in range(tasks.qsize())]
+
+
+def test_priority_classes():
+    tasks = FairShareQueue()
+    tasks.push('bulk-1', tenant='TBB-1')
+    tasks.push('low-1', priority=Priority.LOW, tenant='TBB-1')
+    tasks.push('action-1', priority=Priority.HIGH, tenant='client')
+    tasks.put_front('stop', 2)
+    tasks.put_behind('bulk-0', lambda task: task == 'stop')
+    assert get_all(tasks) == ['stop', 'stop', 'bulk-0', 'action-1', 'bulk-1', 'low-1']
+
+    metrics = tasks.get_metrics()
+    assert sorted(metrics) == ['high', 'low', 'normal']
+    assert metrics['high']['wait_time']['count'] == 1
+    assert metrics['normal']['queue_depth'] == 0
+
+    with pytest.raises(ValueError):
+        tasks.push('task', priority=5)
+
+
+def test_fair_share_between_tenants():
+    tasks = FairShareQueue()
+    for index in range(6):
+        tasks.push('heavy-%d' % index, tenant='heavy')
+    tasks.push('light-0', tenant='light')
+    tasks.push('light-1', tenant='light')
+    assert get_all(tasks) == ['heavy-0', 'light-0', 'heavy-1', 'light-1', 'heavy-2', 'heavy-3', 'heavy-4', 'heavy-5']
+
+
+def test_weighted_fair_share():
+    tasks = FairShareQueue(weights=dict(a=3))
+    for index in range(8):
+        tasks.push('a', tenant='a')
+        tasks.push('b', tenant='b')
+    assert get_all(tasks)[:8].count('a') == 6
+
+    tasks.set_weight('b', 3)
+    with pytest.raises(ValueError):
+        tasks.set_weight('b', 0)
+
+
+def test_idle_tenant_does_not_claim_share_back():
+    tasks = FairShareQueue()
+    for index in range(4):
+        tasks.push('a-%d' % index, tenant='a')
+    assert [tasks.get_nowait() for _ in range(3)] == ['a-0', 'a-1', 'a-2']
+    tasks.push('a-4', tenant='a')
+    tasks.push('b-0', tenant='b')
+    tasks.push('b-1', tenant='b')
+    assert get_all(tasks) == ['b-0', 'a-3', 'b-1', 'a-4']  # b starts at a's virtual time, not at 0
+
+
+def test_clear_and_drain():
+    tasks = FairShareQueue()
+    tasks.push(1, tenant='a')
+    tasks.push(2, tenant='b')
+    tasks.push(3, priority=Priority.HIGH, tenant='a')
+    tasks.put_front(0, 2)
+    assert sorted(tasks.drain(lambda task: task % 2)) == [1, 3]
+    assert tasks.qsize() == 3
+    assert tasks.clear(lambda task: task != 0) == 1
+    assert get_all(tasks) == [0, 0]
+
+    tasks.push(4, tenant='a')
+    assert tasks.clear() == 1
+    assert tasks.qsize() == 0
+
+
+def test_parse_weights():
+    assert parse_weights('') == {}
+    assert parse_weights('TBB-1:2, client:0.5') == {'TBB-1': 2.0, 'client': 0.5}
+    with pytest.raises(ValueError):
+        parse_weights('TBB-1:0')
@@ -1,5 +1,12 @@
 from bl.executor.service_load_generator import StressLoadGenerator
-from unittest.mock import Mock, patch
+from bl.executor.service_load_generator import ServiceLoadGenerator, resolve_class
+from bl.executor.result import Result, ResultSummary
+from bl.executor.scheduler import Priority
+from bl.executor.test import State
+from bl.assertions import PjacError
+import threading
+import time
+from unittest.mock import Mock, call, patch
 
 
 @patch('bl.executor.service_load_generator.Stresser')
@@ -24,23 +31,192 @@ def test_service_load_generator(stresser_mock):
                                                                                 ('TBB-3', 50)],
                                                             threads=20)
 
+    set_testcases_response = service_load._set_testcases(create_request({'testcases': [{'id': 'TBB-4', 'percent': 1}]}))
+    assert set_testcases_response.status_code == 200
+    stresser_mock.return_value.set_testcases.assert_called_with([('TBB-4', 1)])
+
+    stresser_mock.return_value.set_testcases.side_effect = PjacError('Testcases mix is empty', verbose=False)
+    set_testcases_response = service_load._set_testcases(create_request({'testcases': []}))
+    assert set_testcases_response.status_code == 400
+    assert set_testcases_response.buffer[0].decode() == '{"result":"error","error_description":"Testcases mix is empty"}'
+
     set_threads_response = service_load._set_threads(create_request(dict(threads=30)))
     assert set_threads_response.status_code == 200
     assert set_threads_response.buffer[0].decode() == '{"result":"ok"}'
     stresser_mock.return_value.set_threads.assert_called_with(30)
 
+    set_rate_response = service_load._set_rate(create_request(dict(rate=50, distribution='constant')))
+    assert set_rate_response.status_code == 200
+    stresser_mock.return_value.set_rate.assert_called_with(rate=50, distribution='constant')
+
+    stresser_mock.return_value.set_rate.side_effect = ValueError('Unknown distribution gauss')
+    set_rate_response = service_load._set_rate(create_request(dict(rate=50, distribution='gauss')))
+    assert set_rate_response.status_code == 400
+
+    bounds_response = service_load._set_concurrency_bounds(create_request(dict(min_threads=2, max_threads=50)))
+    assert bounds_response.status_code == 200
+    stresser_mock.return_value.set_concurrency_bounds.assert_called_with(min_threads=2, max_threads=50)
+
+    stresser_mock.return_value.set_concurrency_bounds.side_effect = PjacError('Adaptive concurrency is disabled',
+                                                                              verbose=False)
+    bounds_response = service_load._set_concurrency_bounds(create_request(dict(max_threads=50)))
+    assert bounds_response.status_code == 409
+
     set_threads_response = service_load._stop_tests(create_request())
     assert set_threads_response.status_code == 200
     assert set_threads_response.buffer[0].decode() == '{"result":"ok"}'
     stresser_mock.return_value.stop_tests.assert_called()
 
     stresser_mock.return_value.get_status.return_value = ('Running', 123, 20)
+    stresser_mock.return_value.get_statistics.return_value = dict(rate=None)
     get_status_response = service_load._get_status(create_request())
+    stresser_mock.return_value.get_statistics.assert_called_with(reset_latency=False)
     assert get_status_response.status_code == 200
-    assert get_status_response.buffer[0].decode() == '{"result":"ok","status":"Running","run_seconds":123,"threads":20}'
+    assert get_status_response.buffer[0].decode() == '{"result":"ok","status":"Running","run_seconds":123,"threads":20,' \
+                                                     '"rate":null}'
+
+
+def test_service_actions_registry():
+    test = Mock(run_id='test-1', testcase_id='TBB-1', state=State.NOT_STARTED, duration=2)
+    test.result.get_result.return_value = Result.Failure
+    test.result.start_time = None
+    load_generator = Mock(address='http://node:8080/')
+    service_load = ServiceLoadGenerator(test_factory=Mock(return_value=test), workers=Mock(), load_generator=load_generator)
+    service_load.actions.max_size = 1
+
+    post_response = service_load.on_post_action(create_request(dict(testcase_id='TBB-1')))
+    assert post_response.status_code == 201
+    assert test.on_finished == service_load.actions.on_finished
+    assert service_load.on_get_action(create_request(dict(action_id='test-1'))).status_code == 200
+    assert service_load.on_get_action_report(create_request(dict(action_id='test-1'))).status_code == 409
+
+    test.result._report_file_name.return_value = __file__
+    test.on_finished(test)
+    assert service_load.on_get_action_report(create_request(dict(action_id='test-1'))).status_code == 200
+    test.result.report_saved.is_set.return_value = False
+    assert service_load.on_get_action_html_report(create_request(dict(action_id='test-1'))).status_code == 409
+    get_response = service_load.on_get_action(create_request(dict(action_id='test-1')))
+    assert get_response.status_code == 200
+    assert get_response.buffer[0].decode() == '{"result":"OK","status":"FAIL","duration":2}'
+
+    service_load.actions.add(Mock(run_id='test-2'))
+    service_load.actions.on_finished(Mock(run_id='test-2', duration=1))
+    assert service_load.on_get_action(create_request(dict(action_id='test-1'))).status_code == 410
+    assert service_load.on_get_action(create_request(dict(action_id='test-3'))).status_code == 404
+    assert service_load.on_get_action_report(create_request(dict(action_id='test-1'))).status_code == 410
+
+    registry_response = service_load.on_get_registry(create_request())
+    assert registry_response.status_code == 200
+    assert '"evicted":1' in registry_response.buffer[0].decode()
+
+
+def test_service_cancelled_action_report():
+    test = Mock(run_id='test-1', testcase_id='TBB-1', state=State.NOT_STARTED, duration=0)
+    service_load = ServiceLoadGenerator(test_factory=Mock(return_value=test), workers=Mock(), load_generator=Mock(address=''))
+    service_load.on_post_action(create_request(dict(testcase_id='TBB-1')))
+
+    test.result = ResultSummary(Result.Skip, exception_message='Test was shed')  # cancelled test has no reports
+    test.on_finished(test)
+    assert service_load.on_get_action_report(create_request(dict(action_id='test-1'))).status_code == 404
+    assert service_load.on_get_action_html_report(create_request(dict(action_id='test-1'))).status_code == 404
+
+
+def test_service_action_long_poll_and_events():
+    test = Mock(run_id='test-1', testcase_id='TBB-1', state=State.NOT_STARTED, duration=2, result=None)
+    service_load = ServiceLoadGenerator(test_factory=Mock(return_value=test), workers=Mock(), load_generator=Mock(address=''))
+    service_load.on_post_action(create_request(dict(testcase_id='TBB-1')))
+
+    def run():
+        time.sleep(0.1)
+        test.state = State.RUNNING
+        test.on_started(test)
+        test.result = Mock(current_step=None, start_time=None)
+        test.result.get_result.return_value = Result.Success
+        for number in (1, 2):
+            time.sleep(0.1)
+            test.result.current_step = Mock(number=number, description='step %d' % number)
+            test.on_step(test)
+        time.sleep(0.1)
+        test.on_finished(test)
+
+    events_response = service_load.on_get_action_events(create_request(dict(action_id='test-1')))
+    thread = threading.Thread(target=run)
+    thread.start()
+    poll_response = service_load.on_get_action(create_request(dict(action_id='test-1'), query=dict(wait_for='RUNNING')))
+    assert '"status":"RUNNING"' in poll_response.buffer[0].decode()
+
+    start_response = Mock()
+    events = [event.decode() for event in events_response(start_response)]
+    assert start_response.call_args[0][0] == '200 OK'
+    assert ('Content-Type', 'text/event-stream; charset=UTF-8') in start_response.call_args[0][1]
+    assert events[0].startswith('event: status\ndata: {"status":"RUNNING"')  # stream is started after long-poll
+    assert '"current_step_number":2' in events[-2]
+    assert events[-1] == 'event: status\ndata: {"result":"OK","status":"PASS","duration":2}\n\n'
+
+    poll_response = service_load.on_get_action(create_request(dict(action_id='test-1'),
+                                                              query=dict(wait_for='FINISHED', timeout='5')))
+    assert poll_response.buffer[0].decode() == '{"result":"OK","status":"PASS","duration":2}'
+    thread.join()
+
+    assert service_load.actions.waiters_count == 0
+    bad_response = service_load.on_get_action(create_request(dict(action_id='test-1'), query=dict(wait_for='DONE')))
+    assert bad_response.status_code == 400
+    assert service_load.on_get_action_events(create_request(dict(action_id='test-2'))).status_code == 404
+
+
+def test_service_action_events_waiters():
+    test = Mock(run_id='test-1', testcase_id='TBB-1', state=State.NOT_STARTED, result=None)
+    service_load = ServiceLoadGenerator(test_factory=Mock(return_value=test), workers=Mock(), load_generator=Mock(address=''))
+    service_load.max_waiters = 1
+    service_load.on_post_action(create_request(dict(action_id='test-1', testcase_id='TBB-1')))
+
+    events = service_load.on_get_action_events(create_request(dict(action_id='test-1')))(Mock())
+    assert service_load.actions.waiters_count == 0  # client is counted when stream is opened
+    next(events)
+    assert service_load.actions.waiters_count == 1  # between waits client is still counted
+    assert service_load.on_get_action_events(create_request(dict(action_id='test-1'))).status_code == 503
+    events.close()  # client disconnected
+    assert service_load.actions.waiters_count == 0
+
+
+@patch('bl.executor.service_load_generator.import_module')
+def test_service_actions_batch(import_module_mock):
+    resolve_class.cache_clear()
+    tests = [Mock(run_id='test-%d' % index) for index in range(4)]
+    workers = Mock()
+    service_load = ServiceLoadGenerator(test_factory=Mock(side_effect=tests), workers=workers,
+                                        load_generator=Mock(address='http://node:8080/'))
+    actions = [dict(testcase_id='TBB-%d' % index, args=dict(number={'bl.phone_numbers.PstnNumber': dict(index=index)}))
+               for index in range(3)]
+
+    batch_response = service_load.on_post_actions_batch(create_request(dict(actions=actions)))
+    assert batch_response.status_code == 201
+    import_module_mock.assert_called_once_with('bl.phone_numbers')
+    import_module_mock.return_value.PstnNumber.assert_called_with(index=2)
+    assert workers.push.mock_calls == [call(test, priority=Priority.HIGH, tenant=None) for test in tests[:3]]
+    assert '"status_url":"http://node:8080/actions/test-2"' in batch_response.buffer[0].decode()
+    assert '"submit_seconds":' in batch_response.buffer[0].decode()
+    assert len(service_load.actions) == 3
+
+    invalid_response = service_load.on_post_actions_batch(create_request(dict(actions=[dict(testcase_id='TBB-1'),
+                                                                                       dict(args={})])))
+    assert invalid_response.status_code == 400
+    assert 'action 1' in invalid_response.buffer[0].decode()
+    assert len(workers.push.mock_calls) == 3  # invalid batch is not submitted partially
+    assert service_load.on_post_actions_batch(create_request(dict(actions=[]))).status_code == 400
+
+
+    form = dict(testcase_id='TBB-1', args=dict(number={'bl.phone_numbers.PstnNumber': dict(index=0)}))
+    assert service_load.on_post_action(create_request(form)).status_code == 201
+    assert form['args']['number'] == {'bl.phone_numbers.PstnNumber': dict(index=0)}  # form is not changed
+    invalid_response = service_load.on_post_action(create_request(dict(testcase_id='TBB-1', args=dict(number='x'))))
+    assert invalid_response.status_code == 400
+    assert 'Invalid args' in invalid_response.buffer[0].decode()
 
 
-def create_request(body={}):
+def create_request(body={}, query={}):
     run_request = Mock()
     run_request.form = body
+    run_request.get_param = query.get
+    run_request.environ = dict(route_args=Mock(action_id=body.get('action_id')))
     return run_request
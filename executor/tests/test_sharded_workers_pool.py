@@ -0,0 +1,136 @@
+import os
+import time
+from unittest.mock import Mock
+
+from bl.settings import Settings
+
+from bl.executor import ShardedWorkersPool
+from bl.executor.result import Result, StepTiming
+from bl.unittest_testcase import PjacUnitTestCase
+
+
+class FakeResultFactory:
+    stress_run_id = None
+
+
+class FakeTest:
+    def __init__(self, testcase_id, load_generator, arguments=None, result_factory=None):
+        self.testcase_id = testcase_id
+        self.result_factory = result_factory
+        self.arguments = arguments or {}
+        self.load_generator = load_generator
+        self.run_id = None
+        self.result = None
+        self.duration = None
+        self.cancelled = False
+        self.on_started = lambda test: None
+        self.on_finished = lambda test: None
+
+    def run(self):
+        self.on_started(self)
+        if self.testcase_id == 'FORK':
+            self.load_generator.add_test(testcase_id='T-1', arguments=dict(pid=os.getpid()))
+        if self.testcase_id == 'STRESS_RUN_ID':
+            self.load_generator.add_test(testcase_id='T-1',
+                                         arguments=dict(stress_run_id=self.result_factory.stress_run_id))
+        self.result = Mock()
+        self.result.get_result.return_value = Result.Failure if self.testcase_id == 'FAIL' else Result.Success
+        self.result.steps = [StepTiming(number=1, description='login', start=10, end=10.25)]
+        self.duration = 0.5
+        self.on_finished(self)
+
+    def cancel(self, reason):
+        self.cancelled = True
+        self.result = Mock()
+        self.result.get_result.return_value = Result.Skip
+        self.result.steps = []
+        self.on_finished(self)
+
+
+class FakeTestFactory:
+    def __init__(self):
+        self.result_factory = FakeResultFactory()
+
+    def __call__(self, testcase_id, load_generator, arguments):
+        return FakeTest(testcase_id=testcase_id, load_generator=load_generator, arguments=arguments,
+                        result_factory=self.result_factory)
+
+
+def parent_test(run_id, testcase_id):
+    test = Mock()
+    test.run_id = run_id
+    test.testcase_id = testcase_id
+    test.arguments = {}
+    test.cancelled = False
+    return test
+
+
+class Tests(PjacUnitTestCase):
+
+    def setUp(self):
+        super(Tests, self).setUp()
+        Settings.set('cpu_throtlng_percent', 100)
+        Settings.set('workers_shards_start_method', 'fork')
+
+    def tearDown(self):
+        super(Tests, self).tearDown()
+        Settings.reset()
+
+    def test_threads_distributed_over_shards(self):
+        with ShardedWorkersPool(test_factory=FakeTestFactory(), count=5, shards=2) as pool:
+            time.sleep(1)
+            self.assertEqual(sorted(shard.threads for shard in pool.shards), [2, 3])
+            self.assertEqual(pool.workers_count(), 5)
+
+    def test_callbacks_and_counters_aggregated(self):
+        with ShardedWorkersPool(test_factory=FakeTestFactory(), count=4, shards=2) as pool:
+            tests = [parent_test('test-%d' % i, 'FAIL' if i % 2 else 'T-1') for i in range(10)]
+            for test in tests:
+                pool.push(test)
+
+            time.sleep(2)
+            for test in tests:
+                test.on_started.assert_called_with(test)
+                test.on_finished.assert_called_with(test)
+            self.assertEqual(pool.finished_count, 10)
+            self.assertEqual(pool.failed_count, 5)
+            self.assertEqual(tests[1].result.get_result(), Result.Failure)
+            self.assertEqual(tests[2].result.get_result(), Result.Success)
+            self.assertEqual(tests[2].duration, 0.5)
+            self.assertEqual(tests[2].result.steps[0].duration, 0.25)
+
+    def test_fork_forwarded_to_parent(self):
+        with ShardedWorkersPool(test_factory=FakeTestFactory(), count=1, shards=1) as pool:
+            test = parent_test('test-0', 'FORK')
+            pool.push(test)
+
+            time.sleep(2)
+            test.load_generator.add_test.assert_called_with(testcase_id='T-1',
+                                                            arguments=dict(pid=pool.shards[0].process.pid))
+
+    def test_stress_run_id_sent_to_shards(self):
+        test_factory = FakeTestFactory()
+        with ShardedWorkersPool(test_factory=test_factory, count=1, shards=1) as pool:
+            test_factory.result_factory.stress_run_id = 'stress-1'  # set by Stresser after shards are started
+            test = parent_test('test-0', 'STRESS_RUN_ID')
+            pool.push(test)
+
+            time.sleep(2)
+            test.load_generator.add_test.assert_called_with(testcase_id='T-1', arguments=dict(stress_run_id='stress-1'))
+
+    def test_flush_reports(self):
+        with ShardedWorkersPool(test_factory=FakeTestFactory(), count=1, shards=2, flush_timeout=5) as pool:
+            pool.flush_reports()
+            self.assertTrue(all(shard.flushed.is_set() for shard in pool.shards))
+
+    def test_cancelled_test_is_not_run(self):
+        with ShardedWorkersPool(test_factory=FakeTestFactory(), count=1, shards=1) as pool:
+            test = parent_test('test-0', 'FORK')
+            test.cancelled = True
+            pool.push(test)
+
+            time.sleep(2)
+            test.load_generator.add_test.assert_not_called()  # test body did not run in shard
+            test.on_finished.assert_called_with(test)
+            self.assertEqual(test.result.get_result(), Result.Skip)
+            self.assertTrue(test.cancelled)
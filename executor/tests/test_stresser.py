@@ -1,6 +1,11 @@
-from bl.executor.stresser import Stresser, Status
+from bl.executor.stresser import Stresser, Status, Distribution
+from bl.assertions import PjacError
+from bl.settings import Settings
+from bl.executor.memory_guard import MemoryState
+from bl.executor.result import Result, StepTiming
 from mock import Mock, patch
 import pytest
+import time
 
 
 @patch('bl.executor.stresser.Stresser.add_test')
@@ -26,10 +31,35 @@ def test_percent_zero():
 
 def test_percent_all_zeroes():
     stresser = Stresser(test_factory=Mock(), workers=Mock())
-    stresser.testcases_percents = [('TBB-1', 0), ('TBB-2', 0)]
+    with pytest.raises(PjacError):
+        stresser.testcases_percents = [('TBB-1', 0), ('TBB-2', 0)]
     assert stresser.get_next_testcase_id() is None
 
 
+def test_percent_not_normalised():
+    stresser = Stresser(test_factory=Mock(), workers=Mock())
+    stresser.testcases_percents = [('TBB-1', 1), ('TBB-2', 3)]
+    testcase_ids = [stresser.get_next_testcase_id() for _ in range(10000)]
+    assert testcase_ids.count('TBB-1') / 10000 == pytest.approx(0.25, abs=0.02)
+
+
+def test_set_testcases_during_run():
+    workers = Mock()
+    test_factory = Mock()
+    stresser = Stresser(test_factory=test_factory, workers=workers)
+    stresser.run_tests(run_id=1, testcases_percents=[('TBB-1', 100)], threads=3)
+    assert list(test_factory.preload.call_args[0][0]) == ['TBB-1']
+
+    stresser.set_testcases([('TBB-2', 50), ('TBB-3', 50)])
+    assert list(test_factory.preload.call_args[0][0]) == ['TBB-2', 'TBB-3']
+    assert stresser.get_next_testcase_id() in ('TBB-2', 'TBB-3')
+    workers.reset.assert_not_called()
+
+    with pytest.raises(PjacError):
+        stresser.set_testcases([('TBB-4', -1)])
+    assert stresser.testcases_percents == [('TBB-2', 50), ('TBB-3', 50)]
+
+
 def test_run_stop_tests():
     thread_count = 3
     worker_mock = Mock()
@@ -47,3 +77,144 @@ def test_run_stop_tests():
     worker_mock.reset.assert_called_with()
 
 
+@pytest.mark.parametrize('distribution', [Distribution.CONSTANT, Distribution.POISSON])
+def test_open_model_rate(distribution):
+    workers = Mock()
+    workers.workers_count.return_value = 1000
+    stresser = Stresser(test_factory=Mock(), workers=workers)
+    stresser.set_rate(rate=200, distribution=distribution)
+    stresser.run_tests(run_id=1, testcases_percents=[('TBB-1', 100)], threads=10)
+
+    time.sleep(1)
+    stresser.stop()
+    assert len(workers.push.mock_calls) == pytest.approx(200, rel=0.2)
+
+    test = workers.push.mock_calls[0][1][0]
+    test.duration = 0.1
+    test.cancelled = False
+    test.result.steps = []
+    stresser._on_finished(test)  # finished test does not trigger new one in open model
+    assert len(workers.push.mock_calls) == pytest.approx(200, rel=0.2)
+    assert stresser.get_rate_status()['overloaded'] is False
+
+
+def test_open_model_overloaded():
+    workers = Mock()
+    workers.workers_count.return_value = 5
+    stresser = Stresser(test_factory=Mock(), workers=workers)
+    stresser.run_tests(run_id=1, testcases_percents=[('TBB-1', 100)], threads=5)
+    assert len(workers.push.mock_calls) == 5
+
+    stresser.set_rate(rate=100)
+    time.sleep(0.5)
+    rate_status = stresser.get_statistics()['rate']
+    stresser.stop()
+    assert rate_status['overloaded'] is True
+    assert rate_status['backlog'] > 5
+
+    stresser.stop_tests()  # queued tests are dropped, so backlog of next run starts from zero
+    assert stresser.get_rate_status()['backlog'] == 0
+    assert stresser.get_rate_status()['overloaded'] is False
+
+    stresser.set_rate(rate=None)
+    assert stresser.get_rate_status() is None
+
+
+def test_invalid_distribution():
+    stresser = Stresser(test_factory=Mock(), workers=Mock())
+    with pytest.raises(ValueError):
+        stresser.set_rate(rate=10, distribution='gauss')
+
+
+@pytest.mark.parametrize('rate', [None, 0, '0', '0.0', -10, '-0.5'])
+def test_not_positive_rate(rate):
+    stresser = Stresser(test_factory=Mock(), workers=Mock())
+    stresser.set_rate(rate=5)
+    stresser.set_rate(rate=rate)
+    assert stresser.rate is None
+
+
+def test_string_rate():
+    stresser = Stresser(test_factory=Mock(), workers=Mock())
+    stresser.set_rate(rate='2.5')
+    assert stresser.rate == 2.5
+    with pytest.raises(ValueError):
+        stresser.set_rate(rate='fast')
+
+
+def test_latency_window():
+    stresser = Stresser(test_factory=Mock(), workers=Mock())
+    stresser.run_tests(run_id=1, testcases_percents=[('TBB-1', 100)], threads=1)
+    for duration in (0.1, 0.2, 0.3, 0.4):
+        test = Mock(testcase_id='TBB-1', duration=duration, cancelled=False)
+        test.result.get_result.return_value = Result.Success
+        test.result.steps = [StepTiming(number=1, description='login', start=0, end=duration / 2),
+                             StepTiming(number=2, description='call', start=duration / 2, end=duration)]
+        stresser._on_finished(test)
+
+    statistics = stresser.get_statistics(reset_latency=True)
+    assert statistics['latency']['TBB-1']['success']['count'] == 4
+    assert statistics['latency']['TBB-1']['success']['p50'] == pytest.approx(0.2, rel=0.01)
+    assert sorted(statistics['step_latency']['TBB-1']) == [1, 2]
+    assert statistics['step_latency']['TBB-1'][2]['max'] == pytest.approx(0.2)
+    assert stresser.get_statistics()['latency'] == {}
+    assert stresser.get_statistics()['step_latency'] == {}
+
+
+@patch('bl.executor.stresser.ConcurrencyController')
+def test_adaptive_concurrency(controller_mock):
+    Settings.set('adaptive_concurrency', True)
+    try:
+        workers = Mock()
+        stresser = Stresser(test_factory=Mock(), workers=workers)
+    finally:
+        Settings.reset()
+    controller = controller_mock.return_value
+    controller.target = 4
+    stresser.run_tests(run_id=1, testcases_percents=[('TBB-1', 100)], threads=10)
+    controller.start.assert_called_with(10)
+    workers.set_threads.assert_not_called()
+    assert len(workers.push.mock_calls) == 4
+
+    stresser.set_threads(8)
+    controller.set_threads.assert_called_with(8)
+
+    stresser._on_threads_changed(4, 7)  # 4 tests are queued, 3 new workers take 3 of them
+    assert len(workers.push.mock_calls) == 4
+    stresser._on_threads_changed(4, 10)
+    assert len(workers.push.mock_calls) == 6
+
+    stresser.set_concurrency_bounds(min_threads=1, max_threads=5)
+    controller.set_bounds.assert_called_with(min_threads=1, max_threads=5)
+
+    stresser.stop()
+    controller.stop.assert_called()
+
+
+def test_adaptive_concurrency_disabled():
+    stresser = Stresser(test_factory=Mock(), workers=Mock())
+    with pytest.raises(PjacError):
+        stresser.set_concurrency_bounds(max_threads=5)
+
+
+def test_shed_tests_replaced_after_memory_pressure():
+    workers = Mock()
+    stresser = Stresser(test_factory=Mock(), workers=workers)
+    workers.memory_guard.add_listener.assert_called_with(stresser._on_memory_state)
+    stresser.run_tests(run_id=1, testcases_percents=[('TBB-1', 100)], threads=3)
+    assert len(workers.push.mock_calls) == 3
+
+    for _ in range(2):
+        test = Mock(testcase_id='TBB-1', duration=None, cancelled=True)
+        test.result.get_result.return_value = Result.Skip
+        test.result.steps = []
+        stresser._on_finished(test)
+    assert len(workers.push.mock_calls) == 3  # shed tests are not replaced under memory pressure
+    assert (stresser.finished_count, stresser.cancelled_count) == (0, 2)
+    assert stresser.get_statistics()['cancelled'] == 2
+
+    stresser._on_memory_state(MemoryState.SOFT)
+    assert len(workers.push.mock_calls) == 3
+    stresser._on_memory_state(MemoryState.OK)
+    assert len(workers.push.mock_calls) == 5
+    assert stresser.get_statistics()['memory'] is not None
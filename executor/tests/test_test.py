@@ -1,5 +1,12 @@
+import asyncio
+import threading
+
+import pytest
+
+from bl.context import context
 from bl.executor.test import Test
-from unittest.mock import Mock
+from bl.executor.result import Result
+from unittest.mock import Mock, MagicMock
 
 
 def test_simple_test():
@@ -51,3 +58,85 @@ def test_not_found_write_exception():
     assert result_mock.class_name == 'not found'
     assert result_mock.exception_message == 'Test not found'
     result_factory().__exit__.assert_called()
+
+
+def test_cancel():
+    result_factory = Mock()
+    on_finished = Mock()
+    test = Test(testcase_id='TBB-1', result_factory=result_factory, storage=Mock(), load_generator=Mock())
+    test.on_finished = on_finished
+    test.cancel('memory is over hard limit')
+
+    on_finished.assert_called_once_with(test)
+    assert test.cancelled
+    assert test.state == 'FINISHED'
+    assert test.result.get_result() == Result.Skip
+    assert test.result.exception_message == 'memory is over hard limit'
+    result_factory.assert_not_called()
+
+
+def test_factory_preload():
+    storage = Mock()
+    storage.get = Mock(side_effect=lambda testcase_id: None if testcase_id == 'TBB-2' else Mock())
+    factory = Test.Factory(storage=storage, result_factory=Mock())
+    assert factory.preload(['TBB-1(x=0)', 'TBB-1', 'TBB-2']) == ['TBB-2']
+    assert storage.get.call_count == 2
+
+    test = factory(testcase_id='TBB-1(x=1)', load_generator=Mock(), arguments=None)
+    assert test.is_coroutine() is False
+    assert storage.get.call_count == 2  # test uses preloaded testcase
+
+
+def test_coroutine_tests_keep_context():
+    seen = {}
+
+    class Testcase:
+        async def run(self, arguments):
+            test = context().thread_data.test
+            for _ in range(3):
+                await asyncio.sleep(0)
+                seen.setdefault(test.run_id, set()).add((context().thread_data.test, context().result))
+
+    storage = Mock()
+    storage.get = Mock(return_value=Mock(testclass=Testcase, run=Testcase().run))
+    tests = [Test(testcase_id='TBB-1', result_factory=MagicMock(), storage=storage, load_generator=Mock())
+             for _ in range(3)]
+
+    async def run_all():
+        await asyncio.gather(*[test.run_async() for test in tests])
+
+    asyncio.run(run_all())
+    assert [seen[test.run_id] for test in tests] == [{(test, test.result)} for test in tests]
+
+
+def test_unique_run_ids_across_threads():
+    run_ids = []
+
+    def create_tests():
+        tests = [Test(testcase_id='TBB-1', result_factory=Mock(), storage=Mock(), load_generator=Mock())
+                 for _ in range(1000)]
+        run_ids.extend(test.run_id for test in tests)
+
+    threads = [threading.Thread(target=create_tests) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(run_ids)) == 8000
+
+
+def test_shared_arguments_are_not_changed():
+    def create_test(arguments=None):
+        return Test(testcase_id='TBB-1(x=0)', result_factory=MagicMock(), storage=Mock(get=Mock(return_value=None)),
+                    load_generator=Mock(), arguments=arguments)
+
+    fork = create_test(arguments=dict(y='1'))
+    assert fork.arguments == dict(x='0', y='1')
+    test = create_test()
+    assert test.arguments == dict(x='0')  # fork arguments do not leak to arguments parsed from testcase id
+    with pytest.raises(TypeError):
+        test.arguments['y'] = '2'
+
+    test.run()
+    test.result.arguments['y'] = '2'  # result gets own copy
+    assert create_test().arguments == dict(x='0')
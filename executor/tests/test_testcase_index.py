@@ -0,0 +1,53 @@
+import pickle
+import threading
+from unittest.mock import Mock
+
+from bl.executor.testcase_index import TestcaseIndex
+
+
+class Storage:
+    def __init__(self, testcases):
+        self.testcases = testcases
+        self.get_count = 0
+
+    def get(self, testcase_id):
+        self.get_count += 1
+        return self.testcases.get(testcase_id)
+
+
+class Testcase:
+    testclass = object
+
+
+def test_preload():
+    storage = Storage({'TBB-1': Mock(), 'TBB-2': Mock()})
+    index = TestcaseIndex(storage)
+    assert index.preload(['TBB-1', 'TBB-2', 'TBB-3', 'TBB-1']) == ['TBB-3']
+    assert storage.get_count == 3
+    assert sorted(index.import_seconds) == ['TBB-1', 'TBB-2', 'TBB-3']
+
+    assert index.get('TBB-1') is storage.testcases['TBB-1']
+    assert index.get('TBB-3') is None
+    assert index.preload(['TBB-2', 'TBB-3']) == ['TBB-3']
+    assert storage.get_count == 3  # resolved and missing testcases are not looked up again
+    assert len(index) == 3
+
+
+def test_get_resolves_once():
+    storage = Storage({'TBB-1': Mock()})
+    index = TestcaseIndex(storage)
+    threads = [threading.Thread(target=index.get, args=('TBB-1',)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storage.get_count == 1
+    assert index.unresolved() == []
+
+
+def test_pickle_drops_resolved_testcases():
+    index = TestcaseIndex(Storage({'TBB-1': Testcase()}))
+    index.preload(['TBB-1'])
+    copy = pickle.loads(pickle.dumps(index))
+    assert len(copy) == 0
+    assert isinstance(copy.get('TBB-1'), Testcase)
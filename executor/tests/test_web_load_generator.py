@@ -1,8 +1,14 @@
 from bl.executor.web_load_generator import WebLoadGenerator
+from bl.executor.web_load_generator import MyWSGIRequestHandler, ThreadPoolWSGIServer, TimingMiddleware
 from unittest.mock import Mock, patch
 from bl.helpers import next_free_port
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import make_server
 import logging
 import os
+import threading
+import time
+import urllib.request
 
 
 @patch('bl.executor.web_load_generator.Settings')
@@ -36,4 +42,37 @@ def test_web_load_generator(dowser_mock, settings_mock, caplog):
 
         exit_response = web_load_generator.on_exit_cmd(request=None)
         assert exit_response.status_code == 200
-        main_loop.stop.assert_called()
\ No newline at end of file
+        main_loop.stop.assert_called()
+
+
+def test_concurrent_requests(caplog):
+    def application(environ, start_response):
+        if environ['PATH_INFO'] == '/slow':
+            time.sleep(1)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [environ['PATH_INFO'].encode()]
+
+    caplog.set_level(logging.INFO)
+    server = make_server('127.0.0.1', 0, TimingMiddleware(application, slow_request=0.5),
+                         server_class=ThreadPoolWSGIServer, handler_class=MyWSGIRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    address = 'http://127.0.0.1:%d' % server.server_port
+    get = lambda path: urllib.request.urlopen(address + path, timeout=10).read().decode()
+    try:
+        with ThreadPoolExecutor(max_workers=100) as executor:
+            slow = executor.submit(get, '/slow')
+            time.sleep(0.1)
+            started = time.monotonic()
+            assert get('/get_status') == '/get_status'
+            assert time.monotonic() - started < 0.5  # slow request does not block others
+
+            polls = list(executor.map(get, ['/get_status'] * 500))
+            assert polls == ['/get_status'] * 500
+            assert slow.result() == '/slow'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert any(message.startswith('Slow request: GET /slow 200') for message in caplog.messages)
+    assert any(message.startswith('GET /get_status 200') for message in caplog.messages)
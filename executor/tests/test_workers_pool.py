@@ -4,6 +4,9 @@ import time
 from bl.settings import Settings
 
 from bl.executor import WorkersPool, WarmupWorkersPool
+from bl.executor.worker import Worker
+from bl.executor.memory_guard import MemoryGuard
+from bl.executor.scheduler import Priority
 from bl.unittest_testcase import PjacUnitTestCase
 from mock import patch, Mock
 
@@ -137,3 +140,143 @@ class Tests(PjacUnitTestCase):
             self.assertEqual(pool.workers_count(), 2)
 
         self.assertEqual(pool.workers_count(), 0)
+
+    def test_reset_idle_workers(self):
+        with WorkersPool(count=1000) as pool:
+            self.assertEqual(pool.workers_count(), 1000)
+            for _ in range(10):
+                pool.push(Mock(run=lambda: time.sleep(10)))
+            pool.tasks.clear()
+
+            started = time.monotonic()
+            pool.reset()
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(pool.workers_count(), 0)
+
+            pool.set_threads(2)
+            self.assertEqual(pool.workers_count(), 2)
+            self.assertEqual(pool.get_metrics()['scale_down_latency']['count'], 1)
+
+    def test_scale_down_waits_for_running_tests(self):
+        with WorkersPool(count=4) as pool:
+            finished = []
+            for i in range(4):
+                pool.push(Mock(run=lambda: (time.sleep(0.5), finished.append(1))))
+            time.sleep(0.1)
+
+            pool.stop(bottom_count=2)
+            self.assertEqual(pool.workers_count(), 2)
+            self.assertGreaterEqual(len(finished), 2)
+            metrics = pool.get_metrics()
+            self.assertEqual(metrics['stopping'], 0)
+            self.assertGreater(metrics['scale_down_latency']['max'], 0.3)
+
+            pool.set_threads(3)
+            time.sleep(0.5)
+            self.assertEqual(pool.workers_count(), 3)
+
+    def test_stop_timeout(self):
+        with WorkersPool(count=1, stop_timeout=0.2) as pool:
+            release = threading.Event()
+            pool.push(Mock(run=release.wait))
+            time.sleep(0.1)
+
+            pool.reset()
+            self.assertEqual(pool.workers_count(), 1)
+            self.assertEqual(pool.get_metrics()['stop_timeouts'], 1)
+            release.set()
+
+    def test_memory_guard(self):
+        guard = MemoryGuard(soft_limit=100, hard_limit=200, interval=60)
+        with WorkersPool(count=2, memory_guard=guard) as pool:
+            guard.check(rss=150, available=0)
+            time.sleep(0.1)
+            tests = [Mock() for _ in range(4)]
+            for test in tests:
+                pool.push(test)
+            time.sleep(0.2)
+            self.assertEqual(pool.tasks.qsize(), 4)  # not dispatched over soft limit
+
+            guard.check(rss=250, available=0)
+            self.assertEqual(pool.tasks.qsize(), 0)
+            for test in tests:
+                test.cancel.assert_called_once()
+                test.run.assert_not_called()
+            late_test = Mock()
+            pool.push(late_test)
+            late_test.cancel.assert_called_once()
+            self.assertEqual(pool.get_metrics()['shed'], 5)
+
+            pool.stop(bottom_count=1)  # workers waiting for memory get stop sentinels
+            self.assertEqual(pool.workers_count(), 1)
+
+            guard.check(rss=50, available=0)
+            test = Mock()
+            pool.push(test)
+            time.sleep(0.2)
+            test.run.assert_called_once()
+
+    def test_scale_down_over_soft_limit(self):
+        guard = MemoryGuard(soft_limit=100, hard_limit=200, interval=60)
+        with WorkersPool(count=4, memory_guard=guard) as pool:
+            guard.check(rss=150, available=0)
+            tests = [Mock() for _ in range(4)]
+            for test in tests:
+                pool.push(test)
+            time.sleep(0.2)
+
+            pool.stop(bottom_count=3)  # all waiting workers are woken up, only one takes sentinel
+            time.sleep(0.2)
+            self.assertEqual(pool.workers_count(), 3)
+            self.assertEqual(pool.tasks.qsize(), 4)
+            for test in tests:
+                test.run.assert_not_called()
+
+            guard.check(rss=50, available=0)
+            time.sleep(0.2)
+            for test in tests:
+                test.run.assert_called_once()
+
+    def test_priority_scheduling(self):
+        with WorkersPool() as pool:
+            started = []
+            for index in range(3):
+                pool.push(Mock(testcase_id='TBB-1', run=lambda index=index: started.append('bulk-%d' % index)))
+            pool.push(Mock(testcase_id='TBB-2', run=lambda: started.append('other')))
+            pool.push(Mock(run=lambda: started.append('action')), priority=Priority.HIGH, tenant='client')
+            self.assertEqual(pool.get_metrics()['queue']['normal']['tenants'], 2)
+            pool.set_threads(1)
+            time.sleep(0.5)
+            self.assertEqual(started, ['action', 'bulk-0', 'other', 'bulk-1', 'bulk-2'])
+            self.assertEqual(pool.get_metrics()['queue']['high']['wait_time']['count'], 1)
+
+    def test_failed_worker_creation(self):
+        created = []
+
+        def create_worker(pool):
+            if created:
+                raise RuntimeError('cant start new thread')
+            created.append(Worker(pool))
+            return created[-1]
+
+        with WorkersPool(stop_timeout=5) as pool:
+            with patch('bl.executor.workers_pool.Worker', side_effect=create_worker):
+                with self.assertRaises(RuntimeError):
+                    pool.set_threads(2)
+            self.assertEqual(pool.workers_count(), 1)
+            pool.stop()
+            self.assertEqual(pool.workers_count(), 0)
+            created[0].thread.join(timeout=5)
+            self.assertTrue(created[0].finished())
+
+    def test_monitors_restarted_after_stop(self):
+        guard = MemoryGuard(soft_limit=100, interval=60)
+        with WorkersPool(count=1, memory_guard=guard) as pool:
+            pool.stop()
+            self.assertFalse(pool.cpu_monitor.running)
+            self.assertIsNone(guard._thread)
+
+            pool.set_threads(1)  # pool is used again, e.g. by next stress run
+            self.assertTrue(pool.cpu_monitor.running)
+            self.assertTrue(guard._thread.is_alive())
+        self.assertIsNone(guard._thread)
@@ -1,4 +1,7 @@
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing.pool import ThreadPool
 from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
 
@@ -20,6 +23,84 @@ class ServerWithIncreasedConnections(WSGIServer):
     request_queue_size = 100
 
 
+class ThreadPoolWSGIServer(ServerWithIncreasedConnections):
+    """
+    WSGI server which handles requests concurrently in bounded pool of threads, so slow request
+    (trace, report download) does not block status polls. When all threads are busy accepted
+    connections wait in listen queue
+    """
+    request_queue_size = 1024
+    threads = 256
+
+    def __init__(self, *args, **kwargs):
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='WebRequest')
+        self._slots = threading.BoundedSemaphore(self.threads)
+        super(ThreadPoolWSGIServer, self).__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self.executor.submit(self._process_request_thread, request, client_address)
+        except RuntimeError:  # executor is shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super(ThreadPoolWSGIServer, self).server_close()
+        self.executor.shutdown(wait=False)
+
+
+class TimingMiddleware:
+    """
+    WSGI middleware which logs method, path, status and duration of every request.
+    Duration includes streaming of response body
+    """
+    def __init__(self, application, slow_request=1.0):
+        self.application = application
+        self.slow_request = slow_request
+
+    def __call__(self, environ, start_response):
+        started = time.monotonic()
+        status = []
+
+        def timed_start_response(response_status, headers, exc_info=None):
+            status.append(response_status)
+            return start_response(response_status, headers, exc_info) if exc_info else start_response(response_status, headers)
+
+        try:
+            result = self.application(environ, timed_start_response)
+        except Exception:
+            self._log(environ, '500', started)
+            raise
+        return self._iterate(result, environ, status, started)
+
+    def _iterate(self, result, environ, status, started):
+        try:
+            for chunk in result:
+                yield chunk
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            self._log(environ, status[0].split(' ')[0] if status else '-', started)
+
+    def _log(self, environ, status, started):
+        duration = time.monotonic() - started
+        message = '%s %s %s %.1fms' % (environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'), status, duration * 1000)
+        if duration > self.slow_request:
+            log.warning('Slow request: %s' % message)
+        else:
+            log.info(message)
+
+
 class MyWSGIRequestHandler(WSGIRequestHandler):
 
     def log_message(self, format, *args):
@@ -78,7 +159,8 @@ class WebLoadGenerator(LoadGenerator):
                        render_template=templates.MakoTemplate,
                        ticket=ticket)
         main = WSGIApplication(middleware=[bootstrap_defaults(), path_routing_middleware_factory], options=options)
-        self.server = make_server('', port, main, server_class=ServerWithIncreasedConnections, handler_class=MyWSGIRequestHandler)
+        self.server = make_server('', port, TimingMiddleware(main),
+                                  server_class=ThreadPoolWSGIServer, handler_class=MyWSGIRequestHandler)
         host = helpers.local_ip_address(Settings.Sip_OutboundPstnProxy)
         self.address = 'http://%s:%s' % (host, self.server.server_port)
         self.start()
@@ -92,6 +174,7 @@ class WebLoadGenerator(LoadGenerator):
         self.thread_pool.apply_async(self.server.shutdown)
         self.thread_pool.close()
         self.thread_pool.join()
+        self.server.server_close()
         log.info('Pjac web ui stopped')
 
     def on_trace(self, request):
@@ -1,4 +1,3 @@
-import ctypes
 import threading
 
 from bl.log import getLogger
@@ -11,11 +10,17 @@ class Worker:
     Worker is wrapper around Thread. It is intended to run tests.
     """
     def __init__(self, workers):
-        self.stopped = False
+        self.stop_event = threading.Event()
+        self.cancelled = False  # worker got stop sentinel from pool
         self.workers_pool = workers
         self.thread = threading.Thread(target=self.thread_func, name=self._worker_name())
+        self.thread.daemon = True  # test which hangs after pool stop timeout should not block exit
         self.thread.start()
 
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
     def __str__(self):
         return 'Worker[%s]' % self.thread.ident
 
@@ -28,11 +33,16 @@ class Worker:
         holder = pycrashrpt.install_thread()
 
         self.thread.name = self._worker_name(self.thread.ident)
-        while not self.stopped:
+        while True:
             try:
-                if self.workers_pool.cpu_monitor.throttle():
+                if not self.stopped and self.workers_pool.cpu_monitor.overloaded():
+                    self.stop_event.wait(1)
                     continue
                 test = self.workers_pool.pop()
+                if test is None:
+                    log.info('Worker.thread_func: %s cancelled' % self.thread.ident)
+                    self.cancelled = True
+                    break
                 log.info('Worker.thread_func: got test %s' % test)
                 test.run()
 
@@ -47,14 +57,10 @@ class Worker:
         return not self.thread.is_alive()
 
     def stop(self):
-        self.stopped = True
-        result = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(self.thread.ident), ctypes.py_object(KeyboardInterrupt))
-        log.info('Worker.stop: raised KeyboardInterrupt exception in thread %d (%d threads affected)' % (self.thread.ident, result))
-        if result == 0:
-            log.warn('Worker.stop: invalid thread id')
-        elif result != 1:
-            log.warn('Worker.stop: invalid return value, resetting exception in thread %d' % self.thread.ident)
-            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(self.thread.ident), 0)
+        """
+        Ask worker to stop. Worker finishes its current test and exits on stop sentinel from pool
+        """
+        self.stop_event.set()
 
     def _worker_name(self, thread_id=None):
         return 'WorkerThread:%s' % thread_id if thread_id else 'unknown'
@@ -1,102 +1,189 @@
-import queue
 import threading
 import time
 import weakref
-from queue import Empty
 from threading import Lock
 
 from bl.assertions import Assert, PjacError
-from bl.executor import debugger
 from bl.executor.worker import Worker
 from bl.log import getLogger
 from bl.settings import Settings
-from bl.timer import Timer
-from bl.utils.ignore_exception import SuppressExceptions
 
 from .cpu_monitor import CPUMonitor
+from .histogram import Histogram
+from .memory_guard import MemoryGuard, MemoryState
+from .scheduler import FairShareQueue, Priority, parse_weights
 
 log = getLogger(__name__)
 
-
-class MyQueue(queue.Queue):
-    """
-    Enhanced version of queue.Queue which supports clear method
-    """
-    def clear(self):
-        with self.mutex:
-            self.queue.clear()
+_STOP = object()  # sentinel task, worker which pops it finishes
 
 
 class WorkersPool:
     """
-    Pool of workers which run tests
+    Pool of workers which run tests.
+    Workers are stopped cooperatively: pool puts stop sentinels in front of tasks queue and every worker
+    which pops sentinel finishes, so idle workers stop at once and busy ones stop after their current test.
+    Tests are not dispatched while memory_guard is over soft limit and shed while it is over hard limit.
+    Queued tests are scheduled by priority and shared fairly between tenants(testcase ids by default)
     """
-    def __init__(self, count=0):
-        self.tasks = MyQueue()
+    def __init__(self, count=0, report_pipeline=None, stop_timeout=None, memory_guard=None, attachment_processor=None):
+        self.tasks = FairShareQueue(weights=parse_weights(Settings.get('workers_tenant_weights', default='')))
+        self.report_pipeline = report_pipeline
+        self.attachment_processor = attachment_processor
+        self.stop_timeout = stop_timeout or Settings.get('workers_stop_timeout', with_type=float, default=60)
         self.workers = set()
         self.workers_lock = Lock()
-        self.set_threads(count)
+        self.workers_changed = threading.Condition(self.workers_lock)
+        self._stopping_count = 0  # sentinels queued or popped by workers which did not finish yet
+        self._queued_stop_count = 0  # sentinels which are still in queue
+        self._stop_timeouts_count = 0
+        self.scale_down_latency = Histogram()
+        self._shed_count = 0
         self.cpu_monitor = CPUMonitor()
+        self.memory_guard = memory_guard or MemoryGuard()
+        self.memory_guard.add_listener(self._on_memory_state)
+        self.set_threads(count)
 
-    def push(self, task):
-        self.tasks.put(task)
+    def push(self, task, priority=Priority.NORMAL, tenant=None):
+        """
+        Queue task. Tasks of higher priority are dispatched first, tasks of same priority are shared
+        between tenants according to their weights. Tenant is testcase id of task by default
+        """
+        if self.memory_guard.state == MemoryState.HARD:
+            self._shed([task])
+            return
+        self.tasks.push(task, priority=priority, tenant=tenant if tenant is not None else task.testcase_id)
 
     def pop(self):
-        # we need to poll, or KeyboardInterrupt will not be raised in time
+        """
+        Wait for next task. Return None if worker should finish
+        """
         while True:
-            with SuppressExceptions(Empty, verbose=False):
-                return self.tasks.get(timeout=1)
+            # workers waiting for memory are woken up to take stop sentinels
+            self.memory_guard.wait(interrupted=lambda: self._queued_stop_count > 0)
+            task = self.tasks.get()
+            if task is _STOP:
+                with self.workers_lock:
+                    self._queued_stop_count -= 1
+                return None
+            if self.memory_guard.state == MemoryState.OK:
+                return task
+            # memory is over limit: worker was woken up for sentinel taken by another worker
+            # or memory went over limit while worker was waiting for task
+            if self.memory_guard.state == MemoryState.HARD:
+                self._shed([task])
+            else:
+                self.tasks.put_behind(task, lambda item: item is _STOP)
 
     def set_threads(self, thread_count):
         with self.workers_lock:
-            total_count = len(self.workers)
+            total_count = len(self.workers) - self._stopping_count
             create_count = thread_count - total_count
 
         if create_count > 0:
+            # monitors are stopped when pool is stopped, pool could be used again
+            self.cpu_monitor.start()
+            self.memory_guard.start()
             log.info('WorkersPool.set_threads Starting new workers count %d(current_count=%d)' % (create_count, total_count))
-            new_workers = ([Worker(weakref.proxy(self)) for _ in range(create_count)])
-            with self.workers_lock:
-                self.workers.update(new_workers)
+            new_workers = []
+            try:
+                for _ in range(create_count):
+                    new_workers.append(Worker(weakref.proxy(self)))
+            finally:  # started workers are added even if creation of others failed, so they could be stopped
+                with self.workers_changed:
+                    self.workers.update(new_workers)
+                    self.workers_changed.notify_all()
         if create_count < 0:
             self.stop(bottom_count=thread_count)
 
-    def stop(self, bottom_count=0):
-        # debugger.log_all_stacks()
-        self.cpu_monitor.stop()
-        with debugger.check_interval(0):  # all threads should get KeyboardInterrupt without delay
-            timer = Timer(60)
-            try_timer = Timer(0)
-            iteration = 0
-            while not timer.fired():
-                workers_to_stop, total_workers = self._workers_to_stop(bottom_count)
-                if not workers_to_stop:
-                    return
-                if try_timer.fired():
-                    iteration += 1
-                    log.info('WorkersPool.stop stopping %s(current_count=%s) workers iteration %s ' % (len(workers_to_stop), total_workers, iteration))
-                    for worker in workers_to_stop:
-                        worker.stop()
-                    try_timer = Timer(20)
-                time.sleep(1)
-            log.warn('WorkersPool.stop cant stop %s(current_count=%s) workers' % (len(workers_to_stop), total_workers))
-
-    def _workers_to_stop(self, bottom_count):
+    def _on_memory_state(self, state):
+        if state == MemoryState.HARD:
+            self._shed(self.tasks.drain(lambda task: task is not _STOP))
+
+    def _shed(self, tasks):
+        if not tasks:
+            return
+        log.warning('WorkersPool: memory is over hard limit, shedding %d tests' % len(tasks), extra={'to_console': True})
         with self.workers_lock:
+            self._shed_count += len(tasks)
+        for task in tasks:
+            task.cancel('Test was shed: memory is over hard limit')
+
+    def stop(self, bottom_count=0):
+        self._stop_workers(bottom_count)
+        if not bottom_count:
+            self.cpu_monitor.stop()
+            self.memory_guard.stop()
+            self.flush_reports()
+
+    def _stop_workers(self, bottom_count):
+        """
+        Leave bottom_count workers. Waits up to stop_timeout for workers which run tests
+        """
+        started = time.monotonic()
+        with self.workers_changed:
             total_workers = len(self.workers)
-            workers_to_stop = list(self.workers.copy())[:total_workers - bottom_count]
-            return workers_to_stop, total_workers
+            stop_count = total_workers - self._stopping_count - bottom_count
+            if stop_count > 0:
+                log.info('WorkersPool.stop stopping %s(current_count=%s) workers' % (stop_count, total_workers))
+                self._stopping_count += stop_count
+                self._queued_stop_count += stop_count
+                self.tasks.put_front(_STOP, stop_count)
+                self.memory_guard.wake()  # workers waiting for memory should get sentinels
+            if not bottom_count:
+                for worker in self.workers:
+                    worker.stop()  # do not let throttled workers sleep
+            stopped = self.workers_changed.wait_for(lambda: len(self.workers) <= bottom_count, timeout=self.stop_timeout)
+            if not stopped:
+                self._stop_timeouts_count += 1
+            elif stop_count > 0:
+                self.scale_down_latency.record(time.monotonic() - started)
+            workers_left = len(self.workers)
+        if not stopped:
+            log.warning('WorkersPool.stop cant stop %s(current_count=%s) workers in %ss' % (workers_left - bottom_count,
+                                                                                          workers_left,
+                                                                                          self.stop_timeout))
+
+    def flush_reports(self):
+        """
+        Wait until reports of finished tests are written
+        """
+        if self.report_pipeline:
+            self.report_pipeline.flush()
+        if self.attachment_processor:  # reports written by pipeline could wait for their attachments
+            self.attachment_processor.flush()
 
     def reset(self):
-        log.info('WorkersPool.reset Test queue size is %d clearing' % self.tasks.qsize())
-        self.tasks.clear()
-        self.stop()
+        """
+        Drop queued tests and stop all workers. Pool could be used again after reset
+        """
+        count = self.tasks.clear(lambda task: task is not _STOP)
+        log.info('WorkersPool.reset Test queue size was %d cleared' % count)
+        self._stop_workers(bottom_count=0)
 
     def on_worker_finished(self, worker):
-        with self.workers_lock:
-            self.workers.remove(worker)
+        with self.workers_changed:
+            # new worker could get stop sentinel before set_threads added it,
+            # it is never added if creation of other workers failed
+            if not self.workers_changed.wait_for(lambda: worker in self.workers, timeout=self.stop_timeout):
+                log.warning('WorkersPool.on_worker_finished: %s was not added to pool' % worker)
+            self.workers.discard(worker)
+            if worker.cancelled:
+                self._stopping_count -= 1
             workers_left = len(self.workers)
+            self.workers_changed.notify_all()
         log.info('WorkersPool.on_worker_finished: %s finished left %s' % (worker, workers_left))
 
+    def get_metrics(self):
+        with self.workers_lock:
+            return dict(workers=len(self.workers),
+                        stopping=self._stopping_count,
+                        queue_depth=self.tasks.qsize(),
+                        queue=self.tasks.get_metrics(),
+                        shed=self._shed_count,
+                        scale_down_latency=self.scale_down_latency.summary(),
+                        stop_timeouts=self._stop_timeouts_count)
+
     def workers_count(self):
         with self.workers_lock:
             return len(self.workers)
@@ -113,7 +200,7 @@ class WarmupWorkersPool(WorkersPool):
     Pool of workers which support gradual warmup.
     It is necessary to avoid load spike on backend
     """
-    def __init__(self, count=0, warm_up_speed=None):
+    def __init__(self, count=0, warm_up_speed=None, report_pipeline=None, attachment_processor=None):
         self._threads_count_target = 0
 
         warm_up_speed = warm_up_speed or Settings.get('warmup_speed', with_type=int)
@@ -122,7 +209,8 @@ class WarmupWorkersPool(WorkersPool):
         self._warm_up_delay = 60 / float(warm_up_speed)
         self._cond = threading.Condition()
 
-        super(WarmupWorkersPool, self).__init__(count=count)
+        super(WarmupWorkersPool, self).__init__(count=count, report_pipeline=report_pipeline,
+                                                attachment_processor=attachment_processor)
 
         self._work_thread = threading.Thread(target=self._thread_func)
         self._work_thread.daemon = True